@@ -10,10 +10,12 @@ var score_label
 var distance_label
 var step_label
 
+# best statistics of all cars for the labels, each car keeps and reports its own (see Car.gd)
 var max_score : float = 0.0
 var max_distance : float = 0.0
 var max_steps : float = 0.0
 var endless_mode : bool = false
+var turbo : bool = false # see Server.gd, labels are not updated and cars step right away
 
 const pos_init : Vector2 = Vector2(630, 280)
 const rot_init : float = 0.0
@@ -44,12 +46,20 @@ func _process(_delta):
 func SetEndlessMode(mode):
 	endless_mode = mode
 
+func SetTurbo(mode):
+	turbo = mode
+	if (car_node):
+		for child in car_node.get_children():
+			child.SetTurbo(turbo)
+
 func ResetStatistics():
 	max_score = 0.0
 	max_distance = 0.0
 	max_steps = 0.0
 
 func UpdateLabels():
+	if turbo:
+		return
 	if (score_label):
 		score_label.text = str("%10.2f" % max_score)
 	if (distance_label):
@@ -72,12 +82,12 @@ func DeleteCar(uuid):
 				break
 
 func CreateCar(uuid, manual_control):
-	ResetStatistics()
 	var new_car = CAR.instance()
 	new_car.SetId(uuid)
 	new_car.transform = Transform2D(rot_init, pos_init)
 	new_car.scale = Vector2(scale, scale)
 	new_car.SetManualControl(manual_control)
+	new_car.SetTurbo(turbo and not manual_control)
 	return new_car
 
 func Sense(uuid):
@@ -90,7 +100,23 @@ func Reset(uuid):
 	if (car_node):
 		for child in car_node.get_children():
 			if child.GetId() == uuid:
-				child.Reset()
+				child.transform = Transform2D(rot_init, pos_init)
+				child.scale = Vector2(scale, scale)
+				child.ResetEpisode()
+
+func GetState(uuid):
+	if (car_node):
+		for child in car_node.get_children():
+			if child.GetId() == uuid:
+				if server_node:
+					server_node.StateResponse(uuid, child.GetState())
+
+func SetState(uuid, values):
+	if (car_node):
+		for child in car_node.get_children():
+			if child.GetId() == uuid:
+				child.SetState(values)
+				child.RestoreEpisode()
 
 func Step():
 	if (car_node):
@@ -98,6 +124,14 @@ func Step():
 			child.Step()
 	UpdateLabels()
 
+func StepCars(repeats):
+	# repeats: number of steps by uuid of the cars to step
+	if (car_node):
+		for child in car_node.get_children():
+			if repeats.has(child.GetId()):
+				child.Step(repeats[child.GetId()])
+	UpdateLabels()
+
 func Close(uuid):
 	DeleteCar(uuid)
 
@@ -116,17 +150,20 @@ func Control(uuid, throttle, brake, steering):
 			if child.GetId() == uuid:
 				child.Control(throttle, brake, steering)
 
-func SenseResponse(uuid, crash, sensor_0, sensor_1, sensor_2, sensor_3, sensor_4, velocity, yaw, pos_x, pos_y):
+func SenseResponse(uuid, score, crash, sensor_0, sensor_1, sensor_2, sensor_3, sensor_4, velocity, yaw, pos_x, pos_y):
 	if server_node:
 		var send_score : float
 		if endless_mode:
 			send_score = 0.0 # the score will be reported as 0, thus the Gym Environment will not cancel
 		else:
-			send_score = max_score
+			send_score = score
 		server_node.SenseResponse(uuid, send_score, crash, sensor_0, sensor_1, sensor_2, sensor_3, sensor_4, velocity, yaw, pos_x, pos_y)
 
-func UpdateStatistics(distance, steps):
-	if distance > max_distance or steps > max_steps:
+func Score(distance, steps):
+	return (weight_distance * distance) - (weight_steps * steps)
+
+func UpdateStatistics(score, distance, steps):
+	if score > max_score:
+		max_score = score
 		max_distance = distance
 		max_steps = steps
-	max_score = (weight_distance * max_distance) - (weight_steps * max_steps)
@@ -5,20 +5,80 @@ const UUID = preload("res://core/uuid.gd")
 const buffer_size : int = 1024
 const header_size : int = 6
 
+# binary protocol, see python/gym_godot_car/gym_godot_car/protocol.py
+const binary_version : int = 1
+const binary_magic : int = 0xB1 # text messages always start with "("
+const binary_command_control : int = 1
+const binary_command_sense : int = 2
+const binary_command_control_repeat : int = 3
+const binary_control_size : int = 12 # 3 x float32
+const binary_control_repeat_size : int = 14 # 3 x float32 + uint16
+const binary_sense_size : int = 41 # float32 + uint8 + 9 x float32
+
+# RESET keeps the connection and the car, and is answered with the first observation
+const reset_version : int = 1
+# CONTROL with a repeat count k steps the car k times and answers once
+const repeat_version : int = 1
+# GETSTATE answers with the state of the car, SETSTATE:<state> restores it and answers like RESET
+const state_version : int = 1
+const state_size : int = 19 # values of a state, in the order of Car.GetState
+
+# turbo mode (--turbo on the command line or the project setting simulation/turbo): nothing is rendered,
+# commands are handled as they arrive and cars are stepped right away instead of once per physics frame
+const turbo_setting : String = "simulation/turbo"
+# port to listen on, --port=N on the command line overrides the project setting (several servers per host)
+const port_setting : String = "simulation/port"
+const default_port : int = 42424
+const turbo_frame_budget_usec : int = 20000 # time spent polling the connections per frame
+
 var server
 var tcp_stream_dict : Dictionary
 var tcp_back_stream_dict : Dictionary
 var buffer_dict : Dictionary
 var msg_size_dict : Dictionary
-var control_counter : int = 0
+var binary_dict : Dictionary # true if the last CONTROL of a connection was a binary frame
+var binary_header_dict : Dictionary # [command, payload size] of a binary frame whose payload did not fully arrive yet
+var controlled_dict : Dictionary # connections that sent a CONTROL since the last step, with its repeat count
+var control_regex : RegEx
 
 var game_logic_node
+var turbo : bool = false
 
 # Called when the node enters the scene tree for the first time.
 func _ready():
 	server = TCP_Server.new()
-	server.listen(42424, "*")
+	var port : int = GetPort()
+	if server.listen(port, "*") != OK:
+		print("Could not listen on port " + String(port))
+	control_regex = RegEx.new()
+	control_regex.compile("(?:\\(CONTROL:)(?<throttle>[+-]?\\d*\\.?\\d*);(?<brake>[+-]?\\d*\\.?\\d*);(?<steering>[+-]?\\d*\\.?\\d*)(?:;(?<repeat>\\d+))?")
 	game_logic_node = get_node("/root/game/GameLogic")
+	SetTurbo(IsTurboRequested())
+
+func GetPort():
+	for argument in OS.get_cmdline_args():
+		if argument.begins_with("--port="):
+			return int(argument.trim_prefix("--port="))
+	if ProjectSettings.has_setting(port_setting):
+		return int(ProjectSettings.get_setting(port_setting))
+	return default_port
+
+func IsTurboRequested():
+	if "--turbo" in OS.get_cmdline_args():
+		return true
+	if ProjectSettings.has_setting(turbo_setting):
+		return bool(ProjectSettings.get_setting(turbo_setting))
+	return false
+
+func SetTurbo(mode):
+	turbo = mode
+	if turbo:
+		print("Turbo mode: rendering is off, cars are stepped as commands arrive")
+		VisualServer.render_loop_enabled = false
+		OS.vsync_enabled = false
+		Engine.target_fps = 0
+	if game_logic_node:
+		game_logic_node.SetTurbo(turbo)
 
 # Called every frame. 'delta' is the elapsed time since the previous frame.
 func _process(_delta):
@@ -31,18 +91,53 @@ func _process(_delta):
 			tcp_stream_dict[uuid] = tcp_stream
 			buffer_dict[uuid] = PoolByteArray()
 			msg_size_dict[uuid] = int(0)
+			binary_dict[uuid] = false
+	DropClosedConnections()
 	if tcp_stream_dict.size() > 0:
+		if turbo:
+			ProcessTurbo()
+		else:
+			CollectData()
+			ParseData()
+
+func DropClosedConnections():
+	# clients that crashed or were killed never send (CLOSE), their cars would hold up the lockstep forever;
+	# get_status notices a connection closed by the peer once everything it sent was read
+	for key in tcp_stream_dict.keys():
+		if tcp_stream_dict[key].get_status() != StreamPeerTCP.STATUS_CONNECTED:
+			print("Connection " + String(key) + " was closed without (CLOSE)")
+			CloseCommand(key)
+
+func ProcessTurbo():
+	# the cars answer within the call, so the next command of a client usually arrives before the budget is used up
+	var deadline : int = OS.get_ticks_usec() + turbo_frame_budget_usec
+	while tcp_stream_dict.size() > 0 and OS.get_ticks_usec() < deadline:
 		CollectData()
 		ParseData()
+		if server.is_connection_available():
+			break # accept it in the next frame
 
 func CollectData():	
 	for key in tcp_stream_dict:
+		if binary_header_dict.has(key):
+			CollectBinaryData(key)
+			continue
 		if tcp_stream_dict[key].get_available_bytes() >= header_size:
 			# first get the header of the message, to see how many bytes we need to read (depends on the command)
 			var body_size : int = 0
-			var header_data = tcp_stream_dict[key].get_data(header_size)
-			if not header_data[1].get_string_from_utf8() == "(HEAD:":
-				print("Invalid Header Data at key = " + String(key) + ". Expected (HEAD:, got: " + header_data[1].get_string_from_utf8())
+			var first_byte : int = tcp_stream_dict[key].get_u8()
+			if first_byte == binary_magic:
+				# frame header is magic, command (uint8) and payload size (uint16), little endian; at least
+				# header_size bytes are there, so the rest of the header can be read without blocking
+				var command : int = tcp_stream_dict[key].get_u8()
+				var payload_size : int = tcp_stream_dict[key].get_u16()
+				binary_header_dict[key] = [command, payload_size]
+				CollectBinaryData(key)
+				continue
+			var header_data = tcp_stream_dict[key].get_data(header_size - 1)
+			var header_string : String = char(first_byte) + header_data[1].get_string_from_utf8()
+			if not header_string == "(HEAD:":
+				print("Invalid Header Data at key = " + String(key) + ". Expected (HEAD:, got: " + header_string)
 				CloseConnection(key)
 			else:
 				var next_char = ""
@@ -78,6 +173,29 @@ func CollectData():
 					expected_data -= data.size()
 				#print("BODY received")
 
+func CollectBinaryData(key):
+	# the header was read already, the payload is read once it arrived completely (the get_* calls block)
+	var command : int = binary_header_dict[key][0]
+	var payload_size : int = binary_header_dict[key][1]
+	if tcp_stream_dict[key].get_available_bytes() < payload_size:
+		return
+	binary_header_dict.erase(key)
+	if command == binary_command_control and payload_size == binary_control_size:
+		var throttle : float = tcp_stream_dict[key].get_float()
+		var brake : float = tcp_stream_dict[key].get_float()
+		var steering : float = tcp_stream_dict[key].get_float()
+		binary_dict[key] = true
+		ControlCommand(key, throttle, brake, steering)
+	elif command == binary_command_control_repeat and payload_size == binary_control_repeat_size:
+		var throttle : float = tcp_stream_dict[key].get_float()
+		var brake : float = tcp_stream_dict[key].get_float()
+		var steering : float = tcp_stream_dict[key].get_float()
+		var repeat : int = tcp_stream_dict[key].get_u16()
+		binary_dict[key] = true
+		ControlCommand(key, throttle, brake, steering, repeat)
+	elif payload_size > 0:
+		tcp_stream_dict[key].get_data(payload_size) # skip unknown commands
+
 func ParseData():
 	for key in buffer_dict:
 		if not buffer_dict[key].empty():
@@ -94,6 +212,8 @@ func ParseData():
 					SenseCommand(key)
 				"(CLOSE)":
 					CloseCommand(key)
+				"(GETSTATE)":
+					GetStateCommand(key)
 				var command_with_args:
 					HandleCommandWithArguments(key, command_with_args)
 
@@ -102,6 +222,10 @@ func CloseConnection(key):
 	tcp_stream_dict.erase(key)
 	buffer_dict.erase(key)
 	msg_size_dict.erase(key)
+	binary_dict.erase(key)
+	binary_header_dict.erase(key)
+	controlled_dict.erase(key)
+	StepIfAllControlled()
 
 func RegisterCommand(key):
 	if game_logic_node:
@@ -121,32 +245,92 @@ func CloseCommand(key):
 	if game_logic_node:
 		game_logic_node.Close(key)
 
+func GetStateCommand(key):
+	if game_logic_node:
+		game_logic_node.GetState(key)
+
 func HandleCommandWithArguments(key, command):
 	if HandleControlCommand(key, command):
 		return
+	if HandleSetStateCommand(key, command):
+		return
+
+func HandleSetStateCommand(key, command):
+	if not command.begins_with("(SETSTATE:") or not command.ends_with(")"):
+		return false
+	var fields = command.substr(len("(SETSTATE:"), len(command) - len("(SETSTATE:") - 1).split(";")
+	if fields.size() != state_size:
+		return false
+	var values : Array = []
+	for idx in range(state_size - 1):
+		values.append(float(fields[idx]))
+	values.append(fields[state_size - 1] == "True") # crash
+	if game_logic_node:
+		game_logic_node.SetState(key, values)
+	return true
 
 func HandleControlCommand(key, command):
-	var regex = RegEx.new()
-	regex.compile("(?:\\(CONTROL:)(?<throttle>[+-]?\\d*\\.?\\d*);(?<brake>[+-]?\\d*\\.?\\d*);(?<steering>[+-]?\\d*\\.?\\d*)")
-	var result = regex.search(command)
+	var result = control_regex.search(command)
 	if result:
 		if not result.get_string("throttle").empty() and not result.get_string("brake").empty() and not result.get_string("steering").empty():
 			var throttle : float = float(result.get_string("throttle"))
 			var brake : float = float(result.get_string("brake"))
 			var steering : float = float(result.get_string("steering"))
-			if game_logic_node:
-				game_logic_node.Control(key, throttle, brake, steering)
-			control_counter += 1
-			if control_counter >= tcp_stream_dict.size():
-				if game_logic_node:
-					game_logic_node.Step()
+			var repeat : int = 1
+			if not result.get_string("repeat").empty():
+				repeat = int(result.get_string("repeat"))
+			binary_dict[key] = false
+			ControlCommand(key, throttle, brake, steering, repeat)
 			return true
 	return false
 
+func ControlCommand(key, throttle, brake, steering, repeat = 1):
+	if game_logic_node:
+		game_logic_node.Control(key, throttle, brake, steering)
+	controlled_dict[key] = repeat
+	StepIfAllControlled()
+
+func StepIfAllControlled():
+	# lockstep: all cars are stepped together once every connection sent its CONTROL (each car for the
+	# repeat count of its CONTROL), in the next physics frame or in turbo mode right away
+	if controlled_dict.size() > 0 and controlled_dict.size() >= tcp_stream_dict.size():
+		var repeats : Dictionary = controlled_dict
+		controlled_dict = {}
+		if game_logic_node:
+			game_logic_node.StepCars(repeats)
+
 func SenseResponse(uuid, max_score, crash, sensor_0, sensor_1, sensor_2, sensor_3, sensor_4, velocity, yaw, pos_x, pos_y):
 	if tcp_stream_dict[uuid]:
 		if tcp_stream_dict[uuid].is_connected_to_host():
-			var response : String = String(max_score) + ";" + String(crash) + ";" + String(sensor_0) + ";" + String(sensor_1) + ";" + String(sensor_2) + ";" + String(sensor_3) + ";" + String(sensor_4) + ";" + String(velocity) + ";" + String(yaw) + ";" + String(pos_x) + ";" + String(pos_y)
+			var retval
+			if binary_dict.get(uuid, false):
+				retval = tcp_stream_dict[uuid].put_partial_data(BinarySenseResponse(max_score, crash, [sensor_0, sensor_1, sensor_2, sensor_3, sensor_4, velocity, yaw, pos_x, pos_y]))
+			else:
+				var response : String = String(max_score) + ";" + String(crash) + ";" + String(sensor_0) + ";" + String(sensor_1) + ";" + String(sensor_2) + ";" + String(sensor_3) + ";" + String(sensor_4) + ";" + String(velocity) + ";" + String(yaw) + ";" + String(pos_x) + ";" + String(pos_y) + "\n"
+				retval = tcp_stream_dict[uuid].put_partial_data(response.to_ascii())
+			if retval[0]:
+				print(String(uuid) + "Error: " + String(retval[0]))
+				print(String(uuid) + "Data: " + String(retval[1]))
+
+func BinarySenseResponse(max_score, crash, observation):
+	var buffer = StreamPeerBuffer.new()
+	buffer.put_u8(binary_magic)
+	buffer.put_u8(binary_command_sense)
+	buffer.put_u16(binary_sense_size)
+	buffer.put_float(max_score)
+	buffer.put_u8(1 if crash else 0)
+	for value in observation:
+		buffer.put_float(value)
+	return buffer.data_array
+
+func StateResponse(uuid, values):
+	if tcp_stream_dict[uuid]:
+		if tcp_stream_dict[uuid].is_connected_to_host():
+			var fields : PoolStringArray = PoolStringArray()
+			for idx in range(values.size() - 1):
+				fields.append("%.9f" % values[idx]) # String(float) rounds to 6 digits, too coarse to continue an episode
+			fields.append(String(values[values.size() - 1]))
+			var response : String = fields.join(";") + "\n"
 			var retval = tcp_stream_dict[uuid].put_partial_data(response.to_ascii())
 			if retval[0]:
 				print(String(uuid) + "Error: " + String(retval[0]))
@@ -155,7 +339,7 @@ func SenseResponse(uuid, max_score, crash, sensor_0, sensor_1, sensor_2, sensor_
 func RegisterResponse(uuid):
 	if tcp_stream_dict[uuid]:
 		if tcp_stream_dict[uuid].is_connected_to_host():
-			var response : String = String(uuid)
+			var response : String = String(uuid) + ";BINARY:" + String(binary_version) + ";RESET:" + String(reset_version) + ";REPEAT:" + String(repeat_version) + ";STATE:" + String(state_version) + "\n"
 			var retval = tcp_stream_dict[uuid].put_partial_data(response.to_ascii())
 			if retval[0]:
 				print(String(uuid) + "Error: " + String(retval[0]))
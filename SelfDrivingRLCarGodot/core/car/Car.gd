@@ -68,12 +68,20 @@ var delta_step : float = step_size
 var id : String
 var manual_control : bool = false
 var received_step_command : bool = false
+var repeat_steps : int = 1 # steps to integrate for the received step command
+var received_reset_command : bool = false
+var turbo : bool = false # step and answer right away, without UI updates and drawing (see Server.gd)
 var game_logic_node
 var action_ui_node
 var observation_ui_node
 var crash : bool = false
 var last_position : Vector2 = Vector2(0.0, 0.0)
 
+# Statistics of the episode, max_score is sent with every SENSE reply of this car
+var max_score : float = 0.0
+var max_distance : float = 0.0
+var max_steps : float = 0.0
+
 
 ################################################################################
 ### Signals
@@ -90,17 +98,31 @@ func _ready():
 func _physics_process(delta):
 	if manual_control or received_step_command:
 		received_step_command = false
-		if not crash:
-			GetAndCalcInput(delta)
-			CalcDrivingForces()
-			CalcKinematicModel()
-			UpdateNodes()
-			CalcStatistics()
+		Simulate(delta)
+		self.update()
+	elif received_reset_command:
+		# answer the reset with the first observation, without stepping
+		received_reset_command = false
 		CalcSensors()
 		SenseReponse()
-		ReportStatistics()
 		self.update()
 
+func Simulate(delta):
+	# all repeated steps are integrated at once, a crash ends them early
+	var steps : int = 1 if manual_control else repeat_steps
+	repeat_steps = 1
+	for _step in range(steps):
+		if crash:
+			break
+		GetAndCalcInput(delta)
+		CalcDrivingForces()
+		CalcKinematicModel()
+		UpdateNodes()
+		CalcStatistics()
+	CalcSensors()
+	ReportStatistics() # before the reply, which carries the score of this step
+	SenseReponse()
+
 func WrapAngle(angle):
 	if angle >= 0:
 		return (fmod(angle+PI,2*PI) - PI)
@@ -116,10 +138,14 @@ func CalcStatistics():
 	distance_counter += delta_movement.length()
 	last_position = position
 
-func Step():
+func Step(repeat = 1):
 	#if step_counter%10 == 0:
 	#	print("   Got Step command " + str(step_counter))
-	received_step_command = true
+	repeat_steps = max(1, repeat)
+	if turbo:
+		Simulate(step_size)
+	else:
+		received_step_command = true
 
 func GetAndCalcInput(delta):
 	if (manual_control):
@@ -128,9 +154,10 @@ func GetAndCalcInput(delta):
 	else:
 		delta_step = step_size
 		GetExternalInput()
-	action_ui_node.RotateWheel(steering)
-	action_ui_node.SetThrottle(throttle)
-	action_ui_node.SetBrake(brake)
+	if not turbo:
+		action_ui_node.RotateWheel(steering)
+		action_ui_node.SetThrottle(throttle)
+		action_ui_node.SetBrake(brake)
 
 func GetAndCalcUserInput():
 	# Determine Inputs from User
@@ -231,6 +258,49 @@ func Reset():
 	distance_counter = 0.0
 	received_step_command = false
 	last_position = position
+	ResetStatistics()
+
+func ResetEpisode():
+	# the caller restores position and rotation before
+	Reset()
+	RestoreEpisode()
+
+# order of the values of a state, see python/gym_godot_car/gym_godot_car/sim/car.py (CarState)
+func GetState():
+	return [position.x, position.y, rotation, psi, velocity_longitudinal, x_dot, y_dot,
+			throttle, brake, steering, throttle_external, brake_external, steering_external, force_drive,
+			step_counter, distance_counter, last_position.x, last_position.y, crash]
+
+func SetState(values):
+	position = Vector2(values[0], values[1])
+	rotation = values[2]
+	psi = values[3]
+	velocity_longitudinal = values[4]
+	x_dot = values[5]
+	y_dot = values[6]
+	throttle = values[7]
+	brake = values[8]
+	steering = values[9]
+	throttle_external = values[10]
+	brake_external = values[11]
+	steering_external = values[12]
+	force_drive = values[13]
+	step_counter = values[14]
+	distance_counter = values[15]
+	last_position = Vector2(values[16], values[17])
+	crash = values[18]
+	received_step_command = false
+	# the score continues from the restored counters, not from the maximum so far
+	ResetStatistics()
+	ReportStatistics()
+
+func RestoreEpisode():
+	# answered like ResetEpisode, with the observation of the restored state
+	if turbo:
+		CalcSensors()
+		SenseReponse()
+	else:
+		received_reset_command = true
 
 func GetId():
 	return id
@@ -238,6 +308,9 @@ func GetId():
 func SetManualControl(val):
 	manual_control = val
 
+func SetTurbo(val):
+	turbo = val
+
 func GetManualControl():
 	return manual_control
 
@@ -250,13 +323,23 @@ func Sense():
 	SenseReponse()
 
 func SenseReponse():
-	observation_ui_node.SetPsi(psi)
-	observation_ui_node.SetDistance(sensor_readings[0], sensor_readings[1], sensor_readings[2], sensor_readings[3], sensor_readings[4])
-	observation_ui_node.SetVelocity(velocity_longitudinal)
+	if not turbo:
+		observation_ui_node.SetPsi(psi)
+		observation_ui_node.SetDistance(sensor_readings[0], sensor_readings[1], sensor_readings[2], sensor_readings[3], sensor_readings[4])
+		observation_ui_node.SetVelocity(velocity_longitudinal)
 	if not manual_control:
 		if game_logic_node:
-			game_logic_node.SenseResponse(id, crash, sensor_readings[0], sensor_readings[1], sensor_readings[2], sensor_readings[3], sensor_readings[4], velocity_longitudinal, psi, position.x, position.y)
+			game_logic_node.SenseResponse(id, max_score, crash, sensor_readings[0], sensor_readings[1], sensor_readings[2], sensor_readings[3], sensor_readings[4], velocity_longitudinal, psi, position.x, position.y)
+
+func ResetStatistics():
+	max_score = 0.0
+	max_distance = 0.0
+	max_steps = 0.0
 
 func ReportStatistics():
+	if distance_counter > max_distance or step_counter > max_steps:
+		max_distance = distance_counter
+		max_steps = step_counter
 	if game_logic_node:
-		game_logic_node.UpdateStatistics(distance_counter,step_counter)
+		max_score = game_logic_node.Score(max_distance, max_steps)
+		game_logic_node.UpdateStatistics(max_score, max_distance, max_steps)
@@ -0,0 +1,225 @@
+"""
+Benchmarks for stepping the simulation over the TCP protocol of core/Server.gd.
+
+By default the Python stand-in server (gym_godot_car.server) is started in a
+subprocess, with --no-server the benchmarks run against a server that is already
+listening (e.g. Godot). Results are written as JSON and can be compared to a
+stored baseline, regressions beyond the threshold make the run fail:
+
+    $ python -m gym_godot_car.benchmark --output baseline.json
+    $ python -m gym_godot_car.benchmark --output current.json --baseline baseline.json
+"""
+
+import argparse
+import datetime
+import functools
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+default_config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config-feedforward')
+scenarios = ['step_latency', 'reset', 'throughput', 'neat_generation']
+
+
+def Percentiles(durations):
+    """Summary of a list of durations in seconds, in microseconds."""
+    durations = np.asarray(durations) * 1e6
+    return {'p50_us': float(np.percentile(durations, 50)),
+            'p95_us': float(np.percentile(durations, 95)),
+            'p99_us': float(np.percentile(durations, 99)),
+            'mean_us': float(durations.mean()),
+            'samples': int(durations.size)}
+
+
+def StartServer(ip, port, timeout=10.0):
+    """Start the stand-in server in a subprocess and wait until it accepts connections."""
+    process = subprocess.Popen([sys.executable, '-m', 'gym_godot_car.server', '--ip', ip, '--port', str(port)])
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((ip, port), timeout=0.1).close()
+            return process
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("Stand-in server did not start on {}:{}".format(ip, port))
+            time.sleep(0.05)
+
+
+def BenchmarkStepLatency(ip, port, steps, protocol, warmup=100):
+    from gym_godot_car.envs import GodotCarEnv
+    env = GodotCarEnv(protocol=protocol, ip=ip, port=port)
+    rng = np.random.RandomState(0)
+    actions = rng.uniform(env.action_space.low, env.action_space.high, (warmup + steps, 3))
+    durations = np.empty(warmup + steps)
+    env.reset()
+    for idx in range(warmup + steps):
+        start = time.perf_counter()
+        _, _, done, _ = env.step(actions[idx])
+        durations[idx] = time.perf_counter() - start
+        if done:
+            env.reset()
+    env.close()
+    return Percentiles(durations[warmup:])
+
+
+def BenchmarkReset(ip, port, resets, reset_mode):
+    from gym_godot_car.envs import GodotCarEnv
+    env = GodotCarEnv(reset_mode=reset_mode, ip=ip, port=port)
+    env.reset()
+    durations = np.empty(resets)
+    for idx in range(resets):
+        env.step([1.0, 0.0, 0.0])
+        start = time.perf_counter()
+        env.reset()
+        durations[idx] = time.perf_counter() - start
+    env.close()
+    return Percentiles(durations)
+
+
+def BenchmarkThroughput(ip, port, steps, num_clients):
+    """Steps per second summed over num_clients cars driven concurrently from one event loop."""
+    from gym_godot_car.envs import MultiCarGodotEnv
+    env = MultiCarGodotEnv(num_clients, ip=ip, port=port)
+    rng = np.random.RandomState(0)
+    actions = rng.uniform(env.single_action_space.low, env.single_action_space.high, (steps, num_clients, 3))
+    env.reset()
+    start = time.perf_counter()
+    for idx in range(steps):
+        env.step(actions[idx])
+    duration = time.perf_counter() - start
+    env.close()
+    return {'steps_per_s': steps * num_clients / duration, 'clients': num_clients}
+
+
+def _MakeEnv(ip, port, worker_index):
+    from gym_godot_car.envs import GodotCarEnv
+    return GodotCarEnv(ip=ip, port=port)
+
+
+def _EvalGenome(genome, config, env):
+    from gym_godot_car.network import MatrixNetwork
+    net = MatrixNetwork.create(genome, config)
+    observation = env.reset()
+    fitness = 0.0
+    while True:
+        observation, reward, done, _ = env.step(net.activate(observation))
+        if done:
+            return fitness
+        fitness += reward
+
+
+def BenchmarkNeatGeneration(ip, port, config_path, num_workers):
+    """Duration of evaluating the first generation of config-feedforward (fixed seed)."""
+    import neat
+    from gym_godot_car.evaluation import ParallelEnvEvaluator
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         config_path)
+    random.seed(0)
+    population = neat.Population(config)
+    genomes = list(population.population.items())
+    with ParallelEnvEvaluator(num_workers, _EvalGenome, functools.partial(_MakeEnv, ip, port)) as evaluator:
+        start = time.perf_counter()
+        evaluator.evaluate(genomes, config)
+        duration = time.perf_counter() - start
+    return {'generation_s': duration, 'genomes': len(genomes), 'workers': num_workers,
+            'best_fitness': max(genome.fitness for _, genome in genomes)}
+
+
+def RunBenchmarks(ip, port, selected, steps=2000, resets=200, clients=(1, 2, 4, 8), num_workers=1,
+                  config_path=default_config_path):
+    results = {}
+    if 'step_latency' in selected:
+        for protocol in ['text', 'binary']:
+            results['step_latency.' + protocol] = BenchmarkStepLatency(ip, port, steps, protocol)
+    if 'reset' in selected:
+        for reset_mode in ['auto', 'reconnect']:
+            results['reset.' + reset_mode] = BenchmarkReset(ip, port, resets, reset_mode)
+    if 'throughput' in selected:
+        for num_clients in clients:
+            results['throughput.{:d}'.format(num_clients)] = BenchmarkThroughput(ip, port, max(1, steps // num_clients), num_clients)
+    if 'neat_generation' in selected:
+        results['neat_generation'] = BenchmarkNeatGeneration(ip, port, config_path, num_workers)
+    return results
+
+
+def LowerIsBetter(metric):
+    return metric.endswith('_us') or metric.endswith('_s') and not metric.endswith('_per_s')
+
+
+def CompareResults(current, baseline, threshold):
+    """List of (name, metric, baseline value, current value, relative change, regression) for all timing metrics in both runs."""
+    comparison = []
+    for name, metrics in current['results'].items():
+        for metric, value in metrics.items():
+            if not (metric.endswith('_us') or metric.endswith('_s')):
+                continue
+            reference = baseline.get('results', {}).get(name, {}).get(metric)
+            if not reference:
+                continue
+            change = (value - reference) / reference
+            regression = change > threshold if LowerIsBetter(metric) else change < -threshold
+            comparison.append((name, metric, reference, value, change, regression))
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ip', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=42424)
+    parser.add_argument('--no-server', action='store_true', help="use the server already listening on ip:port")
+    parser.add_argument('--scenarios', nargs='+', choices=scenarios, default=scenarios)
+    parser.add_argument('--steps', type=int, default=2000)
+    parser.add_argument('--resets', type=int, default=200)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="evaluation workers of the NEAT generation")
+    parser.add_argument('--config', default=default_config_path)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative change that counts as regression")
+    args = parser.parse_args()
+
+    server = None if args.no_server else StartServer(args.ip, args.port)
+    try:
+        results = RunBenchmarks(args.ip, args.port, args.scenarios, args.steps, args.resets, args.clients,
+                                args.workers, args.config)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    run = {'meta': {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'cpus': os.cpu_count(),
+                    'server': 'external' if args.no_server else 'python'},
+           'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+
+    for name, metrics in results.items():
+        print("{:24s} ".format(name) + "  ".join("{}={}".format(metric, value if isinstance(value, int) else round(value, 1))
+                                                 for metric, value in metrics.items()))
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = 0
+        print("\ncompared to {}:".format(args.baseline))
+        for name, metric, reference, value, change, regression in CompareResults(run, baseline, args.threshold):
+            regressions += regression
+            print("{:24s} {:12s} {:12.1f} -> {:12.1f} {:+7.1%}{}".format(name, metric, reference, value, change,
+                                                                      "  REGRESSION" if regression else ""))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Memoization of the fitness of NEAT genomes.
+
+With a seeded env and a deterministic eval function a genome gets the same fitness
+every time it is evaluated. Elites and offspring whose mutations only touched parts
+that do not reach an output are simulated again each generation anyway. FitnessCache
+keys the fitness by a hash of the network the genome encodes (see GenomeKey) and
+keeps the most recently used entries:
+
+    cache = FitnessCache(path='neat-fitness-cache')  # loaded if the file exists
+    population.add_reporter(cache)                   # saved at the end of generations, like neat.Checkpointer
+    with ParallelEnvEvaluator(4, eval_genome, make_env, cache=cache) as evaluator:
+        winner = population.run(evaluator.evaluate)
+"""
+
+import collections
+import hashlib
+import os
+import pickle
+
+from neat.graphs import required_for_output
+from neat.reporting import BaseReporter
+
+
+def GenomeKey(genome, config, salt=''):
+    """Hash of the enabled connections, weights, biases and responses of the nodes that reach an output.
+
+    salt: anything else the fitness depends on (e.g. the number of episodes per genome) as string.
+    Disabled connections and nodes that do not reach an output do not change it.
+    """
+    genome_config = config.genome_config
+    inputs = genome_config.input_keys
+    outputs = genome_config.output_keys
+    connections = sorted(cg.key for cg in genome.connections.values() if cg.enabled)
+    required = required_for_output(inputs, outputs, connections)
+    parts = [salt, tuple(inputs), tuple(outputs)]
+    for node in sorted(required):
+        gene = genome.nodes[node]
+        parts.append((node, float(gene.bias).hex(), float(gene.response).hex(), gene.activation, gene.aggregation))
+    for key in connections:
+        if key[1] in required:
+            parts.append((key, float(genome.connections[key].weight).hex()))
+    return hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=16).hexdigest()
+
+
+class FitnessCache(BaseReporter):
+    """LRU cache of at most max_entries fitnesses by GenomeKey, with hit and miss counters.
+
+    path: file the cache is loaded from (if it exists) and saved to at the end of every
+    save_interval-th generation when added as reporter to the population.
+    salt: see GenomeKey, entries of a different salt never match.
+    """
+    def __init__(self, max_entries=100000, path=None, save_interval=1, salt=''):
+        self.max_entries = max_entries
+        self.path = path
+        self.save_interval = save_interval
+        self.salt = salt
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._generation = 0
+        if path and os.path.exists(path):
+            self.load(path)
+
+    # neat checkpoints pickle all reporters (through the species set), the entries are saved to path instead
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_entries'] = collections.OrderedDict()
+        return state
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def Key(self, genome, config):
+        return GenomeKey(genome, config, self.salt)
+
+    def Get(self, key):
+        """Cached fitness of key or None, counts as hit or miss."""
+        fitness = self._entries.get(key)
+        if fitness is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return fitness
+
+    def Put(self, key, fitness):
+        self._entries[key] = fitness
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def GetStatistics(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'hit_rate': self.hit_rate}
+
+    def save(self, path=None):
+        """Write the entries (least recently used first), the file is replaced atomically."""
+        path = path or self.path
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump({'salt': self.salt, 'entries': list(self._entries.items())}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    def load(self, path):
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        if data['salt'] == self.salt:
+            for key, fitness in data['entries']:
+                self.Put(key, fitness)
+
+    def post_evaluate(self, config, population, species, best_genome):
+        print("Fitness cache: {:d} entries, {:d} hits, {:d} misses ({:.1%} of the evaluations skipped)".format(
+            len(self._entries), self.hits, self.misses, self.hit_rate))
+
+    def end_generation(self, config, population, species_set):
+        self._generation += 1
+        if self.path and self._generation % self.save_interval == 0:
+            self.save()
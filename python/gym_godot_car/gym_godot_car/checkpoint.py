@@ -0,0 +1,402 @@
+"""
+Incremental checkpoints of NEAT runs.
+
+neat.Checkpointer pickles the whole population, the species set (with all its reporters)
+and the random state into one gzip file, which stalls large runs for a noticeable time.
+IncrementalCheckpointer saves every generation as one record appended to a segment file:
+the genes of the genomes that are new since the last generation packed into arrays (keys,
+weights, biases, ...), the fitness and species membership of all genomes, and the random
+state. Every snapshot_interval generations a new segment starts with a full snapshot.
+end_generation only collects references, packing and writing run on a background thread:
+
+    checkpointer = IncrementalCheckpointer('neat-checkpoint', snapshot_interval=50)
+    population.add_reporter(checkpointer)
+    ...
+    population = checkpointer.Restore(config)                               # latest generation
+    population = RestoreCheckpoint(config, 'neat-checkpoint', generation=17)
+
+The restored population runs that generation next and continues exactly like the original
+run (given a deterministic fitness function). The config is not saved, restore with the
+config of the run. Reporters are not saved either, add them to the restored population.
+"""
+
+import atexit
+import itertools
+import os
+import pickle
+import queue
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+from neat.attributes import BoolAttribute, FloatAttribute
+from neat.population import Population
+from neat.reporting import BaseReporter, ReporterSet
+from neat.species import Species
+
+record_magic = b'GCCK'
+record_header = struct.Struct('<4sBBxxIQ') # magic, kind, compressed, generation, payload length
+kind_snapshot = 0
+kind_delta = 1
+segment_pattern = re.compile(r'^segment-(\d+)\.ckpt$')
+
+
+def _Columns(gene_type):
+    return [(attribute.name, type(attribute)) for attribute in gene_type._gene_attributes]
+
+
+def PackGenomes(genomes, genome_config):
+    """Genes of genomes as dict of arrays: per gene kind the number of genes of each genome, their keys and
+    one array per gene attribute (float64, bool, or codes into a table for strings)."""
+    packed = {'keys': np.fromiter((genome.key for genome in genomes), np.int64, len(genomes))}
+    for kind, gene_type, width in (('nodes', genome_config.node_gene_type, 1),
+                                   ('connections', genome_config.connection_gene_type, 2)):
+        gene_dicts = [getattr(genome, kind) for genome in genomes]
+        packed[kind + '.counts'] = np.fromiter((len(genes) for genes in gene_dicts), np.int32, len(gene_dicts))
+        keys = [key for genes in gene_dicts for key in genes]
+        packed[kind + '.keys'] = np.array(keys, dtype=np.int32).reshape(len(keys), width)
+        genes = [gene for gene_dict in gene_dicts for gene in gene_dict.values()]
+        for name, attribute_type in _Columns(gene_type):
+            values = [getattr(gene, name) for gene in genes]
+            if attribute_type is FloatAttribute:
+                packed[kind + '.' + name] = np.array(values, dtype=np.float64)
+            elif attribute_type is BoolAttribute:
+                packed[kind + '.' + name] = np.array(values, dtype=bool)
+            else:
+                table = sorted(set(values))
+                index = {value: code for code, value in enumerate(table)}
+                packed[kind + '.' + name] = np.array([index[value] for value in values], dtype=np.int32)
+                packed[kind + '.' + name + '.table'] = table
+    return packed
+
+
+def UnpackGenomes(packed, config, keys=None):
+    """Genomes of PackGenomes by key, only those in keys if given."""
+    genome_config = config.genome_config
+    selected = np.ones(len(packed['keys']), dtype=bool) if keys is None else np.isin(packed['keys'], list(keys))
+    genomes = [config.genome_type(key) for key in packed['keys'][selected].tolist()]
+    for kind, gene_type in (('nodes', genome_config.node_gene_type), ('connections', genome_config.connection_gene_type)):
+        counts = packed[kind + '.counts']
+        genes = np.repeat(selected, counts)
+        offsets = np.concatenate(([0], np.cumsum(counts[selected]))).tolist()
+        gene_keys = packed[kind + '.keys'][genes]
+        gene_keys = gene_keys[:, 0].tolist() if kind == 'nodes' else list(zip(gene_keys[:, 0].tolist(), gene_keys[:, 1].tolist()))
+        columns = []
+        for name, attribute_type in _Columns(gene_type):
+            values = packed[kind + '.' + name][genes].tolist()
+            if attribute_type is not FloatAttribute and attribute_type is not BoolAttribute:
+                table = packed[kind + '.' + name + '.table']
+                values = [table[code] for code in values]
+            columns.append((name, values))
+        for index, genome in enumerate(genomes):
+            gene_dict = getattr(genome, kind)
+            for position in range(offsets[index], offsets[index + 1]):
+                gene = gene_type(gene_keys[position])
+                for name, values in columns:
+                    setattr(gene, name, values[position])
+                gene_dict[gene.key] = gene
+    return {genome.key: genome for genome in genomes}
+
+
+def _PeekCount(counter):
+    """Next value of an itertools.count and a fresh counter that continues from it (None stays None)."""
+    if counter is None:
+        return -1, None
+    value = next(counter)
+    return value, itertools.count(value)
+
+
+def _OptionalFloat(value):
+    return np.nan if value is None else float(value)
+
+
+def _FromOptionalFloat(value):
+    return None if np.isnan(value) else value
+
+
+class IncrementalCheckpointer(BaseReporter):
+    """Saves every generation as record to segment files in directory, see the module docstring.
+
+    snapshot_interval: generations per segment, each segment starts with a full snapshot.
+    keep_segments: number of segments kept on disk (the oldest are deleted), None keeps all.
+    max_pending: generations that may wait for the writer, end_generation blocks when more are pending.
+    compress_level: zlib level of the records, 0 writes them uncompressed.
+    Resuming a run from an older generation deletes the segments of the abandoned run from there on.
+    """
+    def __init__(self, directory='neat-checkpoint', snapshot_interval=50, keep_segments=None, max_pending=2, compress_level=1):
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self.keep_segments = keep_segments
+        self.max_pending = max_pending
+        self.compress_level = compress_level
+        self.records = 0
+        self.bytes_written = 0
+        self.collect_seconds = 0.0 # in end_generation
+        self.write_seconds = 0.0   # on the writer thread
+        self._Clear()
+
+    def _Clear(self):
+        self._generation = None
+        self._previous = {}
+        self._segment_start = None
+        self._best = None
+        self._best_written = None
+        self._queue = None
+        self._thread = None
+        self._file = None
+        self._error = None
+
+    # neat checkpoints pickle all reporters (through the species set), the writer and the references stay out of them
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_generation=None, _previous={}, _segment_start=None, _best=None, _best_written=None,
+                     _queue=None, _thread=None, _file=None, _error=None)
+        return state
+
+    def Restore(self, config, generation=None):
+        """RestoreCheckpoint from the directory, the best genome so far is carried on into the next records."""
+        population = RestoreCheckpoint(config, self.directory, generation)
+        self._best = population.best_genome
+        return population
+
+    def GetStatistics(self):
+        return {'records': self.records, 'bytes_written': self.bytes_written,
+                'collect_seconds': self.collect_seconds, 'write_seconds': self.write_seconds}
+
+    def start_generation(self, generation):
+        self._generation = generation
+
+    def post_evaluate(self, config, population, species, best_genome):
+        if self._best is None or best_genome.fitness > self._best.fitness:
+            self._best = best_genome
+
+    def end_generation(self, config, population, species_set):
+        start = time.perf_counter()
+        if self._error is not None:
+            raise RuntimeError("Writing the checkpoint failed") from self._error
+        if self._thread is None:
+            self._Start()
+        # the population runs the next generation, a restored one continues from there
+        generation = self._generation + 1
+        snapshot = self._segment_start is None or generation - self._segment_start >= self.snapshot_interval
+        if snapshot:
+            self._segment_start = generation
+        # genomes are not changed after reproduction (only their fitness), kept ones (elites) are written by key
+        previous = self._previous
+        new = [genome for key, genome in population.items() if snapshot or previous.get(key) is not genome]
+        best = self._best if self._best is not None and (snapshot or self._best is not self._best_written) else None
+        self._best_written = self._best
+        self._previous = dict(population)
+        node_indexer, config.genome_config.node_indexer = _PeekCount(config.genome_config.node_indexer)
+        species_indexer, species_set.indexer = _PeekCount(species_set.indexer)
+        species = list(species_set.species.values())
+        random_state = random.getstate()
+        record = {
+            'population': np.fromiter(population.keys(), np.int64, len(population)),
+            'fitness': np.fromiter((_OptionalFloat(genome.fitness) for genome in population.values()), np.float64, len(population)),
+            'species': {
+                'keys': np.array([s.key for s in species], dtype=np.int64),
+                'created': np.array([s.created for s in species], dtype=np.int64),
+                'last_improved': np.array([s.last_improved for s in species], dtype=np.int64),
+                'representative': np.array([s.representative.key for s in species], dtype=np.int64),
+                'fitness': np.array([_OptionalFloat(s.fitness) for s in species], dtype=np.float64),
+                'adjusted_fitness': np.array([_OptionalFloat(s.adjusted_fitness) for s in species], dtype=np.float64),
+                'member_counts': np.array([len(s.members) for s in species], dtype=np.int64),
+                'members': np.array([key for s in species for key in s.members], dtype=np.int64), # in dict order
+                'history_counts': np.array([len(s.fitness_history) for s in species], dtype=np.int64),
+                'history': np.array([value for s in species for value in s.fitness_history], dtype=np.float64),
+            },
+            'best_fitness': _OptionalFloat(best.fitness) if best is not None else np.nan,
+            'random': (random_state[0], np.array(random_state[1], dtype=np.uint32), random_state[2]),
+            'genome_indexer': int(max(population)) + 1 if population else 1,
+            'node_indexer': node_indexer,
+            'species_indexer': species_indexer,
+        }
+        self._queue.put((generation, snapshot, config.genome_config, new, best, record))
+        self.collect_seconds += time.perf_counter() - start
+
+    def found_solution(self, config, generation, best):
+        self.save()
+
+    def _Start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._queue = queue.Queue(maxsize=self.max_pending)
+        self._thread = threading.Thread(target=self._WriterMain, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _WriterMain(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                if self._error is None:
+                    self._Write(*job)
+            except Exception as exception:
+                self._error = exception
+            finally:
+                self._queue.task_done()
+
+    def _Write(self, generation, snapshot, genome_config, new, best, record):
+        start = time.perf_counter()
+        record['genomes'] = PackGenomes(new, genome_config)
+        record['best'] = PackGenomes([best], genome_config) if best is not None else None
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.compress_level:
+            payload = zlib.compress(payload, self.compress_level)
+        if snapshot:
+            self._NewSegment(generation)
+        kind = kind_snapshot if snapshot else kind_delta
+        self._file.write(record_header.pack(record_magic, kind, bool(self.compress_level), generation, len(payload)))
+        self._file.write(payload)
+        self._file.flush()
+        self.records += 1
+        self.bytes_written += record_header.size + len(payload)
+        self.write_seconds += time.perf_counter() - start
+
+    def _NewSegment(self, generation):
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+            self._file.close()
+        segments = ListSegments(self.directory)
+        for start, path in segments:
+            if start >= generation:
+                os.remove(path)
+        self._file = open(os.path.join(self.directory, 'segment-{:08d}.ckpt'.format(generation)), 'wb')
+        if self.keep_segments is not None:
+            older = [path for start, path in segments if start < generation]
+            for path in older[:max(0, len(older) - self.keep_segments + 1)]:
+                os.remove(path)
+
+    def save(self):
+        """Wait until the pending generations are written and synced to disk."""
+        if self._queue is None:
+            return
+        self._queue.join()
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        if self._error is not None:
+            raise RuntimeError("Writing the checkpoint failed") from self._error
+
+    def close(self):
+        """Write the pending generations and stop the writer thread, a later generation starts it again."""
+        if self._thread is None:
+            return
+        atexit.unregister(self.close)
+        self._queue.put(None)
+        self._thread.join()
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+            self._file.close()
+        error = self._error
+        self._Clear()
+        if error is not None:
+            raise RuntimeError("Writing the checkpoint failed") from error
+
+
+def ListSegments(directory):
+    """(first generation, path) of the segment files in directory, sorted by generation."""
+    segments = []
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            match = segment_pattern.match(name)
+            if match:
+                segments.append((int(match.group(1)), os.path.join(directory, name)))
+    return sorted(segments)
+
+
+def ReadRecords(path):
+    """Yield (kind, generation, record) of a segment file, a record cut off by a crash ends it."""
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(record_header.size)
+            if len(header) < record_header.size:
+                return
+            magic, kind, compressed, generation, length = record_header.unpack(header)
+            if magic != record_magic:
+                raise ValueError("{} is not a checkpoint segment".format(path))
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield kind, generation, pickle.loads(zlib.decompress(payload) if compressed else payload)
+
+
+def ListGenerations(directory):
+    """Generations a run can be restored at (the generation run next)."""
+    generations = set()
+    segments = ListSegments(directory)
+    for index, (start, path) in enumerate(segments):
+        end = segments[index + 1][0] if index + 1 < len(segments) else None
+        generations.update(generation for _, generation, _ in ReadRecords(path) if end is None or generation < end)
+    return sorted(generations)
+
+
+def RestoreCheckpoint(config, directory='neat-checkpoint', generation=None):
+    """neat.Population that runs generation next (the latest saved one if None), random state included."""
+    segments = [segment for segment in ListSegments(directory) if generation is None or segment[0] <= generation]
+    if not segments:
+        raise FileNotFoundError("No checkpoint in {} for generation {}".format(directory, generation))
+    _, path = segments[-1]
+    source = {} # genome key -> record that holds its genes
+    records = []
+    best_source = None
+    saved = None
+    for _, saved, record in ReadRecords(path):
+        records.append(record)
+        for key in record['genomes']['keys'].tolist():
+            source[key] = len(records) - 1
+        if record['best'] is not None:
+            best_source = len(records) - 1
+        if saved == generation:
+            break
+    if not records or (generation is not None and saved != generation):
+        raise FileNotFoundError("Generation {} is not in the checkpoint {}".format(generation, directory))
+    keys = record['population'].tolist()
+    wanted = {}
+    for key in keys:
+        wanted.setdefault(source[key], []).append(key)
+    genomes = {}
+    for index, record_keys in wanted.items():
+        genomes.update(UnpackGenomes(records[index]['genomes'], config, record_keys))
+    population = {}
+    for key, fitness in zip(keys, record['fitness'].tolist()):
+        genome = genomes[key]
+        genome.fitness = _FromOptionalFloat(fitness)
+        population[key] = genome
+
+    species_set = config.species_set_type(config.species_set_config, ReporterSet())
+    data = record['species']
+    member_offsets = np.concatenate(([0], np.cumsum(data['member_counts']))).tolist()
+    history_offsets = np.concatenate(([0], np.cumsum(data['history_counts']))).tolist()
+    members = data['members'].tolist()
+    history = data['history'].tolist()
+    for index, key in enumerate(data['keys'].tolist()):
+        species = Species(key, int(data['created'][index]))
+        species.last_improved = int(data['last_improved'][index])
+        species.update(population[int(data['representative'][index])],
+                       {member: population[member] for member in members[member_offsets[index]:member_offsets[index + 1]]})
+        species.fitness = _FromOptionalFloat(float(data['fitness'][index]))
+        species.adjusted_fitness = _FromOptionalFloat(float(data['adjusted_fitness'][index]))
+        species.fitness_history = history[history_offsets[index]:history_offsets[index + 1]]
+        species_set.species[key] = species
+        for member in species.members:
+            species_set.genome_to_species[member] = key
+    species_set.indexer = itertools.count(record['species_indexer'])
+    config.genome_config.node_indexer = itertools.count(record['node_indexer']) if record['node_indexer'] >= 0 else None
+
+    version, state, gauss_next = record['random']
+    random.setstate((version, tuple(state.tolist()), gauss_next))
+    restored = Population(config, (population, species_set, saved))
+    species_set.reporters = restored.reporters
+    restored.reproduction.genome_indexer = itertools.count(record['genome_indexer'])
+    if best_source is not None:
+        best = next(iter(UnpackGenomes(records[best_source]['best'], config).values()))
+        best.fitness = _FromOptionalFloat(records[best_source]['best_fitness'])
+        restored.best_genome = best
+    return restored
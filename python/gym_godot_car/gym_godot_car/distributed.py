@@ -0,0 +1,371 @@
+"""
+Evaluation of NEAT genomes by worker processes on other hosts.
+
+DistributedEvaluator is the coordinator: it listens for workers, which can join and leave
+at any time (also during a generation), sends them chunks of genomes and gathers the
+fitnesses, which arrive in any order:
+
+    with DistributedEvaluator(('0.0.0.0', 42500), authkey=b'secret') as evaluator:
+        winner = population.run(evaluator.evaluate)
+
+Every host runs worker processes, each with its own env (and simulator, e.g. from a
+SimulatorPool) that it keeps for all genomes:
+
+    python -m gym_godot_car.distributed --connect coordinator-host:42500 --authkey secret --processes 4 \\
+        --eval train_neat_feedforward:eval_genome --env train_neat_feedforward:make_env
+
+When no chunk is left to hand out, idle workers get copies of the genomes that other workers
+have not finished yet (those of stragglers and those still queued at busy workers). The first
+result wins and the other copies are cancelled. For this, evaluating a genome has to be
+deterministic (a seeded env), like for the FitnessCache.
+
+Messages are pickled by multiprocessing.connection, both sides prove that they know the
+authkey before anything is unpickled. Only use it in networks you trust.
+"""
+
+import argparse
+import collections
+import importlib
+import math
+import multiprocessing
+import multiprocessing.connection
+import os
+import socket
+import threading
+import time
+
+from gym_godot_car.evaluation import EvaluateGenome, EvaluateWithCache, _CloseEnv
+from gym_godot_car.profiler import StepCounter
+
+default_port = 42500
+default_authkey = os.environ.get('GODOT_CAR_AUTHKEY', 'godot-car').encode('utf-8')
+
+
+class _RemoteWorker():
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+        self.config = None
+        self.outstanding = collections.OrderedDict() # genome id -> dispatch time, in the order the worker runs them
+        self.started = time.monotonic() # when the worker started the first outstanding genome
+
+    def Send(self, message):
+        self.connection.send(message)
+
+    def Dispatch(self, chunk, config):
+        # record the chunk first, when sending fails the evaluator drops the worker and requeues its outstanding genomes
+        now = time.monotonic()
+        if not self.outstanding:
+            self.started = now
+        for genome_id, _ in chunk:
+            self.outstanding[genome_id] = now
+        if self.config is not config:
+            self.Send(('config', config))
+            self.config = config
+        self.Send(('chunk', chunk))
+
+
+class DistributedEvaluator():
+    """Evaluates genomes on the remote workers that are connected to address, like ParallelEnvEvaluator.
+
+    authkey: bytes shared with the workers, by default $GODOT_CAR_AUTHKEY or 'godot-car'.
+    timeout: seconds a genome may run on a worker, the worker is disconnected then and the genome counts as failed.
+    A genome that failed (raised, timed out or its worker left while running it) more than retries times gets
+    failure_fitness.
+    chunk_size: genomes per message, by default the population is split into 4 chunks per worker. A worker gets
+    the next chunk while it still has one queued.
+    max_copies: how many workers may run the same genome at the same time (straggler re-dispatch), 1 disables it.
+    """
+    def __init__(self, address=('0.0.0.0', default_port), authkey=None, timeout=None, chunk_size=None, retries=1,
+                 failure_fitness=-25.0, max_copies=2, cache=None, profiler=None):
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.failure_fitness = failure_fitness
+        self.max_copies = max_copies
+        self.cache = cache
+        self.profiler = profiler
+        self.failures = 0
+        self.redispatched = 0
+        self.left = 0
+        self.workers = []
+        self._joined = collections.deque()
+        self._wake_reader, self._wake_writer = multiprocessing.Pipe(duplex=False)
+        self._closed = False
+        self.listener = multiprocessing.connection.Listener(address, authkey=authkey or default_authkey)
+        self.address = self.listener.address
+        self._accept_thread = threading.Thread(target=self._AcceptMain, daemon=True)
+        self._accept_thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _AcceptMain(self):
+        while not self._closed:
+            try:
+                connection = self.listener.accept()
+                if not connection.poll(5.0):
+                    connection.close()
+                    continue
+                kind, name = connection.recv()
+            except (OSError, EOFError, multiprocessing.AuthenticationError):
+                continue
+            if kind == 'hello':
+                self._joined.append(_RemoteWorker(connection, name))
+                self._wake_writer.send(None)
+
+    def _Admit(self):
+        while self._wake_reader.poll():
+            self._wake_reader.recv()
+        while self._joined:
+            worker = self._joined.popleft()
+            self.workers.append(worker)
+            print("Worker {} joined ({:d} connected)".format(worker.name, len(self.workers)))
+
+    def close(self):
+        """Stop the workers' current sessions (they exit) and stop listening."""
+        self._closed = True
+        self._Admit()
+        for worker in self.workers:
+            try:
+                worker.Send(('stop', None))
+            except OSError:
+                pass
+            worker.connection.close()
+        self.workers = []
+        # wake up the accept thread with a connection of our own, it fails the authentication
+        host, port = self.address
+        try:
+            socket.create_connection(('127.0.0.1' if host in ('0.0.0.0', '') else host, port), timeout=1.0).close()
+        except OSError:
+            pass
+        self._accept_thread.join()
+        self.listener.close()
+
+    def evaluate(self, genomes, config):
+        EvaluateWithCache(self.cache, list(genomes), config, self._Evaluate)
+
+    def _Evaluate(self, genomes, config):
+        """Evaluate all genomes, returns the ids of those that got failure_fitness or a fitness that is not cacheable."""
+        by_id = {genome_id: genome for genome_id, genome in genomes}
+        open_ids = set(by_id)
+        pending = collections.deque(by_id)
+        copies = collections.Counter()
+        attempts = collections.Counter()
+        failed = set()
+        uncacheable = set()
+        announced = False
+
+        def Fail(genome_id):
+            attempts[genome_id] += 1
+            if attempts[genome_id] > self.retries:
+                by_id[genome_id].fitness = self.failure_fitness
+                self.failures += 1
+                failed.add(genome_id)
+                open_ids.discard(genome_id)
+            elif copies[genome_id] == 0:
+                pending.appendleft(genome_id)
+
+        def Drop(worker, running_failed):
+            # the first outstanding genome was running, the rest goes back to the pending ones
+            self.workers.remove(worker)
+            worker.connection.close()
+            for index, genome_id in enumerate(worker.outstanding):
+                copies[genome_id] -= 1
+                if genome_id not in open_ids:
+                    continue
+                if index == 0 and running_failed:
+                    Fail(genome_id)
+                elif copies[genome_id] == 0:
+                    pending.appendleft(genome_id)
+            worker.outstanding.clear()
+
+        def Resolve(genome_id, fitness):
+            # copies still queued at other workers are cancelled, running ones finish and are ignored
+            by_id[genome_id].fitness = fitness
+            open_ids.discard(genome_id)
+            for other in self.workers:
+                if genome_id in other.outstanding and next(iter(other.outstanding)) != genome_id:
+                    try:
+                        other.Send(('cancel', [genome_id]))
+                    except OSError:
+                        continue
+                    del other.outstanding[genome_id]
+                    copies[genome_id] -= 1
+
+        while open_ids:
+            self._Admit()
+            if not self.workers:
+                if not announced:
+                    announced = True
+                    print("Waiting for workers to connect to {}:{}".format(*self.address))
+                multiprocessing.connection.wait([self._wake_reader])
+                continue
+            announced = False
+            chunk_size = self.chunk_size or max(1, math.ceil(len(genomes) / (4 * len(self.workers))))
+            for worker in sorted(self.workers, key=lambda worker: len(worker.outstanding)):
+                while pending and len(worker.outstanding) <= chunk_size:
+                    chunk = []
+                    while pending and len(chunk) < chunk_size:
+                        genome_id = pending.popleft()
+                        if genome_id in open_ids and copies[genome_id] == 0:
+                            chunk.append((genome_id, by_id[genome_id]))
+                            copies[genome_id] += 1
+                    if not chunk:
+                        break
+                    try:
+                        worker.Dispatch(chunk, config)
+                    except OSError:
+                        Drop(worker, False)
+                        break
+            if not pending and self.max_copies > 1:
+                self._Redispatch(by_id, open_ids, copies, config, Drop)
+            busy = [worker for worker in self.workers if worker.outstanding]
+            wait_timeout = None
+            if self.timeout is not None and busy:
+                wait_timeout = max(0.0, min(worker.started for worker in busy) + self.timeout - time.monotonic())
+            ready = multiprocessing.connection.wait([worker.connection for worker in self.workers] + [self._wake_reader],
+                                                    wait_timeout)
+            for worker in list(self.workers):
+                if worker.connection in ready:
+                    try:
+                        while worker.connection.poll():
+                            genome_id, fitness, _, seconds, steps, cacheable = worker.connection.recv()
+                            worker.started = time.monotonic()
+                            if genome_id not in worker.outstanding:
+                                continue # cancelled copy
+                            del worker.outstanding[genome_id]
+                            copies[genome_id] -= 1
+                            if genome_id not in open_ids:
+                                continue
+                            if fitness is None:
+                                Fail(genome_id)
+                            else:
+                                Resolve(genome_id, fitness)
+                                if not cacheable:
+                                    uncacheable.add(genome_id)
+                                if self.profiler is not None:
+                                    self.profiler.RecordGenome(genome_id, by_id[genome_id], seconds, steps)
+                    except (EOFError, OSError):
+                        self.left += 1
+                        print("Worker {} left ({:d} connected)".format(worker.name, len(self.workers) - 1))
+                        Drop(worker, True)
+                        continue
+                if (self.timeout is not None and worker.outstanding and worker in self.workers and
+                        time.monotonic() - worker.started > self.timeout):
+                    print("Worker {} timed out".format(worker.name))
+                    Drop(worker, True)
+        return failed | uncacheable
+
+    def _Redispatch(self, by_id, open_ids, copies, config, Drop):
+        """Give idle workers copies of unfinished genomes, those dispatched first before the others."""
+        idle = [worker for worker in self.workers if not worker.outstanding]
+        if not idle:
+            return
+        candidates = sorted((dispatched, genome_id) for worker in self.workers
+                            for genome_id, dispatched in worker.outstanding.items()
+                            if genome_id in open_ids and copies[genome_id] < self.max_copies)
+        for worker in idle:
+            chunk = []
+            while candidates and not chunk:
+                _, genome_id = candidates.pop(0)
+                if copies[genome_id] < self.max_copies:
+                    chunk.append((genome_id, by_id[genome_id]))
+                    copies[genome_id] += 1
+            if not chunk:
+                return
+            try:
+                worker.Dispatch(chunk, config)
+                self.redispatched += 1
+            except OSError:
+                Drop(worker, False)
+
+
+def WorkerMain(address, authkey, eval_function, env_factory, worker_index=0, name=None, retry_interval=1.0):
+    """Evaluate genomes for the coordinator at address until it stops the session, reconnects when the connection is lost.
+
+    env_factory(worker_index) creates the env, it is kept for all genomes (and connections) and wrapped in a StepCounter.
+    """
+    name = name or "{}-{:d}".format(socket.gethostname(), worker_index)
+    env = None
+    config = None
+    delay = 0.05
+    try:
+        while True:
+            try:
+                connection = multiprocessing.connection.Client(address, authkey=authkey or default_authkey)
+            except OSError:
+                time.sleep(delay)
+                delay = min(2 * delay, retry_interval)
+                continue
+            delay = 0.05
+            try:
+                connection.send(('hello', name))
+                queue = collections.deque()
+                while True:
+                    # block only when there is nothing to evaluate, otherwise just take what already arrived
+                    while not queue or connection.poll():
+                        kind, payload = connection.recv()
+                        if kind == 'stop':
+                            return
+                        if kind == 'config':
+                            config = payload
+                        elif kind == 'chunk':
+                            queue.extend(payload)
+                        elif kind == 'cancel':
+                            cancelled = set(payload)
+                            queue = collections.deque(item for item in queue if item[0] not in cancelled)
+                    genome_id, genome = queue.popleft()
+                    env, result = EvaluateGenome(genome_id, genome, config, env, worker_index,
+                                                 lambda index: StepCounter(env_factory(index)), eval_function)
+                    connection.send(result)
+            except (EOFError, OSError):
+                connection.close()
+                time.sleep(retry_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        _CloseEnv(env)
+
+
+def Import(name):
+    """module:attribute, e.g. train_neat_feedforward:eval_genome."""
+    module, _, attribute = name.partition(':')
+    return getattr(importlib.import_module(module), attribute)
+
+
+def ParseAddress(text):
+    host, _, port = text.rpartition(':')
+    return (host or '127.0.0.1', int(port))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker processes evaluating genomes for a DistributedEvaluator.")
+    parser.add_argument('--connect', type=ParseAddress, default=('127.0.0.1', default_port), help="coordinator host:port")
+    parser.add_argument('--authkey', default=None, help="shared key, defaults to $GODOT_CAR_AUTHKEY or 'godot-car'")
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--eval', default='train_neat_feedforward:eval_genome', help="eval_function(genome, config, env)")
+    parser.add_argument('--env', default='train_neat_feedforward:make_env', help="env_factory(worker_index)")
+    parser.add_argument('--first-index', type=int, default=0, help="worker_index of the first process")
+    args = parser.parse_args()
+    authkey = args.authkey.encode('utf-8') if args.authkey is not None else None
+    eval_function = Import(args.eval)
+    env_factory = Import(args.env)
+    processes = [multiprocessing.Process(target=WorkerMain,
+                                         args=(args.connect, authkey, eval_function, env_factory, args.first_index + idx))
+                 for idx in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+
+if __name__ == '__main__':
+    main()
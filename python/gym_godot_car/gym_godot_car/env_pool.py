@@ -0,0 +1,159 @@
+"""
+Pool of connected and reset GodotCarEnvs.
+
+Constructing an env is cheap, but its first reset connects to the server and registers a
+car (and waits while the server is still starting). EnvPool keeps size envs warm in a
+background thread, so acquiring one does not wait for the server:
+
+    with EnvPool(4, ip='127.0.0.1', port=42424) as pool:
+        with pool.Acquire() as lease:
+            observation = lease.env.reset()
+            ...
+
+A returned env is checked by resetting it in the background, envs whose reset fails (broken
+connection, crashed server) are closed and replaced by new ones.
+"""
+
+import collections
+import threading
+import time
+
+from gym_godot_car.envs import GodotCarEnv
+
+
+class EnvLease():
+    """An env of the pool, return it with Release() or use the lease as context manager.
+
+    Release(broken=True) replaces the env without checking it, e.g. after it raised.
+    """
+    def __init__(self, pool, env):
+        self.pool = pool
+        self.env = env
+
+    def Release(self, broken=False):
+        if self.pool is not None:
+            self.pool.Release(self, broken)
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.Release(broken=exception_type is not None)
+
+
+class EnvPool():
+    """size envs of env_factory() (by default GodotCarEnv(**env_kwargs)), connected and reset in the background.
+
+    retry_interval: seconds between two attempts to replace an env when creating it failed.
+    """
+    def __init__(self, size, env_factory=None, retry_interval=1.0, **env_kwargs):
+        self.size = size
+        self.env_factory = env_factory or (lambda: GodotCarEnv(**env_kwargs))
+        self.retry_interval = retry_interval
+        self.created = 0
+        self.recycled = 0
+        self._ready = collections.deque()
+        self._returned = collections.deque() # (env, broken)
+        self._missing = size
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._WarmMain, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def ready(self):
+        """Number of warm envs that Acquire hands out right away."""
+        return len(self._ready)
+
+    def Acquire(self, timeout=None):
+        """Lease on a warm env, waits up to timeout seconds (None: forever) until one is ready."""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._ready or self._closed, timeout):
+                raise TimeoutError("No warm env within {} s".format(timeout))
+            if self._closed:
+                raise RuntimeError("The env pool is closed")
+            return EnvLease(self, self._ready.popleft())
+
+    def Release(self, lease, broken=False):
+        with self._condition:
+            if self._closed:
+                _Close(lease.env)
+                return
+            self._returned.append((lease.env, broken))
+            self._condition.notify_all()
+
+    def _NextJob(self):
+        with self._condition:
+            self._condition.wait_for(lambda: self._returned or self._missing or self._closed)
+            if self._closed:
+                return None
+            if self._returned:
+                return self._returned.popleft()
+            self._missing -= 1
+            return None, True
+
+    def _WarmMain(self):
+        while True:
+            job = self._NextJob()
+            if job is None:
+                return
+            env, broken = job
+            if env is not None and not broken:
+                try:
+                    env.reset()
+                except Exception:
+                    broken = True
+            if broken:
+                if env is not None:
+                    _Close(env)
+                    self.recycled += 1
+                env = self._Create()
+            with self._condition:
+                if env is None:
+                    self._missing += 1
+                elif self._closed:
+                    _Close(env)
+                else:
+                    self._ready.append(env)
+                self._condition.notify_all()
+
+    def _Create(self):
+        env = None
+        try:
+            env = self.env_factory()
+            env.reset()
+            self.created += 1
+            return env
+        except Exception as exception:
+            print("Env pool could not warm an env: {!r}".format(exception))
+            if env is not None:
+                _Close(env)
+            time.sleep(self.retry_interval)
+            return None
+
+    def close(self):
+        """Close the warm envs and stop the background thread, leased envs are closed when they are returned."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        for env in list(self._ready) + [env for env, _ in self._returned]:
+            _Close(env)
+        self._ready.clear()
+        self._returned.clear()
+
+
+def _Close(env):
+    try:
+        env.close()
+    except Exception:
+        pass
@@ -1 +1,4 @@
-from gym_godot_car.envs.godot_car_env import GodotCarEnv
\ No newline at end of file
+from gym_godot_car.envs.godot_car_env import GodotCarEnv
+from gym_godot_car.envs.godot_car_vec_env import GodotCarVecEnv
+from gym_godot_car.envs.godot_car_multi_env import AsyncGodotCarClient, MultiCarGodotEnv
+from gym_godot_car.envs.godot_car_subproc_env import SubprocGodotCarVecEnv
@@ -6,6 +6,12 @@ import numpy as np
 import socket
 from enum import Enum
 import math
+import time
+
+from gym_godot_car import protocol
+from gym_godot_car.timing import PhaseTimer
+from gym_godot_car.sim import Car, CarState
+from gym_godot_car.sim.car import StateScore
 
 class Status(Enum):
     INIT = 0
@@ -14,41 +20,86 @@ class Status(Enum):
     ERROR = 99
 
 class GodotCarHelperClient():
-  def __init__(self):
-    self._ip = '127.0.0.1'
-    self._port = 42424
+  """protocol: 'auto' uses the binary protocol if the server offers it, 'text' or 'binary' force one of them.
+  return_views: GetObservation returns the internal observation buffer instead of a copy, it is overwritten by the next step.
+  reset_mode: 'auto' resets the car in-band (connection and car are kept) if the server offers it, 'reconnect' always
+  reconnects and registers a new car.
+  ip, port: address of the simulation server.
+  timer: PhaseTimer that records encode, send, wait, decode, reset and reconnect times, None disables the timing
+  (the untimed methods are used then).
+  connect_timeout: seconds the connection is retried with growing pauses while the server is not up yet.
+  The client connects on the first Reset, not on construction.
+  """
+  def __init__(self, protocol='auto', return_views=False, reset_mode='auto', ip='127.0.0.1', port=42424, timer=None,
+               connect_timeout=30.0):
+    self._debug = False
+    self._timer = timer
+    if timer is not None:
+      self.SetControl = self._SetControlTimed
+      self.Reset = self._ResetTimed
+    self._ip = ip
+    self._port = port
+    self._connect_timeout = connect_timeout
     self._buffer_size = 1024
+    self._protocol = protocol
+    self._binary = False
+    self._reset_mode = reset_mode
+    self._in_band_reset = False
+    self._repeat = False
+    self._state = False
+    self._return_views = return_views
+    self._observation = np.zeros(9, dtype=np.float32)
     self._socket = None
-    self._Connect()
+    self._reader = None
     self._status = Status.INIT
     self._step_reward = 0.0
     self._total_reward = 0.0
     self._crash = False
-    self._observation = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
     self._id = ""
-    self._debug = False
   def _DebugPrint(self, msg):
     if self._debug:
-      self._DebugPrint(msg)
+      print("[{}] {}".format(self._id, msg))
   def _Connect(self):
     if self._socket:
         self._DebugPrint("Already socket created, closing first before connecting")
         self.Close()
-    self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    self._socket.settimeout(1) # seconds
-    self._socket.connect((self._ip, self._port))
+    deadline = time.monotonic() + self._connect_timeout
+    delay = 0.05 # seconds, doubled after every failed attempt up to 1 s
+    while True:
+      connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+      connection.settimeout(1) # seconds
+      try:
+        connection.connect((self._ip, self._port))
+        break
+      except OSError as exception:
+        connection.close()
+        if time.monotonic() + delay > deadline:
+          raise ConnectionError("Simulation server {}:{} not reachable within {} s".format(
+            self._ip, self._port, self._connect_timeout)) from exception
+        self._DebugPrint("Connecting failed ({}), retrying in {} s".format(exception, delay))
+        time.sleep(delay)
+        delay = min(2 * delay, 1.0)
+    self._socket = connection
+    self._reader = protocol.ReplyReader(self._socket, self._buffer_size)
     self._status = Status.WAITING
   def _Register(self):
     self._DebugPrint("Registering")
-    self._socket.send("(HEAD:10)(REGISTER)".encode('utf-8'))
+    self._socket.send(protocol.EncodeText("(REGISTER)"))
     self._status = Status.RUNNING
-    self._id = self._socket.recv(self._buffer_size).decode('utf-8')
+    self._id, features = protocol.DecodeRegisterResponse(self._reader.ReadRegisterResponse())
+    self._binary = self._protocol != 'text' and features.get('BINARY', 0) >= protocol.binary_version
+    self._in_band_reset = self._reset_mode != 'reconnect' and features.get('RESET', 0) >= protocol.reset_version
+    self._repeat = features.get('REPEAT', 0) >= protocol.repeat_version
+    self._state = features.get('STATE', 0) >= protocol.state_version
+    if self._protocol == 'binary' and not self._binary:
+      raise ConnectionError("Server does not offer binary protocol version {}".format(protocol.binary_version))
   def Close(self):
     if self._socket:
         self._socket.send("(HEAD:7)(CLOSE)".encode('utf-8'))
         self._socket.close()
         self._DebugPrint("Closing Socket")
     self._socket = None
+    self._reader = None
     self._status = Status.INIT
   def GetEpisodeStatus(self):
     #if self._crash:
@@ -56,8 +107,19 @@ class GodotCarHelperClient():
     if self._total_reward < -25 or self._total_reward > 14000 or self._crash:
         return True
     return False
+  def GetEpisodeEnd(self):
+    """Why GetEpisodeStatus ends the episode: 'crash', 'min_score', 'max_score' or None."""
+    if self._crash:
+      return 'crash'
+    if self._total_reward < -25:
+      return 'min_score'
+    if self._total_reward > 14000:
+      return 'max_score'
+    return None
   def GetObservation(self):
-    return np.array(self._observation)
+    if self._return_views:
+      return self._observation
+    return self._observation.copy()
   def GetReward(self):
     return self._step_reward
   def GetStatus(self):
@@ -67,40 +129,175 @@ class GodotCarHelperClient():
     self._step_reward = 0.0
     self._total_reward = 0.0
     self._crash = False
-    self._observation = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+    self._observation.fill(0.0)
   def Reset(self):
+    if self._in_band_reset and self._status == Status.RUNNING:
+      self._DebugPrint("Resetting Car")
+      self._ResetInternalStates()
+      self._socket.send(protocol.EncodeText("(RESET)"))
+      self._total_reward, self._crash, _ = protocol.DecodeSense(self._reader.Read(latest=True), out=self._observation)
+      self._status = Status.RUNNING
+      return
     self._DebugPrint("Resetting Socket")
     self._ResetInternalStates()
     self.Close()
     self._Connect()
     self._Register()
-  def SetControl(self, control):
-    command_body = "(CONTROL:{throttle:2.3f};{brake:2.3f};{steer:2.3f})".format(throttle=control[0], brake=control[1], steer=control[2])
-    command_head = "(HEAD:{length:d})".format(length=len(command_body))
-    command = command_head+command_body
-    self._socket.send(command.encode('utf-8'))
-    data = self._socket.recv(self._buffer_size).decode('utf-8').split(';')
-    self._step_reward = float(data[0]) - self._total_reward
+  def _RequireState(self):
+    if self._status != Status.RUNNING:
+      raise RuntimeError("The car is not registered yet, reset first")
+    if not self._state:
+      raise ConnectionError("Server does not offer state snapshots version {}".format(protocol.state_version))
+  def GetState(self):
+    """CarState of the car, SetState continues the episode from it (on this or another car of any server)."""
+    self._RequireState()
+    self._socket.send(protocol.EncodeTextGetState())
+    return CarState(*protocol.DecodeState(self._reader.Read(latest=True)))
+  def SetState(self, state):
+    self._RequireState()
+    self._socket.send(protocol.EncodeTextSetState(state))
+    self._total_reward, self._crash, _ = protocol.DecodeSense(self._reader.Read(latest=True), out=self._observation)
+    self._step_reward = 0.0
+  def SetControl(self, control, repeat=1):
+    """Apply control for repeat steps (fewer if the car crashes), GetReward returns the reward of all of them."""
+    if repeat > 1 and not self._repeat:
+      self._SetControlRepeated(control, repeat)
+      return
+    if self._binary:
+      self._socket.send(protocol.EncodeBinaryControl(control[0], control[1], control[2], repeat))
+      score, self._crash, _ = protocol.DecodeBinarySense(self._reader.Read(latest=True), out=self._observation)
+    else:
+      self._socket.send(protocol.EncodeTextControl(control[0], control[1], control[2], repeat))
+      score, self._crash, _ = protocol.DecodeTextSense(self._reader.Read(latest=True), out=self._observation)
+    self._step_reward = score - self._total_reward
+    self._total_reward += self._step_reward
+  def _SetControlRepeated(self, control, repeat):
+    # servers without REPEAT: one round trip per step
+    step_reward = 0.0
+    for _ in range(repeat):
+      self.SetControl(control)
+      step_reward += self._step_reward
+      if self._crash:
+        break
+    self._step_reward = step_reward
+  def _SetControlTimed(self, control, repeat=1):
+    if repeat > 1 and not self._repeat:
+      self._SetControlRepeated(control, repeat)
+      return
+    timer = self._timer
+    start = time.perf_counter()
+    if self._binary:
+      message = protocol.EncodeBinaryControl(control[0], control[1], control[2], repeat)
+    else:
+      message = protocol.EncodeTextControl(control[0], control[1], control[2], repeat)
+    encoded = time.perf_counter()
+    self._socket.send(message)
+    sent = time.perf_counter()
+    try:
+      reply = self._reader.Read(latest=True)
+    except socket.timeout:
+      timer.Count('timeouts')
+      raise
+    received = time.perf_counter()
+    score, self._crash, _ = protocol.DecodeSense(reply, out=self._observation)
+    self._step_reward = score - self._total_reward
+    self._total_reward += self._step_reward
+    decoded = time.perf_counter()
+    timer.Add('encode', encoded - start)
+    timer.Add('send', sent - encoded)
+    timer.Add('wait', received - sent)
+    timer.Add('decode', decoded - received)
+  def _ResetTimed(self):
+    in_band = self._in_band_reset and self._status == Status.RUNNING
+    start = time.perf_counter()
+    try:
+      type(self).Reset(self)
+    except socket.timeout:
+      self._timer.Count('timeouts')
+      raise
+    if in_band:
+      self._timer.Add('reset', time.perf_counter() - start)
+      self._timer.Count('resets')
+    else:
+      self._timer.Add('reconnect', time.perf_counter() - start)
+      self._timer.Count('reconnects')
+
+class GodotCarSimClient(GodotCarHelperClient):
+  """Drop-in replacement for GodotCarHelperClient that runs the car in-process (no socket, no Godot)."""
+  def __init__(self, track=None, return_views=False):
+    self._track = track
+    self._car = None
+    super().__init__(return_views=return_views)
+    self._Connect()
+  def _Connect(self):
+    self._car = Car(self._track)
+    self._status = Status.WAITING
+  def _Register(self):
+    self._car.Reset()
+    self._status = Status.RUNNING
+    self._id = "python"
+    self._observation[:] = self._car.GetObservation()
+  def Close(self):
+    self._status = Status.INIT
+  def Reset(self):
+    self._ResetInternalStates()
+    self._Register()
+  def GetState(self):
+    return self._car.GetState()
+  def SetState(self, state):
+    self._car.SetState(state)
+    self._status = Status.RUNNING
+    self._step_reward = 0.0
+    self._total_reward = self._car.GetScore()
+    self._crash = self._car.crash
+    self._observation[:] = self._car.GetObservation()
+  def SetControl(self, control, repeat=1):
+    self._car.Control(control[0], control[1], control[2])
+    self._car.Step(repeat)
+    self._step_reward = self._car.GetScore() - self._total_reward
     self._total_reward += self._step_reward
-    self._crash = bool(data[1] == 'True')
-    self._observation[0] = float(data[2])
-    self._observation[1] = float(data[3])
-    self._observation[2] = float(data[4])
-    self._observation[3] = float(data[5])
-    self._observation[4] = float(data[6])
-    self._observation[5] = float(data[7])
-    self._observation[6] = float(data[8])
-    self._observation[7] = float(data[9])
-    self._observation[8] = float(data[10])
+    self._crash = self._car.crash
+    self._observation[:] = self._car.GetObservation()
 
 class GodotCarEnv(gym.Env):
+  """timer: True or a PhaseTimer to record the time of each phase of step and reset (see gym_godot_car.timing).
+  The durations of the last step are returned in info['timing'], the rolling histograms of all phases in
+  info['timing_histograms'] at the end of each episode, env.timer.GetStatistics() pulls them with percentiles.
+  frame_skip: every action is applied for frame_skip simulation steps (fewer if the car crashes) and step returns
+  the reward of all of them. Servers offering REPEAT do this with a single round trip.
+  lease: Lease of a SimulatorPool (see gym_godot_car.pool), the env connects to its server instead of ip and port
+  and releases it on close.
+  termination: TerminationPolicy (see gym_godot_car.termination) that can end episodes early. At the end of an
+  episode info['termination'] names the rule that fired, or 'crash', 'min_score' or 'max_score'. When a rule
+  fired, info['penalty'] is the step penalty it charged with the last reward (see TerminationPolicy).
+  connect_timeout: the env connects on the first reset and retries for this many seconds while the server is not up.
+  get_state returns a snapshot (CarState) of the car, set_state(state) continues the episode from it instead of
+  resetting and returns the observation, e.g. to branch several rollouts from one point. The godot backend needs a
+  server offering STATE (see protocol.py) and a reset before the first get_state.
+  """
   metadata = {'render.modes': ['human']}
 
-  def __init__(self):
-    self.client = GodotCarHelperClient()
-    self.server_process = None # todo: set here
-    self.godot_car_path = None # todo: set here
-    
+  def __init__(self, backend='godot', protocol='auto', return_views=False, reset_mode='auto', ip='127.0.0.1', port=42424,
+               timer=None, frame_skip=1, lease=None, termination=None, connect_timeout=30.0):
+    self.frame_skip = int(frame_skip)
+    if self.frame_skip < 1:
+      raise ValueError("frame_skip must be at least 1, got {}".format(frame_skip))
+    self.timer = PhaseTimer() if timer is True else (timer or None)
+    self.termination = termination
+    self._last_step_end = None
+    if self.timer is not None:
+      self.step = self._StepTimed
+      self.reset = self._ResetTimed
+    self.lease = lease
+    if lease is not None:
+      ip, port = lease.address
+    if backend == 'godot':
+      self.client = GodotCarHelperClient(protocol, return_views, reset_mode, ip, port, self.timer, connect_timeout)
+    elif backend == 'python':
+      self.client = GodotCarSimClient(return_views=return_views)
+    else:
+      raise ValueError("Unknown backend '{}', expected 'godot' or 'python'".format(backend))
+
     self.min_sensor_distance = 0
     self.max_sensor_distance = 100
     self.min_speed =    0
@@ -144,18 +341,64 @@ class GodotCarEnv(gym.Env):
     brake = float(np.clip(action[1], self.min_brake, self.max_brake))
     steer = float(np.clip(action[2], self.min_steer, self.max_steer))
     control = np.array([throttle, brake, steer])
-    self.client.SetControl(control)
+    self.client.SetControl(control, self.frame_skip)
     status = self.client.GetStatus()
     reward = self.client.GetReward()
     observation = self.client.GetObservation()
     episode_over = self.client.GetEpisodeStatus()
+    if self.termination is not None:
+      return self._Terminate(observation, reward, episode_over)
     return observation, reward, episode_over, {}
+  def _Terminate(self, observation, reward, episode_over):
+    if episode_over:
+      end = self.client.GetEpisodeEnd()
+      self.termination.fired[end] += 1
+      return observation, reward, True, {'termination': end}
+    rule = self.termination.Check(observation, reward)
+    if rule is not None:
+      penalty = self.termination.penalty
+      return observation, reward + penalty, True, {'termination': rule, 'penalty': penalty}
+    return observation, reward, False, {}
   def reset(self):
     self.client.Reset()
+    if self.termination is not None:
+      self.termination.Reset()
+    return self.client.GetObservation()
+  def get_state(self):
+    return self.client.GetState()
+  def set_state(self, state):
+    state = CarState(*state)
+    self.client.SetState(state)
+    if self.termination is not None:
+      # the history of NoProgress and Stalled starts anew, step budgets and BestCutoff count on from the state
+      self.termination.Reset()
+      self.termination.steps = int(state.step_counter) // self.frame_skip
+      self.termination.total_reward = StateScore(state)
     return self.client.GetObservation()
+  def _StepTimed(self, action):
+    timer = self.timer
+    start = time.perf_counter()
+    if self._last_step_end is not None:
+      timer.Add('policy', start - self._last_step_end)
+    observation, reward, episode_over, info = type(self).step(self, action)
+    self._last_step_end = time.perf_counter()
+    timer.Add('step', self._last_step_end - start)
+    timer.Count('steps')
+    info['timing'] = timer.GetLast()
+    if episode_over:
+      info['timing_histograms'] = timer.GetHistograms()
+    timer.MaybeDump()
+    return observation, reward, episode_over, info
+  def _ResetTimed(self):
+    observation = type(self).reset(self)
+    self._last_step_end = time.perf_counter()
+    return observation
   def render(self, mode='human'):
     pass
   def close(self):
     if self.client:
         self.client.Close()
         self.client = None
+    if self.lease is not None:
+        self.lease.Release()
+        self.lease = None
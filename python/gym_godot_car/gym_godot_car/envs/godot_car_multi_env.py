@@ -0,0 +1,159 @@
+from gym import spaces
+from gym.vector import VectorEnv
+
+import numpy as np
+import asyncio
+import socket
+import math
+
+from gym_godot_car import protocol
+from gym_godot_car.sim import CarState
+
+class AsyncGodotCarClient():
+  """asyncio counterpart of GodotCarHelperClient, many of them can share one event loop.
+
+  Needs a server that terminates its replies (see protocol.py). The observation is decoded
+  into the given float32 array, e.g. one row of a batch.
+  """
+  def __init__(self, ip='127.0.0.1', port=42424, protocol='auto', observation=None, timeout=1.0):
+    self._ip = ip
+    self._port = port
+    self._protocol = protocol
+    self._timeout = timeout
+    self._binary = False
+    self._in_band_reset = False
+    self._state = False
+    self._reader = None
+    self._writer = None
+    self._observation = observation if observation is not None else np.zeros(9, dtype=np.float32)
+    self._step_reward = 0.0
+    self._total_reward = 0.0
+    self._crash = False
+    self._id = ""
+  async def Connect(self):
+    self._reader, self._writer = await asyncio.wait_for(asyncio.open_connection(self._ip, self._port), self._timeout)
+    self._writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+  async def _ReadReply(self):
+    first = await self._reader.readexactly(1)
+    if first[0] == protocol.binary_magic:
+      header = first + await self._reader.readexactly(protocol.frame_header.size - 1)
+      return header + await self._reader.readexactly(protocol.frame_header.unpack(header)[2])
+    return first + await self._reader.readuntil(b'\n')
+  async def _Request(self, message):
+    self._writer.write(message)
+    try:
+      return await asyncio.wait_for(self._ReadReply(), self._timeout)
+    except asyncio.TimeoutError:
+      raise ConnectionError("No (terminated) reply from server {}:{}".format(self._ip, self._port))
+  async def Register(self):
+    self._id, features = protocol.DecodeRegisterResponse(await self._Request(protocol.EncodeText("(REGISTER)")))
+    self._binary = self._protocol != 'text' and features.get('BINARY', 0) >= protocol.binary_version
+    self._in_band_reset = features.get('RESET', 0) >= protocol.reset_version
+    self._state = features.get('STATE', 0) >= protocol.state_version
+    if self._protocol == 'binary' and not self._binary:
+      raise ConnectionError("Server does not offer binary protocol version {}".format(protocol.binary_version))
+  async def Reset(self):
+    self._step_reward = 0.0
+    self._crash = False
+    if self._in_band_reset:
+      self._total_reward, self._crash, _ = protocol.DecodeSense(await self._Request(protocol.EncodeText("(RESET)")), out=self._observation)
+      return
+    await self.Close()
+    await self.Connect()
+    await self.Register()
+    self._total_reward = 0.0
+    self._observation.fill(0.0)
+  async def GetState(self):
+    if not self._state:
+      raise ConnectionError("Server does not offer state snapshots version {}".format(protocol.state_version))
+    return CarState(*protocol.DecodeState(await self._Request(protocol.EncodeTextGetState())))
+  async def SetState(self, state):
+    if not self._state:
+      raise ConnectionError("Server does not offer state snapshots version {}".format(protocol.state_version))
+    self._total_reward, self._crash, _ = protocol.DecodeSense(await self._Request(protocol.EncodeTextSetState(state)), out=self._observation)
+    self._step_reward = 0.0
+  async def SetControl(self, control):
+    if self._binary:
+      reply = await self._Request(protocol.EncodeBinaryControl(control[0], control[1], control[2]))
+    else:
+      reply = await self._Request(protocol.EncodeTextControl(control[0], control[1], control[2]))
+    score, self._crash, _ = protocol.DecodeSense(reply, out=self._observation)
+    self._step_reward = score - self._total_reward
+    self._total_reward = score
+  async def Close(self):
+    if self._writer:
+      self._writer.write(protocol.EncodeText("(CLOSE)"))
+      self._writer.close()
+      try:
+        await self._writer.wait_closed()
+      except ConnectionError:
+        pass
+    self._reader = None
+    self._writer = None
+  def GetEpisodeStatus(self):
+    return self._total_reward < -25 or self._total_reward > 14000 or self._crash
+  def GetObservation(self):
+    return self._observation
+  def GetReward(self):
+    return self._step_reward
+
+class MultiCarGodotEnv(VectorEnv):
+  """Registers num_envs cars at one simulation server and drives them from a single event loop.
+
+  Each step sends all controls concurrently and gathers the replies, the results are returned
+  as batched arrays like GodotCarVecEnv, finished cars are reset automatically. get_state and set_state
+  snapshot and clone car states like GodotCarVecEnv, if the server offers STATE (see protocol.py).
+  """
+  def __init__(self, num_envs, ip='127.0.0.1', port=42424, protocol='auto', timeout=1.0):
+    low = np.array([0, 0, 0, 0, 0, 0, -math.pi, 0, 0], dtype=np.float32)
+    high = np.array([100, 100, 100, 100, 100, 100, +math.pi, 1280, 600], dtype=np.float32)
+    self.action_low = np.array([0, 0, -0.8], dtype=np.float32)
+    self.action_high = np.array([1, 1, +0.8], dtype=np.float32)
+    super().__init__(num_envs,
+                     spaces.Box(low, high, dtype=np.float32),
+                     spaces.Box(self.action_low, self.action_high, dtype=np.float32))
+    self._observations = np.zeros((num_envs, 9), dtype=np.float32)
+    self._actions = np.zeros((num_envs, 3))
+    self._rewards = np.zeros(num_envs)
+    self._dones = np.zeros(num_envs, dtype=bool)
+    self._loop = asyncio.new_event_loop()
+    self.clients = [AsyncGodotCarClient(ip, port, protocol, self._observations[idx], timeout) for idx in range(num_envs)]
+    self._Run(self._ConnectAll())
+  def _Run(self, coroutine):
+    return self._loop.run_until_complete(coroutine)
+  async def _Gather(self, coroutines):
+    return await asyncio.gather(*coroutines)
+  async def _ConnectAll(self):
+    await asyncio.gather(*[client.Connect() for client in self.clients])
+    await asyncio.gather(*[client.Register() for client in self.clients])
+  def reset_wait(self, **kwargs):
+    self._Run(self._Gather(client.Reset() for client in self.clients))
+    return self._observations.copy()
+  def get_state(self, index=0):
+    return self._Run(self.clients[index].GetState())
+  def set_state(self, state, indices=None):
+    indices = range(self.num_envs) if indices is None else indices
+    self._Run(self._Gather(self.clients[idx].SetState(state) for idx in indices))
+    return self._observations.copy()
+  def step_async(self, actions):
+    np.clip(np.asarray(actions, dtype=np.float64).reshape(self.num_envs, 3), self.action_low, self.action_high, out=self._actions)
+  async def _StepAll(self):
+    await asyncio.gather(*[client.SetControl(self._actions[idx]) for idx, client in enumerate(self.clients)])
+    for idx, client in enumerate(self.clients):
+      self._rewards[idx] = client.GetReward()
+      self._dones[idx] = client.GetEpisodeStatus()
+    observations = self._observations.copy()
+    infos = [{} for _ in range(self.num_envs)]
+    if self._dones.any():
+      finished = np.flatnonzero(self._dones)
+      for idx in finished:
+        infos[idx]['terminal_observation'] = observations[idx].copy()
+      await asyncio.gather(*[self.clients[idx].Reset() for idx in finished])
+      observations[finished] = self._observations[finished]
+    return observations, self._rewards.copy(), self._dones.copy(), infos
+  def step_wait(self, **kwargs):
+    return self._Run(self._StepAll())
+  def close_extras(self, **kwargs):
+    if not self._loop.is_closed():
+      self._Run(self._Gather(client.Close() for client in self.clients))
+      self._loop.close()
@@ -0,0 +1,207 @@
+from gym import spaces
+from gym.vector import VectorEnv
+
+import numpy as np
+import math
+import multiprocessing
+import time
+import traceback
+
+from gym_godot_car.envs.godot_car_env import GodotCarEnv
+
+_step = 1
+_reset = 2
+_close = 3
+
+class _SharedBuffers():
+  """float32 observations[N,9], rewards[N], dones[N], actions[N,3] and terminal_observations[N,9] followed by
+  int32 command[1], failed[N] and info[N] (1 when the worker put the info dict of its step on the info queue),
+  all views into one shared memory block."""
+  def __init__(self, buffer, num_envs):
+    layout = [('observations', np.float32, (num_envs, 9)), ('rewards', np.float32, (num_envs,)),
+              ('dones', np.float32, (num_envs,)), ('actions', np.float32, (num_envs, 3)),
+              ('terminal_observations', np.float32, (num_envs, 9)),
+              ('command', np.int32, (1,)), ('failed', np.int32, (num_envs,)), ('info', np.int32, (num_envs,))]
+    offset = 0
+    for name, dtype, shape in layout:
+      array = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+      setattr(self, name, array)
+      offset += array.nbytes
+  @staticmethod
+  def Size(num_envs):
+    return 4 * (num_envs * (9 + 1 + 1 + 3 + 9) + 1 + 2 * num_envs)
+
+def _WorkerMain(index, num_envs, memory_name, env_factory, go, finished, errors, infos):
+  """Loop of a worker process: run the command in the shared buffers on the env of index, then signal finished."""
+  from multiprocessing import shared_memory
+  # the resource tracker is shared with the parent, which unlinks the block on close
+  memory = shared_memory.SharedMemory(name=memory_name)
+  buffers = _SharedBuffers(memory.buf, num_envs)
+  env = None
+  try:
+    while True:
+      go.acquire()
+      command = buffers.command[0]
+      if command == _close:
+        break
+      buffers.info[index] = 0
+      try:
+        if env is None:
+          env = env_factory(index)
+        if command == _reset:
+          buffers.observations[index] = env.reset()
+        else:
+          observation, reward, done, info = env.step(buffers.actions[index])
+          if done:
+            buffers.terminal_observations[index] = observation
+            observation = env.reset()
+          buffers.observations[index] = observation
+          buffers.rewards[index] = reward
+          buffers.dones[index] = done
+          # only non-empty infos are pickled, e.g. termination and penalty at the end of an episode
+          if info:
+            infos.put((index, info))
+            buffers.info[index] = 1
+        buffers.failed[index] = 0
+      except Exception:
+        buffers.failed[index] = 1
+        errors.put((index, traceback.format_exc()))
+      finished.release()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    if env is not None:
+      env.close()
+    del buffers
+    memory.close()
+
+class SubprocGodotCarVecEnv(VectorEnv):
+  """N GodotCarEnvs in worker processes that exchange observations, rewards, dones and actions through shared memory.
+
+  Per step, every worker is woken by its own semaphore and reports back on a common one; only the info dicts of
+  the envs that are not empty (e.g. termination and penalty at the end of an episode) are pickled and sent through
+  a queue. step_async(actions[N,3]) starts the step of all workers, step_wait returns observations[N,9],
+  rewards[N], dones[N] and the info dict of every car: finished cars are reset by their worker, their last
+  observation is in the info under 'terminal_observation'.
+  env_factory(worker_index) creates the env of a worker (in the worker), by default GodotCarEnv(**env_kwargs).
+  copy: return copies of the shared buffers, otherwise views that the next step overwrites.
+  timeout: seconds step_wait and reset_wait wait for all workers, None waits until a worker dies. After a
+  timeout or a dead worker the env can only be closed, late answers of the workers would mix into the next step.
+  Needs Python 3.8 or later for multiprocessing.shared_memory.
+  """
+  def __init__(self, num_envs, env_factory=None, copy=True, timeout=None, context=None, **env_kwargs):
+    self.copy = copy
+    self.timeout = timeout
+    self.env_factory = env_factory or _EnvFactory(env_kwargs)
+    low = np.array([0, 0, 0, 0, 0, 0, -math.pi, 0, 0], dtype=np.float32)
+    high = np.array([100, 100, 100, 100, 100, 100, +math.pi, 1280, 600], dtype=np.float32)
+    self.action_low = np.array([0, 0, -0.8], dtype=np.float32)
+    self.action_high = np.array([1, 1, +0.8], dtype=np.float32)
+    super().__init__(num_envs,
+                     spaces.Box(low, high, dtype=np.float32),
+                     spaces.Box(self.action_low, self.action_high, dtype=np.float32))
+    # multiprocessing.shared_memory is new in Python 3.8, the other envs also work on 3.7
+    from multiprocessing import shared_memory
+    context = context or multiprocessing.get_context()
+    self._memory = shared_memory.SharedMemory(create=True, size=_SharedBuffers.Size(num_envs))
+    self._buffers = _SharedBuffers(self._memory.buf, num_envs)
+    self._finished = context.Semaphore(0)
+    self._errors = context.SimpleQueue()
+    self._infos = context.SimpleQueue()
+    self._go = [context.Semaphore(0) for _ in range(num_envs)]
+    self._processes = []
+    self._waiting = False
+    self._broken = None
+    try:
+      for index in range(num_envs):
+        process = context.Process(target=_WorkerMain,
+                                  args=(index, num_envs, self._memory.name, self.env_factory,
+                                        self._go[index], self._finished, self._errors, self._infos),
+                                  daemon=True)
+        process.start()
+        self._processes.append(process)
+    except BaseException:
+      self.close_extras(terminate=True)
+      raise
+  def _Send(self, command):
+    if self._broken is not None:
+      raise RuntimeError("SubprocGodotCarVecEnv is unusable after: {}".format(self._broken))
+    if self._waiting:
+      raise RuntimeError("Call step_wait/reset_wait before sending the next command")
+    self._buffers.command[0] = command
+    for go in self._go:
+      go.release()
+    self._waiting = True
+  def _Wait(self):
+    """Wait for all workers and return the info dicts they sent."""
+    deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+    for _ in range(self.num_envs):
+      while not self._finished.acquire(timeout=0.5 if deadline is None else max(0.0, min(0.5, deadline - time.monotonic()))):
+        dead = [process.pid for process in self._processes if not process.is_alive()]
+        if dead:
+          self._broken = "Worker processes {} of SubprocGodotCarVecEnv died".format(dead)
+          raise RuntimeError(self._broken)
+        if deadline is not None and time.monotonic() >= deadline:
+          self._broken = "Workers of SubprocGodotCarVecEnv did not answer within {} s".format(self.timeout)
+          raise TimeoutError(self._broken)
+    self._waiting = False
+    infos = [{} for _ in range(self.num_envs)]
+    for _ in range(int(self._buffers.info.sum())):
+      index, info = self._infos.get()
+      infos[index] = info
+    if self._buffers.failed.any():
+      failures = []
+      while not self._errors.empty():
+        failures.append("worker {:d}:\n{}".format(*self._errors.get()))
+      raise RuntimeError("Env of SubprocGodotCarVecEnv failed\n" + "\n".join(failures))
+    return infos
+  def _Result(self, array):
+    return array.copy() if self.copy else array
+  def reset_async(self):
+    self._Send(_reset)
+  def reset_wait(self, **kwargs):
+    self._Wait()
+    return self._Result(self._buffers.observations)
+  def step_async(self, actions):
+    self._buffers.actions[:] = np.asarray(actions, dtype=np.float32).reshape(self.num_envs, 3)
+    self._Send(_step)
+  def step_wait(self, **kwargs):
+    infos = self._Wait()
+    buffers = self._buffers
+    dones = buffers.dones != 0
+    for idx in np.flatnonzero(dones):
+      infos[idx]['terminal_observation'] = buffers.terminal_observations[idx].copy()
+    return self._Result(buffers.observations), buffers.rewards.astype(np.float64), dones, infos
+  def close_extras(self, timeout=5.0, terminate=False, **kwargs):
+    if self._broken is not None:
+      terminate = True
+    if self._waiting and not terminate:
+      try:
+        self._Wait()
+      except (RuntimeError, TimeoutError):
+        terminate = True
+    self._waiting = False
+    if not terminate:
+      self._buffers.command[0] = _close
+      for go in self._go:
+        go.release()
+    for process in self._processes:
+      if not terminate:
+        process.join(timeout)
+      if process.is_alive():
+        process.terminate()
+        process.join()
+    self._processes = []
+    self._buffers = None
+    self._memory.unlink()
+    try:
+      self._memory.close()
+    except BufferError:
+      pass # views returned with copy=False are still alive, the mapping goes with them
+
+class _EnvFactory():
+  """Picklable factory of GodotCarEnv(**env_kwargs), for start methods other than fork."""
+  def __init__(self, env_kwargs):
+    self.env_kwargs = env_kwargs
+  def __call__(self, worker_index):
+    return GodotCarEnv(**self.env_kwargs)
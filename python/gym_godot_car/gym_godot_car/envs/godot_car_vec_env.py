@@ -0,0 +1,61 @@
+from gym import spaces
+from gym.vector import VectorEnv
+
+import numpy as np
+import math
+
+from gym_godot_car.sim.car import CarBatch
+
+class GodotCarVecEnv(VectorEnv):
+  """N cars of the Python simulator stepped as one batch, finished cars are reset automatically.
+
+  step(actions[N,3]) returns observations[N,9], rewards[N], dones[N] and one info dict per car,
+  the info of a finished car holds its last observation under 'terminal_observation'.
+  get_state(index) returns a snapshot (CarState) of a car, set_state(state, indices) puts all cars or the
+  given ones into it and returns the observations, e.g. to branch N rollouts from one state.
+  """
+  def __init__(self, num_envs, track=None):
+    self.cars = CarBatch(num_envs, track)
+    self.min_reward = -25
+    self.max_reward = 14000
+    low = np.array([0, 0, 0, 0, 0, 0, -math.pi, 0, 0], dtype=np.float32)
+    high = np.array([100, 100, 100, 100, 100, 100, +math.pi, 1280, 600], dtype=np.float32)
+    self.action_low = np.array([0, 0, -0.8], dtype=np.float32)
+    self.action_high = np.array([1, 1, +0.8], dtype=np.float32)
+    super().__init__(num_envs,
+                     spaces.Box(low, high, dtype=np.float32),
+                     spaces.Box(self.action_low, self.action_high, dtype=np.float32))
+    self._actions = np.zeros((num_envs, 3))
+    self._total_rewards = np.zeros(num_envs)
+    self._observations = np.zeros((num_envs, 9), dtype=np.float32)
+  def reset_wait(self, **kwargs):
+    self.cars.Reset()
+    self._total_rewards[:] = 0.0
+    return self.cars.GetObservation(out=self._observations).copy()
+  def get_state(self, index=0):
+    return self.cars.GetState(index)
+  def set_state(self, state, indices=None):
+    mask = slice(None) if indices is None else np.asarray(indices)
+    self.cars.SetState(state, mask)
+    self._total_rewards[mask] = self.cars.GetScore()[mask]
+    return self.cars.GetObservation(out=self._observations).copy()
+  def step_async(self, actions):
+    np.clip(np.asarray(actions, dtype=np.float64).reshape(self.num_envs, 3), self.action_low, self.action_high, out=self._actions)
+  def step_wait(self, **kwargs):
+    self.cars.Control(self._actions)
+    self.cars.Step()
+    score = self.cars.GetScore()
+    rewards = score - self._total_rewards
+    self._total_rewards[:] = score
+    dones = self.cars.crash | (score < self.min_reward) | (score > self.max_reward)
+    observations = self.cars.GetObservation(out=self._observations).copy()
+    infos = [{} for _ in range(self.num_envs)]
+    if dones.any():
+      for idx in np.flatnonzero(dones):
+        infos[idx]['terminal_observation'] = observations[idx].copy()
+      self.cars.Reset(dones)
+      self._total_rewards[dones] = 0.0
+      observations[dones] = self.cars.GetObservation(out=self._observations)[dones]
+    return observations, rewards, dones, infos
+  def close_extras(self, **kwargs):
+    self.cars = None
@@ -0,0 +1,270 @@
+"""
+Parallel evaluation of NEAT genomes with long-lived worker processes.
+
+Unlike neat.ParallelEvaluator every worker keeps its environment (and with it the
+connection to the simulation server) for the whole run, genomes are sent to the
+workers in chunks:
+
+    def make_env(worker_index):
+        return gym.make('godot-car-v0')
+
+    def eval_genome(genome, config, env):
+        ... # run one or more episodes in env and return the fitness
+
+    with ParallelEnvEvaluator(4, eval_genome, make_env, timeout=60) as evaluator:
+        winner = population.run(evaluator.evaluate)
+"""
+
+import collections
+import math
+import multiprocessing
+import multiprocessing.connection
+import time
+
+from gym_godot_car.profiler import CountSteps
+
+
+def _WorkerMain(connection, worker_index, env_factory, eval_function):
+    """Loop of a worker process: evaluate the genomes of each chunk and send back one result per genome (see EvaluateGenome)."""
+    env = None
+    config = None
+    try:
+        while True:
+            message = connection.recv()
+            if message is None:
+                break
+            kind, payload = message
+            if kind == 'config':
+                config = payload
+                continue
+            for genome_id, genome in payload:
+                env, result = EvaluateGenome(genome_id, genome, config, env, worker_index, env_factory, eval_function)
+                connection.send(result)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        _CloseEnv(env)
+
+
+def EvaluateGenome(genome_id, genome, config, env, worker_index, env_factory, eval_function):
+    """Evaluate one genome in env (created by env_factory if None), returns the env to use next and the result.
+
+    The result is (genome_id, fitness, error, seconds, steps, cacheable), fitness is None if eval_function raised.
+    The env is closed then and None is returned instead. steps is None unless the env counts them (see
+    profiler.StepCounter). cacheable is False if a rule of the env's TerminationPolicy cut an episode short that
+    depends on more than the genome (see TerminationRule.deterministic).
+    """
+    try:
+        if env is None:
+            env = env_factory(worker_index)
+        steps = getattr(env, 'total_steps', None)
+        termination = getattr(env, 'termination', None)
+        cut = termination.cut if termination is not None else 0
+        start = time.perf_counter()
+        fitness = eval_function(genome, config, env)
+        seconds = time.perf_counter() - start
+        if steps is not None:
+            steps = env.total_steps - steps
+        cacheable = termination is None or termination.cut == cut
+    except Exception as exception:
+        # the env or its connection is in an unknown state, rebuild it for the next genome
+        _CloseEnv(env)
+        return None, (genome_id, None, repr(exception), None, None, False)
+    return env, (genome_id, fitness, None, seconds, steps, cacheable)
+
+
+def _CloseEnv(env):
+    if env is not None:
+        try:
+            env.close()
+        except Exception:
+            pass
+
+
+def EvaluateWithCache(cache, genomes, config, evaluate):
+    """Sets the fitness of the genomes from cache (a FitnessCache or None), evaluate(genomes, config) does the rest.
+
+    Only the first genome of each network that is not in the cache is passed to evaluate, which returns the ids
+    of the genomes whose fitness is not cached: those that got the failure fitness and those whose result is not
+    cacheable (see EvaluateGenome).
+    """
+    if cache is None:
+        evaluate(genomes, config)
+        return
+    keys = {}
+    first = {}
+    for genome_id, genome in genomes:
+        key = keys[genome_id] = cache.Key(genome, config)
+        if key in first:
+            continue
+        fitness = cache.Get(key)
+        if fitness is None:
+            first[key] = (genome_id, genome)
+        else:
+            genome.fitness = fitness
+    failed = evaluate(list(first.values()), config)
+    for key, (genome_id, genome) in first.items():
+        if genome_id not in failed:
+            cache.Put(key, genome.fitness)
+    for genome_id, genome in genomes:
+        if keys[genome_id] in first:
+            genome.fitness = first[keys[genome_id]][1].fitness
+
+
+class _Worker():
+    def __init__(self, worker_index, env_factory, eval_function, context):
+        self.index = worker_index
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_WorkerMain,
+                                       args=(child_connection, worker_index, env_factory, eval_function),
+                                       daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.config = None
+        self.chunk = collections.deque() # genomes sent but not answered yet, the first one is running
+        self.started = 0.0
+
+    def Send(self, chunk, config):
+        if self.config is not config:
+            self.connection.send(('config', config))
+            self.config = config
+        self.connection.send(('chunk', chunk))
+        self.chunk.extend(chunk)
+        self.started = time.monotonic()
+
+    def Stop(self, timeout=1.0):
+        try:
+            self.connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.connection.close()
+
+    def Kill(self):
+        self.process.terminate()
+        self.process.join()
+        self.connection.close()
+
+
+class ParallelEnvEvaluator():
+    """Evaluates genomes in num_workers processes that each own one environment.
+
+    eval_function(genome, config, env) returns the fitness of one genome, env_factory(worker_index)
+    creates the environment of a worker. A genome that takes longer than timeout seconds, raises or
+    whose worker dies is retried up to retries times and then gets failure_fitness; the affected
+    worker (or only its env, if eval_function raised) is rebuilt.
+    chunk_size: genomes per message, by default the population is split into 4 chunks per worker.
+    cache: FitnessCache (see gym_godot_car.cache), genomes whose network is in it are not evaluated and
+    genomes of the same network are evaluated once. Failures are not cached.
+    profiler: TrainingProfiler (see gym_godot_car.profiler), gets the evaluation time and the simulated steps of every
+    evaluated genome, the envs of the workers are wrapped in a StepCounter for this.
+    """
+    def __init__(self, num_workers, eval_function, env_factory, timeout=None, chunk_size=None,
+                 retries=1, failure_fitness=-25.0, context=None, cache=None, profiler=None):
+        self.num_workers = num_workers
+        self.eval_function = eval_function
+        self.env_factory = CountSteps(env_factory) if profiler is not None else env_factory
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.failure_fitness = failure_fitness
+        self.context = context if context is not None else multiprocessing.get_context()
+        self.cache = cache
+        self.profiler = profiler
+        self.restarts = 0
+        self.failures = 0
+        self.workers = [self._StartWorker(idx) for idx in range(num_workers)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _StartWorker(self, worker_index):
+        return _Worker(worker_index, self.env_factory, self.eval_function, self.context)
+
+    def _RestartWorker(self, worker):
+        worker.Kill()
+        self.restarts += 1
+        replacement = self._StartWorker(worker.index)
+        self.workers[self.workers.index(worker)] = replacement
+        return replacement
+
+    def close(self):
+        for worker in self.workers:
+            worker.Stop()
+        self.workers = []
+
+    def evaluate(self, genomes, config):
+        EvaluateWithCache(self.cache, list(genomes), config, self._Evaluate)
+
+    def _Evaluate(self, genomes, config):
+        """Evaluate all genomes, returns the ids of those that got failure_fitness or a fitness that is not cacheable."""
+        by_id = {genome_id: genome for genome_id, genome in genomes}
+        chunk_size = self.chunk_size or max(1, math.ceil(len(genomes) / (4 * self.num_workers)))
+        pending = collections.deque(genomes[idx:idx+chunk_size] for idx in range(0, len(genomes), chunk_size))
+        attempts = collections.Counter()
+        remaining = len(genomes)
+        failed = set()
+        uncacheable = set()
+
+        def Fail(genome_id):
+            # retry a failed genome as a chunk of its own or give up on it
+            nonlocal remaining
+            attempts[genome_id] += 1
+            if attempts[genome_id] > self.retries:
+                by_id[genome_id].fitness = self.failure_fitness
+                self.failures += 1
+                failed.add(genome_id)
+                remaining -= 1
+            else:
+                pending.append([(genome_id, by_id[genome_id])])
+
+        def Abandon(worker):
+            # the first genome of the worker is the one that failed, the rest is sent to other workers
+            chunk = worker.chunk
+            Fail(chunk.popleft()[0])
+            if chunk:
+                pending.append(list(chunk))
+            self._RestartWorker(worker)
+
+        while remaining > 0:
+            for worker in list(self.workers):
+                if not worker.chunk and pending:
+                    if not worker.process.is_alive():
+                        worker = self._RestartWorker(worker)
+                    worker.Send(pending.popleft(), config)
+            busy = [worker for worker in self.workers if worker.chunk]
+            wait_timeout = None
+            if self.timeout is not None:
+                wait_timeout = max(0.0, min(worker.started for worker in busy) + self.timeout - time.monotonic())
+            ready = multiprocessing.connection.wait([worker.connection for worker in busy] +
+                                                    [worker.process.sentinel for worker in busy], wait_timeout)
+            for worker in busy:
+                if worker.connection in ready:
+                    try:
+                        while worker.chunk and worker.connection.poll():
+                            genome_id, fitness, _, seconds, steps, cacheable = worker.connection.recv()
+                            worker.chunk.popleft()
+                            worker.started = time.monotonic()
+                            if fitness is None:
+                                Fail(genome_id)
+                            else:
+                                by_id[genome_id].fitness = fitness
+                                remaining -= 1
+                                if not cacheable:
+                                    uncacheable.add(genome_id)
+                                if self.profiler is not None:
+                                    self.profiler.RecordGenome(genome_id, by_id[genome_id], seconds, steps)
+                    except (EOFError, OSError):
+                        Abandon(worker)
+                        continue
+                if worker.chunk and (worker.process.sentinel in ready and not worker.process.is_alive()):
+                    Abandon(worker)
+                elif worker.chunk and self.timeout is not None and time.monotonic() - worker.started > self.timeout:
+                    Abandon(worker)
+        return failed | uncacheable
@@ -0,0 +1,182 @@
+"""
+NEAT feed-forward networks (config-feedforward: sum aggregation, sigmoid activation)
+compiled into layered matrix form and evaluated with NumPy.
+
+The scaling of the observation into [0, 1] is folded into the weights of the input
+connections and the scaling of the outputs to the action of the env is one affine
+step, so a network maps a raw observation of GodotCarEnv directly to its action:
+
+    net = MatrixNetwork.create(genome, config)
+    action = net.activate(observation)                       # (9,) -> (3,)
+
+    nets = MatrixNetwork.create_population(genomes, config)  # P networks
+    actions = nets.activate(observations)                    # (P, 9) or (P, B, 9) -> (P, 3) or (P, B, 3)
+"""
+
+import math
+
+import numpy as np
+from neat.graphs import feed_forward_layers
+
+# observation = sensor_readings[0..4], velocity_longitudinal, psi, position.x, position.y
+max_sensor_range = 100.0
+min_velocity =    0.0
+max_velocity = +100.0
+min_psi = -math.pi
+max_psi = +math.pi
+max_pos_x = 1280.0
+max_pos_y = 600.0
+observation_scale = np.array([1.0/max_sensor_range]*5 + [1.0/(max_velocity-min_velocity),
+                                                         1.0/(max_psi-min_psi),
+                                                         1.0/max_pos_x,
+                                                         1.0/max_pos_y])
+observation_offset = np.array([0.0]*5 + [-min_velocity/(max_velocity-min_velocity),
+                                         -min_psi/(max_psi-min_psi),
+                                         0.0,
+                                         0.0])
+
+# action = throttle, brake, steering; the network outputs are in [0, 1]
+min_steer = -1.0
+max_steer = +1.0
+action_scale = np.array([1.0, 1.0, max_steer-min_steer])
+action_offset = np.array([0.0, 0.0, min_steer])
+
+sigmoid_factor = 5.0 # neat.activations.sigmoid_activation uses sigmoid(5 z)
+
+def ScaleObservation(observation):
+    """Observation scaled into (approximately) [0, 1], as the networks see it."""
+    return np.asarray(observation, dtype=np.float64) * observation_scale + observation_offset
+
+
+def ScaleAction(output):
+    """Network output in [0, 1] scaled to the action of the env."""
+    return np.asarray(output, dtype=np.float64) * action_scale + action_offset
+
+
+class MatrixNetwork():
+    """P feed-forward networks padded to the same layered matrix form.
+
+    Every network has a value vector [-1, inputs..., L layers of K node slots], index 0 stands for
+    outputs that are not connected. Layer l computes its K slots from all values in front of it:
+        values[start_l:start_l+K] = tanh(values[:start_l] @ weights[l][:start_l] + biases[l])
+    neat's sigmoid(5 z) equals 0.5 + 0.5 tanh(2.5 z); the factor, the response and the affine step from
+    tanh back to sigmoid are folded into the weights and biases of the following layers and into
+    action_scale and action_offset.
+    """
+    def __init__(self, weights, biases, outputs, num_inputs, action_scale=None, action_offset=None):
+        self.weights = np.asarray(weights, dtype=np.float64)  # (P, L, D, K)
+        self.biases = np.asarray(biases, dtype=np.float64)    # (P, L, K)
+        self.outputs = np.asarray(outputs, dtype=np.intp)     # (P, num_outputs), indices into the value vector
+        self.num_inputs = int(num_inputs)
+        self.action_scale = np.asarray(action_scale if action_scale is not None else 0.5 * np.ones(self.outputs.shape[1]), dtype=np.float64)
+        self.action_offset = np.asarray(action_offset if action_offset is not None else 0.5 * np.ones(self.outputs.shape[1]), dtype=np.float64)
+        self.num_networks, self.num_layers, self.num_values, self.layer_size = self.weights.shape
+        self._starts = [1 + self.num_inputs + layer * self.layer_size for layer in range(self.num_layers)]
+        # per layer only the rows in front of it are used
+        self._layer_weights = [np.ascontiguousarray(self.weights[:, layer, :start, :]) for layer, start in enumerate(self._starts)]
+        self._layer_biases = [self.biases[:, layer, np.newaxis, :] for layer in range(self.num_layers)]
+        self._outputs = self.outputs[:, np.newaxis, :]
+        self._values = np.full(self.num_values, -1.0) # value vector of the single network path
+        self._z = np.empty(self.layer_size)
+
+    def __len__(self):
+        return self.num_networks
+
+    @classmethod
+    def create(cls, genome, config, scaled=True):
+        """Compile one genome, scaled=False keeps the raw network (inputs and outputs as in neat)."""
+        return cls.create_population([genome], config, scaled)
+
+    @classmethod
+    def create_population(cls, genomes, config, scaled=True):
+        """Compile a list of genomes (or (genome_id, genome) pairs) into one batch of networks."""
+        genomes = [genome[1] if isinstance(genome, tuple) else genome for genome in genomes]
+        genome_config = config.genome_config
+        input_keys = genome_config.input_keys
+        output_keys = genome_config.output_keys
+        num_inputs = len(input_keys)
+        compiled = []
+        for genome in genomes:
+            connections = [cg.key for cg in genome.connections.values() if cg.enabled]
+            layers = [sorted(layer) for layer in feed_forward_layers(input_keys, output_keys, connections)]
+            compiled.append((genome, connections, layers))
+        num_layers = max(1, max(len(layers) for _, _, layers in compiled))
+        layer_size = max(1, max((len(layer) for _, _, layers in compiled for layer in layers), default=1))
+        num_values = 1 + num_inputs + num_layers * layer_size
+
+        # first as in neat: node = sigmoid(5 * (bias + response * sum(weight * value)))
+        weights = np.zeros((len(genomes), num_layers, num_values, layer_size))
+        biases = np.zeros((len(genomes), num_layers, layer_size))
+        outputs = np.zeros((len(genomes), len(output_keys)), dtype=np.intp)
+        for idx, (genome, connections, layers) in enumerate(compiled):
+            index = {key: 1 + position for position, key in enumerate(input_keys)}
+            for layer, nodes in enumerate(layers):
+                for slot, node in enumerate(nodes):
+                    index[node] = 1 + num_inputs + layer * layer_size + slot
+            for layer, nodes in enumerate(layers):
+                for slot, node in enumerate(nodes):
+                    gene = genome.nodes[node]
+                    if gene.activation != 'sigmoid' or gene.aggregation != 'sum':
+                        raise ValueError("Only sum aggregation and sigmoid activation can be compiled, node {} uses {}/{}".format(
+                            node, gene.aggregation, gene.activation))
+                    biases[idx, layer, slot] = sigmoid_factor * gene.bias
+                    for key in connections:
+                        if key[1] == node:
+                            weights[idx, layer, index[key[0]], slot] += sigmoid_factor * gene.response * genome.connections[key].weight
+            outputs[idx] = [index.get(key, 0) for key in output_keys]
+
+        # nodes hold t = tanh(z / 2) instead of sigmoid(z) = 0.5 + 0.5 t
+        hidden = slice(1 + num_inputs, num_values)
+        biases += 0.5 * weights[:, :, hidden, :].sum(axis=2)
+        weights[:, :, hidden, :] *= 0.5
+        weights *= 0.5
+        biases *= 0.5
+        if not scaled:
+            return cls(weights, biases, outputs, num_inputs)
+        # w * (scale * x + offset) = (w * scale) * x + w * offset
+        inputs = slice(1, 1 + num_inputs)
+        biases += np.einsum('i,plik->plk', observation_offset, weights[:, :, inputs, :])
+        weights[:, :, inputs, :] *= observation_scale[:, np.newaxis]
+        return cls(weights, biases, outputs, num_inputs, 0.5 * action_scale, 0.5 * action_scale + action_offset)
+
+    def activate(self, observations):
+        """Actions for observations of shape (P, 9) or (P, B, 9); a single network also takes (9,) or (B, 9)."""
+        observations = np.asarray(observations, dtype=np.float64)
+        if self.num_networks == 1 and observations.ndim == 1:
+            return self._ActivateSingle(observations)
+        shape = observations.shape[:-1]
+        if self.num_networks == 1 and observations.ndim == 2:
+            observations = observations[np.newaxis, :, :]
+        elif observations.ndim == 2:
+            observations = observations[:, np.newaxis, :]
+        values = np.full(observations.shape[:2] + (self.num_values,), -1.0)
+        values[:, :, 1:1+self.num_inputs] = observations
+        for start, weights, biases in zip(self._starts, self._layer_weights, self._layer_biases):
+            z = np.matmul(values[:, :, :start], weights)
+            z += biases
+            np.tanh(z, out=values[:, :, start:start+self.layer_size])
+        actions = np.take_along_axis(values, self._outputs, axis=2)
+        actions *= self.action_scale
+        actions += self.action_offset
+        return actions.reshape(shape + (self.outputs.shape[1],))
+
+    def _ActivateSingle(self, observation):
+        values = self._values
+        values[1:1+self.num_inputs] = observation
+        z = self._z
+        for start, weights, biases in zip(self._starts, self._layer_weights, self.biases[0]):
+            np.dot(values[:start], weights[0], out=z)
+            z += biases
+            np.tanh(z, out=values[start:start+self.layer_size])
+        return values[self.outputs[0]] * self.action_scale + self.action_offset
+
+    def save(self, path):
+        """Write the networks to a .npz file, load them again with MatrixNetwork.load(path)."""
+        np.savez(path, weights=self.weights, biases=self.biases, outputs=self.outputs, num_inputs=self.num_inputs,
+                 action_scale=self.action_scale, action_offset=self.action_offset)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['weights'], data['biases'], data['outputs'], int(data['num_inputs']),
+                       data['action_scale'], data['action_offset'])
@@ -0,0 +1,116 @@
+"""
+Parity check of a simulation server against a reference, e.g. Godot in turbo mode.
+
+The same (seeded) random actions are stepped on both and the observations, rewards
+and dones are compared step by step. The reference is the Python stand-in server
+(started in a subprocess), a second server that is already listening, or a recording
+of TrajectoryRecorder whose actions are replayed:
+
+    $ godot_server --turbo &                                  # or xvfb-run -a godot --turbo
+    $ python -m gym_godot_car.parity                          # Godot against the stand-in server
+    $ python -m gym_godot_car.parity --record /tmp/normal     # Godot in normal mode, recorded
+    $ python -m gym_godot_car.parity --reference /tmp/normal  # Godot in turbo mode against that recording
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+from gym_godot_car.benchmark import StartServer
+from gym_godot_car.recorder import TrajectoryReader, TrajectoryRecorder
+
+
+def RandomActions(steps, seed=0):
+    """Uniform random actions in the action space of GodotCarEnv."""
+    rng = np.random.RandomState(seed)
+    return rng.uniform([0.0, 0.0, -0.8], [1.0, 1.0, 0.8], (steps, 3)).astype(np.float32)
+
+
+def Rollout(env, actions):
+    """Step env with actions (reset after every episode), the columns as TrajectoryRecorder stores them."""
+    observations = np.empty((len(actions), 9), dtype=np.float32)
+    rewards = np.empty(len(actions), dtype=np.float32)
+    dones = np.empty(len(actions), dtype=np.uint8)
+    observation = env.reset()
+    for idx, action in enumerate(actions):
+        observations[idx] = observation
+        observation, rewards[idx], dones[idx], _ = env.step(action)
+        if dones[idx]:
+            observation = env.reset()
+    return {'observations': observations, 'rewards': rewards, 'dones': dones}
+
+
+def ServerRollout(ip, port, actions, frame_skip=1, record=None):
+    from gym_godot_car.envs import GodotCarEnv
+    env = GodotCarEnv(ip=ip, port=port, frame_skip=frame_skip)
+    if record:
+        env = TrajectoryRecorder(env, record, force=True)
+    try:
+        return Rollout(env, actions)
+    finally:
+        env.close()
+
+
+def RecordedRollout(directory, steps=None):
+    """Actions and columns of a recording, limited to the first steps."""
+    reader = TrajectoryReader(directory)
+    selected = slice(0, min(steps or reader.steps, reader.steps))
+    return reader.Get('actions', selected), {column: reader.Get(column, selected) for column in ['observations', 'rewards', 'dones']}
+
+
+def CompareRollouts(rollout, reference, tolerance):
+    """Maximum deviations and the first step at which the two rollouts differ by more than tolerance (None if never)."""
+    deviation = np.abs(rollout['observations'].astype(np.float64) - reference['observations'])
+    reward_deviation = np.abs(rollout['rewards'].astype(np.float64) - reference['rewards'])
+    mismatch = (deviation.max(axis=1) > tolerance) | (reward_deviation > tolerance) | (rollout['dones'] != reference['dones'])
+    return {'steps': len(deviation),
+            'max_observation_deviation': deviation.max(axis=0).tolist() if len(deviation) else [],
+            'max_reward_deviation': float(reward_deviation.max()) if len(deviation) else 0.0,
+            'first_mismatch': int(np.argmax(mismatch)) if mismatch.any() else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ip', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=42424, help="server to check")
+    parser.add_argument('--reference-port', type=int, default=42425,
+                        help="reference server, the stand-in server is started on it unless --no-server")
+    parser.add_argument('--no-server', action='store_true', help="use the reference server already listening on --reference-port")
+    parser.add_argument('--reference', help="directory of a recording to replay instead of a reference server")
+    parser.add_argument('--record', help="only record the rollout of the server into this directory")
+    parser.add_argument('--steps', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--frame-skip', type=int, default=1)
+    parser.add_argument('--tolerance', type=float, default=1e-3, help="maximum absolute deviation per value")
+    args = parser.parse_args()
+
+    if args.record:
+        ServerRollout(args.ip, args.port, RandomActions(args.steps, args.seed), args.frame_skip, args.record)
+        print("recorded {} steps into {}".format(args.steps, args.record))
+        return
+    if args.reference:
+        actions, reference = RecordedRollout(args.reference, args.steps)
+    else:
+        actions = RandomActions(args.steps, args.seed)
+        server = None if args.no_server else StartServer(args.ip, args.reference_port)
+        try:
+            reference = ServerRollout(args.ip, args.reference_port, actions, args.frame_skip)
+        finally:
+            if server:
+                server.terminate()
+                server.wait()
+    rollout = ServerRollout(args.ip, args.port, actions, args.frame_skip)
+
+    result = CompareRollouts(rollout, reference, args.tolerance)
+    print("steps:                     {}".format(result['steps']))
+    print("max observation deviation: " + " ".join("{:.3g}".format(value) for value in result['max_observation_deviation']))
+    print("max reward deviation:      {:.3g}".format(result['max_reward_deviation']))
+    if result['first_mismatch'] is not None:
+        print("first mismatch at step {} (tolerance {})".format(result['first_mismatch'], args.tolerance))
+        sys.exit(1)
+    print("parity within tolerance {}".format(args.tolerance))
+
+
+if __name__ == '__main__':
+    main()
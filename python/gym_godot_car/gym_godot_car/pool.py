@@ -0,0 +1,237 @@
+"""
+Pool of simulation server processes on distinct ports.
+
+SimulatorPool starts num_servers servers of a backend, checks their health from a
+background thread, restarts crashed ones on the same port and hands out leases.
+A lease is the address of the server with the fewest leases, so envs and training
+workers spread over all servers:
+
+    with SimulatorPool(4, backend='godot') as pool:
+        with pool.Acquire() as lease:
+            env = GodotCarEnv(ip=lease.ip, port=lease.port)
+
+Backends: 'python' (the stand-in server gym_godot_car.server) and 'godot' (a headless
+Godot in turbo mode, see core/Server.gd and GodotServerBackend for the display it
+needs), or any object with Start(ip, port) -> Popen.
+All processes are stopped by close(), at the latest when the interpreter exits.
+"""
+
+import atexit
+import os
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from gym_godot_car import protocol
+
+default_project_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+                                    'SelfDrivingRLCarGodot')
+# names of the Godot 3 builds that run without a display (server platform and headless editor)
+headless_binaries = ('godot_server', 'godot-server', 'godot_headless', 'godot-headless')
+
+
+def DefaultGodotCommand():
+    """$GODOT, otherwise the first headless build on the PATH, otherwise godot (which needs a display)."""
+    if 'GODOT' in os.environ:
+        return os.environ['GODOT']
+    for name in headless_binaries:
+        if shutil.which(name):
+            return name
+    return 'godot'
+
+
+class PythonServerBackend():
+    """The Python stand-in server, e.g. for tests and machines without Godot."""
+    def __init__(self, text_only=False):
+        self.text_only = text_only
+
+    def Start(self, ip, port):
+        command = [sys.executable, '-m', 'gym_godot_car.server', '--ip', ip, '--port', str(port)]
+        if self.text_only:
+            command.append('--text-only')
+        return subprocess.Popen(command)
+
+
+class GodotServerBackend():
+    """Godot running the project without a window.
+
+    godot_path: Godot command, see DefaultGodotCommand. Godot 3 only honours --no-window on Windows, elsewhere
+    the regular build needs an X server: use a server/headless build or run it under xvfb, e.g.
+    GODOT="xvfb-run -a godot".
+    turbo: step as fast as possible instead of once per physics frame (see core/Server.gd).
+    arguments: further command line arguments of Godot, by default --no-window on Windows.
+    """
+    def __init__(self, godot_path=None, project_path=default_project_path, turbo=True, arguments=None):
+        if arguments is None:
+            arguments = ('--no-window',) if sys.platform == 'win32' else ()
+        self.godot_path = godot_path or DefaultGodotCommand()
+        self.project_path = project_path
+        self.turbo = turbo
+        self.arguments = list(arguments)
+
+    def Start(self, ip, port):
+        command = shlex.split(self.godot_path) + ['--path', self.project_path] + self.arguments + ['--port={:d}'.format(port)]
+        if self.turbo:
+            command.append('--turbo')
+        return subprocess.Popen(command, stdout=subprocess.DEVNULL)
+
+
+backends = {'python': PythonServerBackend, 'godot': GodotServerBackend}
+
+
+def IsListening(ip, port, timeout=0.5):
+    """True if the server accepts a connection, the connection is closed right away with CLOSE."""
+    try:
+        with socket.create_connection((ip, port), timeout=timeout) as connection:
+            connection.sendall(protocol.EncodeText("(CLOSE)"))
+        return True
+    except OSError:
+        return False
+
+
+class Lease():
+    """Address of a server of the pool, return it with Release() or use it as context manager."""
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        self.ip = pool.ip
+        self.port = pool.ports[index]
+
+    @property
+    def address(self):
+        return (self.ip, self.port)
+
+    def Release(self):
+        if self.pool is not None:
+            self.pool.Release(self)
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.Release()
+
+
+class SimulatorPool():
+    """num_servers simulation servers on ports base_port, base_port+1, ... (or the given ports).
+
+    backend: 'python', 'godot' or an object with Start(ip, port) -> Popen.
+    health_interval: seconds between two health checks, a server that exited or stopped accepting
+    connections is restarted on its port. None disables the background checks, CheckHealth() runs them.
+    start_timeout: seconds a (re)started server may take until it accepts connections.
+    """
+    def __init__(self, num_servers, backend='python', ip='127.0.0.1', base_port=42424, ports=None,
+                 health_interval=1.0, start_timeout=30.0):
+        self.backend = backends[backend]() if isinstance(backend, str) else backend
+        self.ip = ip
+        self.ports = list(ports) if ports is not None else [base_port + idx for idx in range(num_servers)]
+        self.health_interval = health_interval
+        self.start_timeout = start_timeout
+        self.restarts = 0
+        self._processes = [None] * len(self.ports)
+        self._leases = [0] * len(self.ports)
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._health_thread = None
+        self._closed = False
+        atexit.register(self.close)
+        try:
+            for index in range(len(self.ports)):
+                self._processes[index] = self.backend.Start(self.ip, self.ports[index])
+            for index in range(len(self.ports)):
+                self._WaitUntilListening(index)
+        except BaseException:
+            self.close()
+            raise
+        if health_interval:
+            self._health_thread = threading.Thread(target=self._HealthMain, daemon=True)
+            self._health_thread.start()
+
+    def __len__(self):
+        return len(self.ports)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def addresses(self):
+        return [(self.ip, port) for port in self.ports]
+
+    def _WaitUntilListening(self, index):
+        deadline = time.monotonic() + self.start_timeout
+        while not IsListening(self.ip, self.ports[index], timeout=0.1):
+            if self._processes[index].poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("Simulation server did not start on {}:{}".format(self.ip, self.ports[index]))
+            time.sleep(0.05)
+
+    def _Stop(self, process, timeout=5.0):
+        if process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def Acquire(self):
+        """Lease on the server with the fewest leases."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The simulator pool is closed")
+            index = min(range(len(self.ports)), key=lambda idx: self._leases[idx])
+            self._leases[index] += 1
+            return Lease(self, index)
+
+    def Release(self, lease):
+        with self._lock:
+            self._leases[lease.index] -= 1
+
+    def Restart(self, index):
+        """Stop the server index (if still running) and start it again on the same port."""
+        with self._lock:
+            if self._closed:
+                return
+            self._Stop(self._processes[index])
+            self._processes[index] = self.backend.Start(self.ip, self.ports[index])
+            self.restarts += 1
+            self._WaitUntilListening(index)
+
+    def CheckHealth(self):
+        """Restart servers that exited or do not accept connections, returns their indices."""
+        restarted = []
+        for index, port in enumerate(self.ports):
+            if self._stop.is_set():
+                break
+            if self._processes[index].poll() is not None or not IsListening(self.ip, port):
+                self.Restart(index)
+                restarted.append(index)
+        return restarted
+
+    def _HealthMain(self):
+        while not self._stop.wait(self.health_interval):
+            try:
+                self.CheckHealth()
+            except RuntimeError as exception:
+                print("Simulator pool health check failed: {}".format(exception))
+
+    def close(self):
+        """Stop the health checks and all servers."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._stop.set()
+        if self._health_thread is not None and self._health_thread is not threading.current_thread():
+            self._health_thread.join()
+        for process in self._processes:
+            if process is not None:
+                self._Stop(process)
+        atexit.unregister(self.close)
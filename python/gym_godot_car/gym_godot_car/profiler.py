@@ -0,0 +1,268 @@
+"""
+Where the time of a NEAT generation goes.
+
+TrainingProfiler splits the wall time of every generation into evaluation, reproduction,
+speciation, checkpointing and the rest (reporters, bookkeeping), and records the simulated
+steps, evaluation time and network size of every evaluated genome. The results are appended
+to CSV files (or written as one JSON document) after each generation:
+
+    profiler = TrainingProfiler(path='neat-profile', profile_generations=[10])
+    profiler.Attach(population)              # after all other reporters were added
+    with ParallelEnvEvaluator(4, eval_genome, make_env, profiler=profiler) as evaluator:
+        winner = population.run(profiler.Timed(evaluator.evaluate, 'evaluation'))
+
+Own code can be timed as a phase of the running generation with `with profiler.Phase('name'):`.
+Generation 10 is also run under cProfile, which only sees the main process (the genomes are
+simulated in the workers), or under any other profile_hook, e.g. a sampling profiler.
+"""
+
+import cProfile
+import collections
+import contextlib
+import csv
+import functools
+import json
+import os
+import time
+
+import gym
+import neat
+import numpy as np
+from neat.reporting import BaseReporter
+
+phases = ('evaluation', 'reproduction', 'speciation', 'checkpointing')
+
+generation_fields = ('generation', 'wall') + phases + ('other', 'genomes', 'steps', 'steps_per_second',
+                                                       'genome_seconds', 'size_time_correlation')
+genome_fields = ('generation', 'genome_id', 'seconds', 'steps', 'steps_per_second', 'nodes', 'connections', 'slowest_rank')
+
+
+def _PhaseNames(recorded):
+    """The standard phases followed by the other recorded ones (Phase with own names), only the JSON output keeps those."""
+    return phases + tuple(name for name in recorded if name not in phases)
+
+
+class StepCounter(gym.Wrapper):
+    """Counts the steps of the env over its whole lifetime in total_steps."""
+    def __init__(self, env):
+        super().__init__(env)
+        self.total_steps = 0
+
+    def step(self, action):
+        self.total_steps += 1
+        return self.env.step(action)
+
+
+class CountSteps():
+    """Wraps the envs of env_factory(worker_index) in a StepCounter, can be pickled if env_factory can."""
+    def __init__(self, env_factory):
+        self.env_factory = env_factory
+
+    def __call__(self, worker_index):
+        return StepCounter(self.env_factory(worker_index))
+
+
+def NetworkSize(genome):
+    """Number of nodes and of enabled connections of the genome."""
+    return len(genome.nodes), sum(1 for cg in genome.connections.values() if cg.enabled)
+
+
+class CProfileHook():
+    """Runs a generation under cProfile and dumps the statistics to <path>-gen<generation>.prof."""
+    def __init__(self, path):
+        self.path = path
+
+    @contextlib.contextmanager
+    def __call__(self, generation):
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats("{}-gen{:d}.prof".format(self.path, generation))
+
+
+class _EndMark(BaseReporter):
+    """Ends phase of the profiler (None: time outside of the phases) when the reporters' end_generation reaches it."""
+    def __init__(self, profiler, phase):
+        self.profiler = profiler
+        self.phase = phase
+
+    def end_generation(self, config, population, species_set):
+        self.profiler._Mark(self.phase)
+
+
+class TrainingProfiler(BaseReporter):
+    """Per-generation phase times and per-genome evaluation statistics of a neat.Population.
+
+    path: prefix of the output, <path>-generations.csv and <path>-genomes.csv or <path>.json (output='json').
+    slowest: the slowest genomes of each generation are printed and ranked in the genome rows.
+    profile_generations: generations run under profile_hook(generation), a context manager, by default cProfile.
+    """
+    def __init__(self, path='neat-profile', output='csv', slowest=5, profile_generations=(), profile_hook=None,
+                 verbose=True):
+        if output not in ('csv', 'json'):
+            raise ValueError("Unknown output '{}', expected 'csv' or 'json'".format(output))
+        self.path = path
+        self.output = output
+        self.slowest = slowest
+        self.profile_generations = set(profile_generations)
+        self.profile_hook = profile_hook or CProfileHook(path)
+        self.verbose = verbose
+        self.generations = []
+        self.genomes = []
+        self._generation = None
+        self._started = None
+        self._phases = None
+        self._genomes = None
+        self._profile = None
+        self._mark = None
+        self._checkpointing = False
+        self._files_started = False
+
+    # neat checkpoints pickle all reporters (through the species set), the measurements stay out of them
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(generations=[], genomes=[], profile_hook=None, _started=None, _phases=None, _genomes=None,
+                     _profile=None, _mark=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # the hook is not checkpointed, restored profilers run their profile_generations under cProfile
+        self.profile_hook = CProfileHook(self.path)
+
+    def Attach(self, population):
+        """Time reproduction, speciation and the reporters that save state, then add the profiler as last reporter.
+
+        Call it after all other reporters were added. Speciation runs between reproduction and the first
+        end_generation, checkpointing from the first reporter that saves state (a neat.Checkpointer or any
+        reporter with a save method) to the profiler. Species set and reporters are pickled by checkpoints,
+        so instead of wrapping their methods the profiler puts marks in front of those reporters.
+        """
+        reproduce = population.reproduction.reproduce
+
+        def Reproduce(*args, **kwargs):
+            with self.Phase('reproduction'):
+                result = reproduce(*args, **kwargs)
+            self._mark = time.perf_counter()
+            return result
+        population.reproduction.reproduce = Reproduce
+        reporters = population.reporters.reporters
+        savers = [index for index, reporter in enumerate(reporters)
+                  if isinstance(reporter, neat.Checkpointer) or callable(getattr(reporter, 'save', None))]
+        if savers:
+            reporters.insert(savers[0], _EndMark(self, None))
+        self._checkpointing = bool(savers)
+        reporters.insert(0, _EndMark(self, 'speciation'))
+        population.add_reporter(self)
+
+    def _Mark(self, phase):
+        now = time.perf_counter()
+        if phase is not None and self._mark is not None and self._phases is not None:
+            self._phases[phase] += now - self._mark
+        self._mark = now
+
+    @contextlib.contextmanager
+    def Phase(self, name):
+        """Adds the time of the with block to phase name of the running generation (if any)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self._phases is not None:
+                self._phases[name] += time.perf_counter() - start
+
+    def Timed(self, function, name):
+        """function, with the time of each call added to phase name."""
+        @functools.wraps(function)
+        def Wrapper(*args, **kwargs):
+            with self.Phase(name):
+                return function(*args, **kwargs)
+        return Wrapper
+
+    def RecordGenome(self, genome_id, genome, seconds, steps=None):
+        """Evaluation time and simulated steps (None if unknown) of a genome of the running generation."""
+        if self._genomes is None:
+            return
+        nodes, connections = NetworkSize(genome)
+        self._genomes.append({'generation': self._generation, 'genome_id': genome_id, 'seconds': seconds,
+                              'steps': steps, 'steps_per_second': steps / seconds if steps and seconds > 0 else None,
+                              'nodes': nodes, 'connections': connections, 'slowest_rank': None})
+
+    def start_generation(self, generation):
+        self._generation = generation
+        self._phases = collections.Counter()
+        self._genomes = []
+        if generation in self.profile_generations:
+            self._profile = self.profile_hook(generation)
+            self._profile.__enter__()
+        self._started = time.perf_counter()
+
+    def post_evaluate(self, config, population, species, best_genome):
+        slowest = sorted(self._genomes, key=lambda row: row['seconds'], reverse=True)[:self.slowest]
+        for rank, row in enumerate(slowest, 1):
+            row['slowest_rank'] = rank
+        if self.verbose and slowest:
+            print("Slowest genomes: " + ", ".join("{:d} ({:.2f} s, {} steps, {:d} connections)".format(
+                row['genome_id'], row['seconds'], row['steps'], row['connections']) for row in slowest))
+
+    def found_solution(self, config, generation, best):
+        self._Finish()
+
+    def end_generation(self, config, population, species_set):
+        if self._checkpointing:
+            self._Mark('checkpointing')
+        self._Finish()
+
+    def _Finish(self):
+        if self._started is None:
+            return
+        wall = time.perf_counter() - self._started
+        self._started = None
+        self._mark = None
+        if self._profile is not None:
+            self._profile.__exit__(None, None, None)
+            self._profile = None
+        phases = self._phases
+        genomes = self._genomes
+        steps = sum(row['steps'] or 0 for row in genomes)
+        seconds = [row['seconds'] for row in genomes]
+        sizes = [row['connections'] for row in genomes]
+        correlation = None
+        if len(genomes) > 2 and np.std(seconds) > 0 and np.std(sizes) > 0:
+            correlation = float(np.corrcoef(sizes, seconds)[0, 1])
+        row = {'generation': self._generation, 'wall': wall}
+        row.update((phase, phases[phase]) for phase in _PhaseNames(phases))
+        row.update({'other': wall - sum(phases.values()), 'genomes': len(genomes), 'steps': steps,
+                    'steps_per_second': steps / phases['evaluation'] if phases['evaluation'] > 0 else None,
+                    'genome_seconds': sum(seconds), 'size_time_correlation': correlation})
+        self.generations.append(row)
+        self.genomes.extend(genomes)
+        self._phases = None
+        self._genomes = None
+        self._Write(row, genomes)
+        if self.verbose:
+            print("Generation time {:.2f} s: ".format(wall) + ", ".join(
+                "{} {:.2f} s ({:.0%})".format(phase, row[phase], row[phase] / wall if wall > 0 else 0.0)
+                for phase in _PhaseNames(phases) + ('other',)))
+
+    def _Write(self, row, genomes):
+        if self.output == 'json':
+            with open(self.path + '.json.tmp', 'w') as f:
+                json.dump({'generations': self.generations, 'genomes': self.genomes}, f)
+            os.replace(self.path + '.json.tmp', self.path + '.json')
+            return
+        mode = 'a' if self._files_started else 'w'
+        with open(self.path + '-generations.csv', mode, newline='') as f:
+            writer = csv.DictWriter(f, generation_fields, extrasaction='ignore')
+            if not self._files_started:
+                writer.writeheader()
+            writer.writerow(row)
+        with open(self.path + '-genomes.csv', mode, newline='') as f:
+            writer = csv.DictWriter(f, genome_fields)
+            if not self._files_started:
+                writer.writeheader()
+            writer.writerows(genomes)
+        self._files_started = True
@@ -0,0 +1,259 @@
+"""
+Messages exchanged between the Python clients and the simulation server (core/Server.gd).
+
+Text protocol (always available):
+    request:  (HEAD:<body length>)<body>, body e.g. (REGISTER), (CONTROL:0.500;0.000;-0.100)
+    REGISTER reply: <uuid>[;BINARY:<version>][;RESET:<version>][;REPEAT:<version>][;STATE:<version>]\n
+    SENSE reply:    score;crash;sensor_0;...;sensor_4;velocity;yaw;pos_x;pos_y\n
+    (servers before the binary protocol send the replies without the terminating newline)
+
+In-band reset (offered with RESET:1 in the REGISTER reply): (RESET) puts the car back to
+its start pose and is answered with a SENSE reply holding the first observation, in the
+format of the last CONTROL of the connection (text if there was none).
+
+Action repeat (offered with REPEAT:1): (CONTROL:throttle;brake;steering;k) or the binary
+CONTROL_REPEAT frame applies the action for k steps, fewer if the car crashes, and is
+answered with one SENSE reply after the last step. The score in the reply already
+contains the reward of all k steps.
+
+State snapshots (offered with STATE:1): (GETSTATE) is answered with the state of the car as
+text line v_1;...;v_19 in the order of sim.CarState (crash as True/False). (SETSTATE:v_1;...;v_19)
+puts the car into such a state, the score follows from its step and distance counters. It is
+answered like RESET with a SENSE reply in the format of the last CONTROL.
+
+Binary protocol (version 1, offered by the server in the REGISTER reply):
+    every frame starts with binary_magic, a command byte and the payload length (uint16),
+    all values are little endian. A client that got ";BINARY:1" with its REGISTER reply may
+    send CONTROL as binary frame and receives the SENSE reply as binary frame.
+    CONTROL payload: throttle, brake, steering (3 x float32)
+    CONTROL_REPEAT payload: throttle, brake, steering (3 x float32), k (uint16)
+    SENSE payload:   score (float32), crash (uint8), 9 x float32 observation
+"""
+
+import select
+import struct
+
+import numpy as np
+
+binary_version = 1
+reset_version = 1
+repeat_version = 1
+state_version = 1
+binary_magic = 0xB1 # never the first byte of a text message, which always starts with '('
+
+command_control = 1
+command_sense = 2
+command_control_repeat = 3
+
+frame_header = struct.Struct('<BBH')
+control_payload = struct.Struct('<3f')
+control_repeat_payload = struct.Struct('<3fH')
+sense_payload = struct.Struct('<fB9f')
+sense_head = struct.Struct('<fB') # score and crash in front of the observation
+
+observation_size = 9
+
+
+def EncodeText(body):
+    """Prefix a text command body like "(REGISTER)" with its (HEAD:n) header."""
+    return "(HEAD:{length:d}){body}".format(length=len(body), body=body).encode('utf-8')
+
+
+def EncodeTextControl(throttle, brake, steering, repeat=1):
+    if repeat > 1:
+        return EncodeText("(CONTROL:{throttle:2.3f};{brake:2.3f};{steer:2.3f};{repeat:d})".format(
+            throttle=throttle, brake=brake, steer=steering, repeat=repeat))
+    return EncodeText("(CONTROL:{throttle:2.3f};{brake:2.3f};{steer:2.3f})".format(throttle=throttle, brake=brake, steer=steering))
+
+
+def EncodeBinaryControl(throttle, brake, steering, repeat=1):
+    if repeat > 1:
+        return (frame_header.pack(binary_magic, command_control_repeat, control_repeat_payload.size) +
+                control_repeat_payload.pack(throttle, brake, steering, repeat))
+    return frame_header.pack(binary_magic, command_control, control_payload.size) + control_payload.pack(throttle, brake, steering)
+
+
+def DecodeBinaryControl(payload):
+    return control_payload.unpack(payload)
+
+
+def DecodeBinaryControlRepeat(payload):
+    """Return throttle, brake, steering and the repeat count of a CONTROL_REPEAT payload."""
+    return control_repeat_payload.unpack(payload)
+
+
+def EncodeTextSense(score, crash, observation, terminated=True):
+    reply = ";".join([str(float(score)), str(bool(crash))] + [str(float(value)) for value in observation])
+    return (reply + "\n" if terminated else reply).encode('ascii')
+
+
+def DecodeTextSense(data, out=None):
+    """Return score, crash and the observation of a text SENSE reply, the observation is written into out if given."""
+    fields = bytes(data).split(b';')
+    if out is None:
+        out = np.empty(observation_size, dtype=np.float32)
+    for idx in range(observation_size):
+        out[idx] = float(fields[2+idx])
+    return float(fields[0]), fields[1] == b'True', out
+
+
+def EncodeBinarySense(score, crash, observation):
+    return frame_header.pack(binary_magic, command_sense, sense_payload.size) + sense_payload.pack(score, bool(crash), *observation)
+
+
+def DecodeBinarySense(data, out=None):
+    """Return score, crash and the observation of a binary SENSE reply (header included), the observation is written into out if given."""
+    score, crash = sense_head.unpack_from(data, frame_header.size)
+    observation = np.frombuffer(data, dtype='<f4', count=observation_size, offset=frame_header.size + sense_head.size)
+    if out is None:
+        return score, bool(crash), observation.copy()
+    out[:] = observation
+    return score, bool(crash), out
+
+
+def DecodeSense(data, out=None):
+    """Decode a text or binary SENSE reply, depending on its first byte."""
+    if data[0] == binary_magic:
+        return DecodeBinarySense(data, out)
+    return DecodeTextSense(data, out)
+
+
+def EncodeTextGetState():
+    return EncodeText("(GETSTATE)")
+
+
+def EncodeTextSetState(state):
+    return EncodeText("(SETSTATE:{})".format(_StateFields(state)))
+
+
+def _StateFields(state):
+    return ";".join([repr(float(value)) for value in state[:-1]] + [str(bool(state[-1]))])
+
+
+def EncodeTextState(state):
+    """Reply to GETSTATE, state in the order of sim.CarState."""
+    return (_StateFields(state) + "\n").encode('ascii')
+
+
+def DecodeStateFields(fields):
+    """Values of a GETSTATE reply or SETSTATE body split at ';' (str or bytes), the last one is crash."""
+    fields = list(fields)
+    crash = fields[-1]
+    return [float(value) for value in fields[:-1]] + [crash in ('True', b'True')]
+
+
+def DecodeState(data):
+    """Values of a GETSTATE reply in the order of sim.CarState."""
+    return DecodeStateFields(bytes(data).strip().split(b';'))
+
+
+def EncodeRegisterResponse(uuid, features=None):
+    """features: dict of the protocol extensions offered by the server, e.g. {'BINARY': 1}. Without any the reply is unterminated."""
+    if not features:
+        return str(uuid).encode('ascii')
+    return (";".join([str(uuid)] + ["{}:{:d}".format(name, version) for name, version in features.items()]) + "\n").encode('ascii')
+
+
+def DecodeRegisterResponse(data):
+    """Return the id of the car and a dict of the protocol extensions offered by the server with their versions."""
+    fields = bytes(data).decode('utf-8').strip().split(';')
+    features = {}
+    for field in fields[1:]:
+        name, _, version = field.partition(':')
+        features[name] = int(version) if version.isdigit() else 0
+    return fields[0], features
+
+
+class ReplyReader():
+    """Splits the byte stream of a socket into single replies.
+
+    Data is received with recv_into into one reusable buffer, so short reads and
+    several replies arriving at once are both handled without allocating per reply.
+    Text replies end with a newline and binary replies carry their length. Servers
+    that do not terminate their text replies are detected in ReadRegisterResponse,
+    for those every recv is taken as exactly one reply as before.
+    """
+    def __init__(self, sock, buffer_size=4096):
+        self._socket = sock
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self.framed = True
+
+    def _Fill(self):
+        if self._end == len(self._buffer):
+            if self._start > 0:
+                pending = self._end - self._start
+                self._buffer[0:pending] = self._buffer[self._start:self._end]
+                self._start, self._end = 0, pending
+            else:
+                raise ValueError("Reply does not fit into the receive buffer of {} bytes".format(len(self._buffer)))
+        received = self._socket.recv_into(self._view[self._end:])
+        if received == 0:
+            raise ConnectionResetError("Connection closed by server")
+        self._end += received
+
+    def _ReplyLength(self):
+        """Length of the first complete reply in the buffer including its terminator, 0 if it is not complete yet."""
+        available = self._end - self._start
+        if available == 0:
+            return 0
+        if self._buffer[self._start] == binary_magic:
+            if available < frame_header.size:
+                return 0
+            length = frame_header.size + frame_header.unpack_from(self._buffer, self._start)[2]
+            return length if available >= length else 0
+        newline = self._buffer.find(b'\n', self._start, self._end)
+        return newline + 1 - self._start if newline >= 0 else 0
+
+    def Read(self, latest=False):
+        """Return the next reply as memoryview, which is only valid until the next call.
+
+        With latest=True older replies that are already buffered completely are skipped.
+        """
+        if not self.framed:
+            self._start = 0
+            self._end = 0
+            self._Fill()
+            self._start = self._end
+            return self._view[0:self._end]
+        length = self._ReplyLength()
+        while length == 0:
+            self._Fill()
+            length = self._ReplyLength()
+        reply = self._start
+        self._start += length
+        while latest:
+            next_length = self._ReplyLength()
+            if next_length == 0:
+                break
+            reply, length = self._start, next_length
+            self._start += length
+        if self._start == self._end:
+            self._start = 0
+            self._end = 0
+        return self._view[reply:reply+length]
+
+    def ReadRegisterResponse(self, grace_period=0.01):
+        """Read the reply to REGISTER and detect whether the server terminates its text replies.
+
+        Newer servers append at least one ";" field and a newline to the id, older ones send the
+        bare id. A reply without either is taken as complete once nothing arrived for grace_period seconds.
+        """
+        while True:
+            if self._ReplyLength() > 0 or self._buffer.find(b';', self._start, self._end) >= 0:
+                self.framed = True
+                return self.Read()
+            if self._end > self._start and not select.select([self._socket], [], [], grace_period)[0]:
+                break
+            self._Fill()
+        self.framed = False
+        reply = bytes(self._view[self._start:self._end])
+        self._start = 0
+        self._end = 0
+        return reply
+
+    def Clear(self):
+        self._start = 0
+        self._end = 0
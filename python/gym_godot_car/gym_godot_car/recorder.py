@@ -0,0 +1,255 @@
+"""
+Recording of trajectories into chunked, memory-mappable arrays and offline replay.
+
+TrajectoryRecorder wraps an env and writes one row per step. Rows are stored column by
+column: the observation the action was taken on, the action, the reward and done. Rows are
+collected in preallocated chunks that a background thread saves as .npy files, so a step
+only copies into memory:
+
+    directory/index.json                 chunk size and steps per chunk
+    directory/episodes.jsonl             [start, length, return, final observation] per finished episode
+    directory/observations-000000.npy    float32 (chunk_steps, 9)
+    directory/actions-000000.npy         float32 (chunk_steps, 3)
+    directory/rewards-000000.npy         float32 (chunk_steps,)
+    directory/dones-000000.npy           uint8   (chunk_steps,)
+
+TrajectoryReader memory-maps the chunks for random access to any step or episode.
+ReplayEnv plays the recorded episodes back as an env, and ReplayPolicy evaluates a policy
+on all recorded observations in batches. Neither needs a simulator.
+"""
+
+import json
+import os
+import queue
+import shutil
+import threading
+
+import gym
+from gym import spaces
+import numpy as np
+
+columns = {'observations': (np.float32, (9,)),
+           'actions': (np.float32, (3,)),
+           'rewards': (np.float32, ()),
+           'dones': (np.uint8, ())}
+index_name = 'index.json'
+episodes_name = 'episodes.jsonl'
+
+
+def ChunkPath(directory, column, chunk):
+    return os.path.join(directory, "{}-{:06d}.npy".format(column, chunk))
+
+
+class TrajectoryRecorder(gym.Wrapper):
+    """Records every step of env into directory, see the module documentation for the layout.
+
+    chunk_steps: rows per chunk file, a full chunk is handed to the writer thread.
+    force: remove an existing recording in directory first, otherwise an existing one is an error.
+    """
+    def __init__(self, env, directory, chunk_steps=65536, force=True):
+        super().__init__(env)
+        if os.path.exists(os.path.join(directory, index_name)):
+            if not force:
+                raise FileExistsError("There is already a recording in {}".format(directory))
+            shutil.rmtree(directory)
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk_steps = chunk_steps
+        self.steps = 0
+        self.episodes = [] # [start, length, return, final observation] of each finished episode
+        self._chunk = 0
+        self._row = 0
+        self._buffers = self._NewBuffers()
+        self._observation = np.zeros(9, dtype=np.float32)
+        self._episode_start = 0
+        self._episode_return = 0.0
+        self._chunk_sizes = []
+        self._flushed_episodes = 0 # episodes handed to the writer
+        self._queue = queue.Queue()
+        self._error = None
+        self._writer = threading.Thread(target=self._WriterMain, daemon=True)
+        self._writer.start()
+
+    def _NewBuffers(self):
+        return {name: np.empty((self.chunk_steps,) + shape, dtype=dtype) for name, (dtype, shape) in columns.items()}
+
+    def _WriterMain(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            chunk, buffers, rows, episodes, index = job
+            try:
+                for name, buffer in buffers.items():
+                    np.save(ChunkPath(self.directory, name, chunk), buffer[:rows])
+                # appended, so a flush costs the same however many episodes were recorded before
+                if episodes:
+                    with open(os.path.join(self.directory, episodes_name), 'a') as f:
+                        f.writelines(json.dumps(episode) + "\n" for episode in episodes)
+                self._WriteIndex(index)
+            except Exception as exception:
+                self._error = exception
+
+    def _WriteIndex(self, index):
+        path = os.path.join(self.directory, index_name)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(index, f)
+        os.replace(path + '.tmp', path)
+
+    def _Flush(self):
+        if self._error:
+            raise self._error
+        if self._row == 0:
+            return
+        self._chunk_sizes.append(self._row)
+        episodes = [[start, length, episode_return, final.tolist()]
+                    for start, length, episode_return, final in self.episodes[self._flushed_episodes:]]
+        self._flushed_episodes = len(self.episodes)
+        index = {'chunk_steps': self.chunk_steps,
+                 'chunk_sizes': list(self._chunk_sizes),
+                 'steps': self.steps}
+        self._queue.put((self._chunk, self._buffers, self._row, episodes, index))
+        self._chunk += 1
+        self._row = 0
+        self._buffers = self._NewBuffers()
+
+    def reset(self, **kwargs):
+        observation = self.env.reset(**kwargs)
+        self._observation[:] = observation
+        self._episode_start = self.steps
+        self._episode_return = 0.0
+        return observation
+
+    def step(self, action):
+        row = self._row
+        buffers = self._buffers
+        buffers['observations'][row] = self._observation
+        buffers['actions'][row] = action
+        observation, reward, done, info = self.env.step(action)
+        buffers['rewards'][row] = reward
+        buffers['dones'][row] = done
+        self._observation[:] = observation
+        self._episode_return += reward
+        self.steps += 1
+        self._row += 1
+        if done:
+            self.episodes.append([self._episode_start, self.steps - self._episode_start, float(self._episode_return),
+                                  self._observation.copy()])
+        if self._row == self.chunk_steps:
+            self._Flush()
+        return observation, reward, done, info
+
+    def close(self):
+        if self._writer.is_alive():
+            self._Flush()
+            self._queue.put(None)
+            self._writer.join()
+            if self._error:
+                raise self._error
+        return self.env.close()
+
+
+class TrajectoryReader():
+    """Random access to a recording of TrajectoryRecorder, the chunks are memory-mapped when first used."""
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, index_name)) as f:
+            index = json.load(f)
+        self.chunk_steps = index['chunk_steps']
+        self.chunk_sizes = index['chunk_sizes']
+        self.steps = sum(self.chunk_sizes)
+        episodes = _ReadEpisodes(os.path.join(directory, episodes_name), self.steps)
+        self.episodes = np.array([episode[:2] for episode in episodes], dtype=np.int64).reshape(-1, 2)
+        self.returns = np.array([episode[2] for episode in episodes])
+        self.final_observations = np.array([episode[3] for episode in episodes], dtype=np.float32).reshape(-1, 9)
+        self._chunks = {}
+
+    def __len__(self):
+        return self.steps
+
+    @property
+    def num_episodes(self):
+        return len(self.episodes)
+
+    def Chunk(self, column, chunk):
+        key = (column, chunk)
+        if key not in self._chunks:
+            self._chunks[key] = np.load(ChunkPath(self.directory, column, chunk), mmap_mode='r')
+        return self._chunks[key]
+
+    def Get(self, column, indices):
+        """Rows of column at the given step indices (int, slice or array) as array."""
+        if isinstance(indices, slice):
+            indices = np.arange(*indices.indices(self.steps))
+        indices = np.asarray(indices, dtype=np.int64)
+        chunks, rows = np.divmod(indices, self.chunk_steps)
+        dtype, shape = columns[column]
+        result = np.empty(indices.shape + shape, dtype=dtype)
+        for chunk in np.unique(chunks):
+            selected = chunks == chunk
+            result[selected] = self.Chunk(column, int(chunk))[rows[selected]]
+        return result
+
+    def Episode(self, episode):
+        """All columns of one finished episode and its final observation."""
+        start, length = self.episodes[episode]
+        data = {column: self.Get(column, slice(start, start + length)) for column in columns}
+        data['final_observation'] = self.final_observations[episode]
+        return data
+
+
+def _ReadEpisodes(path, steps):
+    # episodes are appended before the index is replaced, a crash in between leaves episodes past the
+    # recorded steps (or a cut off line) behind
+    episodes = []
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    episode = json.loads(line)
+                except ValueError:
+                    break
+                if episode[0] + episode[1] > steps:
+                    break
+                episodes.append(episode)
+    return episodes
+
+
+class ReplayEnv(gym.Env):
+    """Plays the recorded episodes back one after another, the actions passed to step are ignored.
+
+    info['recorded_action'] holds the action that was taken in the recording.
+    """
+    def __init__(self, reader):
+        self.reader = reader if isinstance(reader, TrajectoryReader) else TrajectoryReader(reader)
+        self.observation_space = spaces.Box(-np.inf, np.inf, (9,), dtype=np.float32)
+        self.action_space = spaces.Box(np.array([0, 0, -0.8]), np.array([1, 1, +0.8]), dtype=np.float32)
+        self._episode = -1
+        self._data = None
+        self._step = 0
+
+    def reset(self):
+        if self.reader.num_episodes == 0:
+            raise ValueError("The recording in {} has no finished episode".format(self.reader.directory))
+        self._episode = (self._episode + 1) % self.reader.num_episodes
+        self._data = self.reader.Episode(self._episode)
+        self._step = 0
+        return self._data['observations'][0]
+
+    def step(self, action):
+        data = self._data
+        step = self._step
+        self._step += 1
+        done = bool(data['dones'][step])
+        observation = data['final_observation'] if done else data['observations'][step + 1]
+        return observation, float(data['rewards'][step]), done, {'recorded_action': data['actions'][step]}
+
+
+def ReplayPolicy(policy, reader, batch_size=65536):
+    """Actions of policy(observations[B, 9]) -> actions[B, 3] for every recorded step, in batches."""
+    reader = reader if isinstance(reader, TrajectoryReader) else TrajectoryReader(reader)
+    actions = np.empty((reader.steps, 3), dtype=np.float32)
+    for start in range(0, reader.steps, batch_size):
+        end = min(start + batch_size, reader.steps)
+        actions[start:end] = policy(reader.Get('observations', slice(start, end)))
+    return actions
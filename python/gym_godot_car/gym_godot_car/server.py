@@ -0,0 +1,230 @@
+"""
+Reference implementation of the simulation server (core/Server.gd) in Python.
+
+Every connection drives its own car of the Python simulator, so clients can be
+run and tested without Godot. With lockstep=True the cars are stepped together
+once every connection sent a CONTROL, like Server.gd does:
+
+    $ python -m gym_godot_car.server --port 42424
+"""
+
+import argparse
+import socketserver
+import threading
+
+from gym_godot_car import protocol
+from gym_godot_car.sim import Car, CarState, Track
+from gym_godot_car.sim import car as sim_car
+
+
+class CarStatistics():
+    """Score bookkeeping of Car.gd: the maxima of the distance and step counters of the episode,
+    updated after every step before the reply, reset with the car and set from restored states."""
+    def __init__(self):
+        self.Reset()
+
+    def Reset(self):
+        self.max_score = 0.0
+        self.max_distance = 0.0
+        self.max_steps = 0.0
+
+    def Update(self, car):
+        if car.distance_counter > self.max_distance or car.step_counter > self.max_steps:
+            self.max_distance = car.distance_counter
+            self.max_steps = car.step_counter
+        self.max_score = (sim_car.weight_distance * self.max_distance) - (sim_car.weight_steps * self.max_steps)
+
+
+class GodotCarRequestHandler(socketserver.BaseRequestHandler):
+    """Speaks the text and binary protocol of Server.gd on one connection."""
+    def setup(self):
+        self.car = None
+        self.statistics = CarStatistics()
+        self.id = ""
+        self.binary = False # format of the last CONTROL, used for the reply to RESET
+        self.server.Connect(self)
+
+    def finish(self):
+        # also when the client went away without CLOSE, like Server.DropClosedConnections
+        self.server.Disconnect(self)
+
+    def _ReadExactly(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionResetError("Connection closed by client")
+            data += chunk
+        return bytes(data)
+
+    def _ReadTextBody(self, first):
+        header = first + self._ReadExactly(len("(HEAD:") - 1)
+        if header != b"(HEAD:":
+            raise ValueError("Invalid Header Data, expected (HEAD:, got: {}".format(header))
+        size = b""
+        while True:
+            char = self._ReadExactly(1)
+            if char == b")":
+                break
+            size += char
+        return self._ReadExactly(int(size)).decode('utf-8')
+
+    def handle(self):
+        try:
+            while True:
+                first = self._ReadExactly(1)
+                if first[0] == protocol.binary_magic and self.server.binary:
+                    _, command, length = protocol.frame_header.unpack(first + self._ReadExactly(protocol.frame_header.size - 1))
+                    payload = self._ReadExactly(length)
+                    if command == protocol.command_control:
+                        self.binary = True
+                        self.ControlCommand(*protocol.DecodeBinaryControl(payload))
+                        self.request.sendall(self.SenseResponse(binary=True))
+                    elif command == protocol.command_control_repeat:
+                        self.binary = True
+                        self.ControlCommand(*protocol.DecodeBinaryControlRepeat(payload))
+                        self.request.sendall(self.SenseResponse(binary=True))
+                    continue
+                body = self._ReadTextBody(first)
+                if not self.HandleCommand(body):
+                    break
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self.car = None
+
+    def HandleCommand(self, body):
+        """Handle one text command, returns False once the connection should be closed."""
+        if body == "(REGISTER)":
+            self.car = Car(self.server.track)
+            self.statistics.Reset()
+            self.id = self.server.NextId()
+            self.binary = False
+            self.request.sendall(protocol.EncodeRegisterResponse(self.id, self.server.features))
+        elif body == "(RESET)":
+            if self.car:
+                self.car.Reset()
+                self.statistics.Reset()
+                if self.server.binary:
+                    self.request.sendall(self.SenseResponse(binary=self.binary))
+        elif body == "(SENSE)":
+            if self.car:
+                self.request.sendall(self.SenseResponse(binary=False))
+        elif body == "(CLOSE)":
+            return False
+        elif body == "(GETSTATE)":
+            if self.car and self.server.binary:
+                self.request.sendall(protocol.EncodeTextState(self.car.GetState()))
+        elif body.startswith("(SETSTATE:") and body.endswith(")"):
+            values = body[len("(SETSTATE:"):-1].split(';')
+            if self.car and self.server.binary and len(values) == len(CarState._fields):
+                self.car.SetState(protocol.DecodeStateFields(values))
+                self.statistics.Reset()
+                self.statistics.Update(self.car)
+                self.request.sendall(self.SenseResponse(binary=self.binary))
+        elif body.startswith("(CONTROL:") and body.endswith(")"):
+            values = body[len("(CONTROL:"):-1].split(';')
+            if len(values) in (3, 4):
+                self.binary = False
+                repeat = int(values[3]) if len(values) == 4 and self.server.binary else 1
+                self.ControlCommand(float(values[0]), float(values[1]), float(values[2]), repeat)
+                self.request.sendall(self.SenseResponse(binary=False))
+        return True
+
+    def ControlCommand(self, throttle, brake, steering, repeat=1):
+        if self.server.lockstep:
+            self.server.ControlInLockstep(self, throttle, brake, steering, max(1, repeat))
+        elif self.car:
+            self.car.Control(throttle, brake, steering)
+            self.Step(max(1, repeat))
+
+    def Step(self, repeat):
+        if self.car:
+            self.car.Step(repeat)
+            self.statistics.Update(self.car)
+
+    def SenseResponse(self, binary):
+        score = self.statistics.max_score if not self.server.endless_mode else 0.0
+        if binary:
+            return protocol.EncodeBinarySense(score, self.car.crash, self.car.GetObservation())
+        return protocol.EncodeTextSense(score, self.car.crash, self.car.GetObservation(), terminated=self.server.binary)
+
+
+class GodotCarServer(socketserver.ThreadingTCPServer):
+    """Python stand-in for the Godot simulation server, one thread and one car per connection.
+
+    binary=False behaves like a server from before the binary protocol (text only, replies without
+    terminating newline, RESET without reply, no action repeat, no state snapshots).
+    lockstep: step all cars once every connection sent a CONTROL (see Server.StepIfAllControlled), the
+    replies wait for that. Otherwise every CONTROL steps its car right away.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, ip='127.0.0.1', port=42424, binary=True, endless_mode=False, track=None, lockstep=False):
+        self.binary = binary
+        self.endless_mode = endless_mode
+        self.track = track if track is not None else Track()
+        self.lockstep = lockstep
+        self._id_lock = threading.Lock()
+        self._id_counter = 0
+        self._lockstep_condition = threading.Condition()
+        self._connections = set()
+        self._controlled = {} # handler -> repeat count of its CONTROL since the last step
+        self.features = {'BINARY': protocol.binary_version,
+                         'RESET': protocol.reset_version,
+                         'REPEAT': protocol.repeat_version,
+                         'STATE': protocol.state_version} if binary else {}
+        super().__init__((ip, port), GodotCarRequestHandler)
+
+    def NextId(self):
+        with self._id_lock:
+            self._id_counter += 1
+            return "python-{:d}".format(self._id_counter)
+
+    def Connect(self, handler):
+        with self._lockstep_condition:
+            self._connections.add(handler)
+
+    def Disconnect(self, handler):
+        with self._lockstep_condition:
+            self._connections.discard(handler)
+            self._controlled.pop(handler, None)
+            self._StepIfAllControlled()
+
+    def ControlInLockstep(self, handler, throttle, brake, steering, repeat):
+        """Set the inputs of the car of handler and return once all cars were stepped."""
+        with self._lockstep_condition:
+            if handler.car:
+                handler.car.Control(throttle, brake, steering)
+            self._controlled[handler] = repeat
+            self._StepIfAllControlled()
+            self._lockstep_condition.wait_for(lambda: handler not in self._controlled)
+
+    def _StepIfAllControlled(self):
+        if self._controlled and len(self._controlled) >= len(self._connections):
+            for handler, repeat in self._controlled.items():
+                handler.Step(repeat)
+            self._controlled = {}
+            self._lockstep_condition.notify_all()
+
+    def StartInBackground(self):
+        """Serve from a daemon thread and return it, stop again with shutdown()."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ip', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=42424)
+    parser.add_argument('--text-only', action='store_true', help="do not offer the binary protocol")
+    parser.add_argument('--lockstep', action='store_true', help="step the cars together like Server.gd")
+    args = parser.parse_args()
+    with GodotCarServer(args.ip, args.port, binary=not args.text_only, lockstep=args.lockstep) as server:
+        server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2 @@
+from gym_godot_car.sim.track import Track
+from gym_godot_car.sim.car import Car, CarBatch, CarState
@@ -0,0 +1,395 @@
+"""
+Pure Python re-implementation of SelfDrivingRLCarGodot/core/car/Car.gd.
+
+Only the externally controlled car is modelled (no manual control, no UI), the
+score mirrors GameLogic.UpdateStatistics for a single car.
+"""
+
+import collections
+import math
+
+import numpy as np
+
+from gym_godot_car.sim.track import Track
+
+################################################################################
+### Constants (Car.gd)
+
+# Other
+game_factor = 3.0
+
+# Input
+max_steering = 1.0
+
+# Vehicle and World Parameters
+torque_engine_max = 180.0 * game_factor
+i_differential = 4.1
+i_gear = 1.5
+r_wheel = 0.31
+mass_vehicle = 750.0
+c_w = 0.91
+rho = 1.205
+area = 1.72
+rolling_resistance = 1.5
+gravity = 9.81
+friction_coefficient = 1.2 * game_factor
+l_r = 7.0
+l_f = 4.0
+diag_factor = 1/math.sqrt(2)
+sensor_directions = ((0.0, 1.0), (diag_factor, diag_factor), (1.0, 0.0), (diag_factor, -diag_factor), (0.0, -1.0))
+sensor_range = 100.0
+step_size = 0.1 # 100 ms
+
+# move_and_slide() in Car.UpdateNodes moves the car once more by velocity * physics delta (default 60 FPS)
+physics_delta = 1.0/60.0
+
+################################################################################
+### Constants (GameLogic.gd and Car.tscn)
+
+pos_init = (630.0, 280.0)
+rot_init = 0.0
+scale = 0.4
+weight_distance = 1.0
+weight_steps = 1.0
+extents = (26.404 * scale, 11.1734 * scale) # RectangleShape2D of Car.tscn
+
+################################################################################
+### State
+
+# Everything a step of Car.gd depends on, in the order of the STATE protocol messages (see protocol.py).
+# The score follows from step_counter and distance_counter, the sensor readings from the pose.
+CarState = collections.namedtuple('CarState', (
+    'position_x', 'position_y', 'rotation', 'psi', 'velocity_longitudinal', 'x_dot', 'y_dot',
+    'throttle', 'brake', 'steering', 'throttle_external', 'brake_external', 'steering_external', 'force_drive',
+    'step_counter', 'distance_counter', 'last_position_x', 'last_position_y', 'crash'))
+
+_scalar_state = ('rotation', 'psi', 'velocity_longitudinal', 'x_dot', 'y_dot', 'throttle', 'brake', 'steering',
+                 'throttle_external', 'brake_external', 'steering_external', 'force_drive', 'step_counter', 'distance_counter')
+
+
+def StateScore(state):
+    """Score of a car in state, like Car.GetScore."""
+    return (weight_distance * state.distance_counter) - (weight_steps * state.step_counter)
+
+
+def sign(value):
+    if value > 0.0:
+        return 1.0
+    if value < 0.0:
+        return -1.0
+    return 0.0
+
+
+def clamp(value, min_value, max_value):
+    return min(max(value, min_value), max_value)
+
+
+def WrapAngle(angle):
+    if angle >= 0:
+        return math.fmod(angle+math.pi, 2*math.pi) - math.pi
+    else:
+        return math.fmod(angle-math.pi, 2*math.pi) + math.pi
+
+
+def CarCorners(x, y, rotation):
+    """Corners of the collision rectangle of a car at the given pose as array (4, 2)."""
+    cos_rot = math.cos(rotation)
+    sin_rot = math.sin(rotation)
+    corners = []
+    for local_x, local_y in ((extents[0], extents[1]), (-extents[0], extents[1]), (-extents[0], -extents[1]), (extents[0], -extents[1])):
+        corners.append((x + local_x*cos_rot - local_y*sin_rot, y + local_x*sin_rot + local_y*cos_rot))
+    return np.array(corners)
+
+
+def CarCornersBatch(positions, rotations):
+    """Corners (N, 4, 2) of the collision rectangles of cars at positions (N, 2) with rotations (N,)."""
+    positions = np.asarray(positions, dtype=np.float64)
+    rotations = np.asarray(rotations, dtype=np.float64)
+    local = np.array(((extents[0], extents[1]), (-extents[0], extents[1]), (-extents[0], -extents[1]), (extents[0], -extents[1])))
+    cos_rot = np.cos(rotations)[:, None]
+    sin_rot = np.sin(rotations)[:, None]
+    return np.stack((positions[:, None, 0] + local[:, 0]*cos_rot - local[:, 1]*sin_rot,
+                     positions[:, None, 1] + local[:, 0]*sin_rot + local[:, 1]*cos_rot), axis=2)
+
+
+def SensorReadings(track, positions, rotations):
+    """Readings (N, 5) of the sensors of cars at positions (N, 2) with rotations (N,), as Car.CalcSensors casts them."""
+    positions = np.asarray(positions, dtype=np.float64)
+    rotations = np.asarray(rotations, dtype=np.float64)
+    directions = np.array(sensor_directions)
+    cos_rot = np.cos(rotations)[:, None]
+    sin_rot = np.sin(rotations)[:, None]
+    targets = np.stack((positions[:, None, 0] + (directions[:, 0]*cos_rot - directions[:, 1]*sin_rot) * sensor_range,
+                        positions[:, None, 1] + (directions[:, 0]*sin_rot + directions[:, 1]*cos_rot) * sensor_range), axis=2)
+    return track.CastRaysBatch(positions, targets, sensor_range) * sensor_range
+
+
+def CarsCollide(track, positions, rotations):
+    """True (N,) for every car at positions (N, 2) with rotations (N,) whose collision rectangle overlaps a wall."""
+    return track.PolygonsCollide(CarCornersBatch(positions, rotations))
+
+
+class Car():
+    """Single car driven by external control commands, stepping with the fixed step_size of Car.gd."""
+    def __init__(self, track=None):
+        self.track = track if track is not None else Track()
+        self.Reset()
+
+    def Reset(self):
+        self.throttle = 0.0
+        self.brake = 0.0
+        self.steering = 0.0
+        self.throttle_external = 0.0
+        self.brake_external = 0.0
+        self.steering_external = 0.0
+        self.force_drive = 0.0
+        self.velocity_longitudinal = 0.0
+        self.x_dot = 0.0
+        self.y_dot = 0.0
+        self.psi = rot_init
+        self.rotation = rot_init
+        self.position_x, self.position_y = pos_init
+        self.sensor_readings = [0.0, 0.0, 0.0, 0.0, 0.0]
+        self.crash = False
+        self.step_counter = 0.0
+        self.distance_counter = 0.0
+        self.last_position = pos_init
+        self.CalcSensors()
+
+    def Control(self, throttle, brake, steering):
+        self.throttle_external = throttle
+        self.brake_external = brake
+        self.steering_external = steering
+
+    def Step(self, repeat=1):
+        """One call of Car._physics_process after a step command was received, integrating repeat steps (ends early on crash)."""
+        for _ in range(repeat):
+            if self.crash:
+                break
+            self.GetExternalInput()
+            self.CalcDrivingForces()
+            self.CalcKinematicModel()
+            self.UpdateNodes()
+            self.CalcStatistics()
+        self.CalcSensors()
+
+    def GetExternalInput(self):
+        self.throttle = clamp(self.throttle_external, 0, 1)
+        self.brake = clamp(self.brake_external, 0, 1)
+        self.steering = clamp(self.steering_external, -max_steering, max_steering)
+
+    def CalcDrivingForces(self):
+        force_engine = self.throttle * torque_engine_max * i_differential * i_gear / r_wheel
+        force_brake = -1 * self.brake * mass_vehicle * gravity * friction_coefficient * sign(self.velocity_longitudinal)
+        force_rolling = -1 * rolling_resistance * self.velocity_longitudinal
+        force_drag = -1 * 0.5 * c_w * rho * area * self.velocity_longitudinal * self.velocity_longitudinal * sign(self.velocity_longitudinal)
+        self.force_drive = force_engine + force_brake + force_rolling + force_drag
+
+    def CalcKinematicModel(self):
+        acceleration = self.force_drive / mass_vehicle
+        self.velocity_longitudinal += acceleration * step_size
+        if self.velocity_longitudinal < 0:
+            self.velocity_longitudinal = 0.0
+        beta = math.atan(l_r/(l_r+l_f) * math.tan(self.steering))
+        psi_dot = self.velocity_longitudinal/l_r * math.sin(beta)
+        self.psi += psi_dot * step_size * game_factor
+        self.psi = WrapAngle(self.psi)
+        self.x_dot = self.velocity_longitudinal * math.cos(self.psi+beta)
+        self.y_dot = self.velocity_longitudinal * math.sin(self.psi+beta)
+
+    def UpdateNodes(self):
+        # move_and_collide(velocity * delta_step) followed by move_and_slide(velocity), the car is stopped on any wall contact
+        motion_x = self.x_dot * game_factor * (step_size + physics_delta)
+        motion_y = self.y_dot * game_factor * (step_size + physics_delta)
+        corners = CarCorners(self.position_x, self.position_y, self.rotation)
+        moved = corners + (motion_x, motion_y)
+        starts = np.concatenate((corners, moved))
+        ends = np.concatenate((moved, np.roll(moved, 1, axis=0)))
+        self.crash = bool(self.track.Intersects(starts, ends).any())
+        if not self.crash:
+            self.position_x += motion_x
+            self.position_y += motion_y
+        self.rotation = self.psi
+
+    def CalcStatistics(self):
+        self.step_counter += 1.0
+        self.distance_counter += math.hypot(self.position_x - self.last_position[0], self.position_y - self.last_position[1])
+        self.last_position = (self.position_x, self.position_y)
+
+    def CalcSensors(self):
+        cos_rot = math.cos(self.rotation)
+        sin_rot = math.sin(self.rotation)
+        origins = [(self.position_x, self.position_y)] * len(sensor_directions)
+        targets = [(self.position_x + (dx*cos_rot - dy*sin_rot) * sensor_range,
+                    self.position_y + (dx*sin_rot + dy*cos_rot) * sensor_range) for dx, dy in sensor_directions]
+        self.sensor_readings = list(self.track.CastRays(origins, targets) * sensor_range)
+
+    def GetScore(self):
+        return (weight_distance * self.distance_counter) - (weight_steps * self.step_counter)
+
+    def GetObservation(self):
+        """Observation in the layout of the SENSE response: sensor_0..4, velocity_longitudinal, psi, position.x, position.y."""
+        return self.sensor_readings + [self.velocity_longitudinal, self.psi, self.position_x, self.position_y]
+
+    def GetState(self):
+        return CarState(self.position_x, self.position_y, *[getattr(self, name) for name in _scalar_state],
+                        self.last_position[0], self.last_position[1], self.crash)
+
+    def SetState(self, state):
+        """Continue from state (a CarState or sequence in its order), stepping on gives the same trajectory as from where it was taken."""
+        state = CarState(*state)
+        for name in _scalar_state:
+            setattr(self, name, float(getattr(state, name)))
+        self.position_x = float(state.position_x)
+        self.position_y = float(state.position_y)
+        self.last_position = (float(state.last_position_x), float(state.last_position_y))
+        self.crash = bool(state.crash)
+        self.CalcSensors()
+
+
+def WrapAngleBatch(angle):
+    return np.where(angle >= 0, np.fmod(angle+math.pi, 2*math.pi) - math.pi, np.fmod(angle-math.pi, 2*math.pi) + math.pi)
+
+
+class CarBatch():
+    """N cars stepped together, the state of all cars is kept in contiguous arrays and updated with vectorized operations.
+
+    The math is the same as in Car, so car i of the batch follows the trajectory of a single Car given the same controls.
+    """
+    def __init__(self, num_cars, track=None):
+        self.num_cars = num_cars
+        self.track = track if track is not None else Track()
+        self.throttle = np.zeros(num_cars)
+        self.brake = np.zeros(num_cars)
+        self.steering = np.zeros(num_cars)
+        self.throttle_external = np.zeros(num_cars)
+        self.brake_external = np.zeros(num_cars)
+        self.steering_external = np.zeros(num_cars)
+        self.force_drive = np.zeros(num_cars)
+        self.velocity_longitudinal = np.zeros(num_cars)
+        self.x_dot = np.zeros(num_cars)
+        self.y_dot = np.zeros(num_cars)
+        self.psi = np.zeros(num_cars)
+        self.rotation = np.zeros(num_cars)
+        self.position = np.zeros((num_cars, 2))
+        self.sensor_readings = np.zeros((num_cars, len(sensor_directions)))
+        self.crash = np.zeros(num_cars, dtype=bool)
+        self.step_counter = np.zeros(num_cars)
+        self.distance_counter = np.zeros(num_cars)
+        self.last_position = np.zeros((num_cars, 2))
+        self._corners = np.array(((extents[0], extents[1]), (-extents[0], extents[1]), (-extents[0], -extents[1]), (extents[0], -extents[1])))
+        self.Reset()
+
+    def Reset(self, mask=None):
+        """Reset all cars, or only the cars selected by the boolean/index array mask."""
+        if mask is None:
+            mask = slice(None)
+        for state in (self.throttle, self.brake, self.steering,
+                      self.throttle_external, self.brake_external, self.steering_external,
+                      self.force_drive, self.velocity_longitudinal, self.x_dot, self.y_dot,
+                      self.step_counter, self.distance_counter):
+            state[mask] = 0.0
+        self.psi[mask] = rot_init
+        self.rotation[mask] = rot_init
+        self.position[mask] = pos_init
+        self.last_position[mask] = pos_init
+        self.crash[mask] = False
+        self.CalcSensors()
+
+    def Control(self, actions):
+        """Set the external inputs from an array (N, 3) of throttle, brake, steering."""
+        self.throttle_external[:] = actions[:, 0]
+        self.brake_external[:] = actions[:, 1]
+        self.steering_external[:] = actions[:, 2]
+
+    def Step(self):
+        """One Car.Step for all cars, crashed cars keep their state."""
+        active = ~self.crash
+        self.GetExternalInput(active)
+        self.CalcDrivingForces(active)
+        self.CalcKinematicModel(active)
+        self.UpdateNodes(active)
+        self.CalcStatistics(active)
+        self.CalcSensors()
+
+    def GetExternalInput(self, active):
+        np.copyto(self.throttle, np.clip(self.throttle_external, 0, 1), where=active)
+        np.copyto(self.brake, np.clip(self.brake_external, 0, 1), where=active)
+        np.copyto(self.steering, np.clip(self.steering_external, -max_steering, max_steering), where=active)
+
+    def CalcDrivingForces(self, active):
+        velocity = self.velocity_longitudinal
+        force_engine = self.throttle * (torque_engine_max * i_differential * i_gear / r_wheel)
+        force_brake = -1 * self.brake * (mass_vehicle * gravity * friction_coefficient) * np.sign(velocity)
+        force_rolling = -1 * rolling_resistance * velocity
+        force_drag = -1 * 0.5 * c_w * rho * area * velocity * velocity * np.sign(velocity)
+        np.copyto(self.force_drive, force_engine + force_brake + force_rolling + force_drag, where=active)
+
+    def CalcKinematicModel(self, active):
+        acceleration = self.force_drive / mass_vehicle
+        velocity = np.maximum(self.velocity_longitudinal + acceleration * step_size, 0.0)
+        beta = np.arctan(l_r/(l_r+l_f) * np.tan(self.steering))
+        psi_dot = velocity/l_r * np.sin(beta)
+        psi = WrapAngleBatch(self.psi + psi_dot * step_size * game_factor)
+        np.copyto(self.velocity_longitudinal, velocity, where=active)
+        np.copyto(self.psi, psi, where=active)
+        np.copyto(self.x_dot, velocity * np.cos(psi+beta), where=active)
+        np.copyto(self.y_dot, velocity * np.sin(psi+beta), where=active)
+
+    def UpdateNodes(self, active):
+        motion = np.stack((self.x_dot, self.y_dot), axis=1) * (game_factor * (step_size + physics_delta))
+        cos_rot = np.cos(self.rotation)[:, None]
+        sin_rot = np.sin(self.rotation)[:, None]
+        corners = np.stack((self.position[:, None, 0] + self._corners[:, 0]*cos_rot - self._corners[:, 1]*sin_rot,
+                            self.position[:, None, 1] + self._corners[:, 0]*sin_rot + self._corners[:, 1]*cos_rot), axis=2) # (N, 4, 2)
+        moved = corners + motion[:, None, :]
+        starts = np.concatenate((corners, moved), axis=1)
+        ends = np.concatenate((moved, np.roll(moved, 1, axis=1)), axis=1)
+        reach = math.hypot(extents[0], extents[1]) + np.abs(motion).max(initial=0.0) * math.sqrt(2)
+        crash = (self.track.CastRaysBatch(starts, ends, reach, centers=self.position) < 1.0).any(axis=1) & active
+        self.crash |= crash
+        np.add(self.position, motion, out=self.position, where=(active & ~crash)[:, None])
+        np.copyto(self.rotation, self.psi, where=active)
+
+    def CalcStatistics(self, active):
+        self.step_counter += active
+        delta = self.position - self.last_position
+        self.distance_counter += np.where(active, np.hypot(delta[:, 0], delta[:, 1]), 0.0)
+        self.last_position[:] = self.position
+
+    def CalcSensors(self):
+        self.sensor_readings[:] = SensorReadings(self.track, self.position, self.rotation)
+
+    def GetScore(self):
+        return (weight_distance * self.distance_counter) - (weight_steps * self.step_counter)
+
+    def GetObservation(self, out=None):
+        """Observations (N, 9) in the layout of the SENSE response."""
+        if out is None:
+            out = np.empty((self.num_cars, len(sensor_directions) + 4), dtype=np.float32)
+        out[:, 0:5] = self.sensor_readings
+        out[:, 5] = self.velocity_longitudinal
+        out[:, 6] = self.psi
+        out[:, 7:9] = self.position
+        return out
+
+    def GetState(self, index):
+        """CarState of car index."""
+        return CarState(self.position[index, 0], self.position[index, 1],
+                        *[float(getattr(self, name)[index]) for name in _scalar_state],
+                        self.last_position[index, 0], self.last_position[index, 1], bool(self.crash[index]))
+
+    def SetState(self, state, mask=None):
+        """Put all cars, or the cars selected by the boolean/index array mask, into the same state (cloning it).
+
+        Branches of a rollout then start from state without simulating the steps that led there again.
+        """
+        if mask is None:
+            mask = slice(None)
+        state = CarState(*state)
+        for name in _scalar_state:
+            getattr(self, name)[mask] = getattr(state, name)
+        self.position[mask] = (state.position_x, state.position_y)
+        self.last_position[mask] = (state.last_position_x, state.last_position_y)
+        self.crash[mask] = bool(state.crash)
+        self.CalcSensors()
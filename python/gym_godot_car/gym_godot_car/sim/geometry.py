@@ -0,0 +1,333 @@
+"""
+Extraction of the wall segments from the Godot scene files.
+
+The scene (main.tscn) is parsed together with the scenes it instances and the tile
+sets of its TileMaps. Every collision polygon edge of a tile on a colliding layer
+becomes a wall segment in world coordinates. The segments are cached on disk and
+parsed again only when one of the source files changed:
+
+    segments = LoadWallSegments()     # (S, 4) = x0, y0, x1, y1
+    track = Track(segments)           # or Track.FromScene()
+
+    $ python -m gym_godot_car.sim.geometry --check /tmp/random-godot-car-agent-results
+
+--check recomputes the sensor readings of a recording of the Godot server (see
+gym_godot_car.recorder) from the recorded positions and headings and reports the
+deviation from intersect_ray.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+
+import numpy as np
+
+default_scene_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))),
+                                  'SelfDrivingRLCarGodot', 'main.tscn')
+default_cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'gym_godot_car')
+default_collision_mask = 1 # collision_mask of Car.tscn (not set, so the default layer "wall")
+
+# tile_data of TileMap (format 1): the tile id carries the flip flags in its upper bits
+tile_flip_h = 1 << 29
+tile_flip_v = 1 << 30
+tile_transpose = 1 << 31
+
+
+class Constructor():
+    """Value like Vector2( 1, 2 ) or ExtResource( 3 ) of a Godot text resource."""
+    __slots__ = ['name', 'args']
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __repr__(self):
+        return "{}{}".format(self.name, tuple(self.args))
+
+
+_token_pattern = re.compile(r'\s*(?:(?P<string>"(?:[^"\\]|\\.)*")|(?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)'
+                            r'|(?P<name>[A-Za-z_][A-Za-z_0-9]*)|(?P<symbol>[\[\]{}(),:=]))')
+
+
+def _Tokenize(text):
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = _token_pattern.match(text, position)
+        if not match:
+            if text[position:].strip():
+                raise ValueError("Cannot parse '{}'".format(text[position:position+40]))
+            break
+        position = match.end()
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+    return tokens
+
+
+def _ParseValue(tokens, position):
+    kind, token = tokens[position]
+    if kind == 'string':
+        return json.loads(token), position + 1
+    if kind == 'number':
+        value = float(token)
+        return (int(value) if re.fullmatch(r'[-+]?\d+', token) else value), position + 1
+    if kind == 'name':
+        if token in ('true', 'false', 'null'):
+            return {'true': True, 'false': False, 'null': None}[token], position + 1
+        if position + 1 < len(tokens) and tokens[position+1][1] == '(':
+            args, position = _ParseSequence(tokens, position + 2, ')')
+            return Constructor(token, args), position
+        return token, position + 1
+    if token == '[':
+        return _ParseSequence(tokens, position + 1, ']')
+    if token == '{':
+        result = {}
+        position += 1
+        while tokens[position][1] != '}':
+            key, position = _ParseValue(tokens, position)
+            value, position = _ParseValue(tokens, position + 1) # skip ':'
+            result[key] = value
+            if tokens[position][1] == ',':
+                position += 1
+        return result, position + 1
+    raise ValueError("Unexpected '{}'".format(token))
+
+
+def _ParseSequence(tokens, position, end):
+    values = []
+    while tokens[position][1] != end:
+        value, position = _ParseValue(tokens, position)
+        values.append(value)
+        if tokens[position][1] == ',':
+            position += 1
+    return values, position + 1
+
+
+def ParseValue(text):
+    value, _ = _ParseValue(_Tokenize(text), 0)
+    return value
+
+
+def ParseResource(path):
+    """Sections of a .tscn or .tres file as list of (kind, header attributes, properties)."""
+    sections = []
+    with open(path) as f:
+        lines = f.read().splitlines()
+    idx = 0
+    while idx < len(lines):
+        line = lines[idx].strip()
+        idx += 1
+        if not line or line.startswith(';'):
+            continue
+        if line.startswith('[') and line.endswith(']'):
+            tokens = _Tokenize(line[1:-1])
+            attributes = {}
+            position = 1
+            while position < len(tokens):
+                value, next_position = _ParseValue(tokens, position + 2)
+                attributes[tokens[position][1]] = value
+                position = next_position
+            sections.append((tokens[0][1], attributes, {}))
+            continue
+        key, _, text = line.partition('=')
+        # values like arrays of dictionaries span several lines
+        while _Depth(text) > 0 and idx < len(lines):
+            text += "\n" + lines[idx]
+            idx += 1
+        if sections:
+            sections[-1][2][key.strip()] = ParseValue(text)
+    return sections
+
+
+def _Depth(text):
+    text = re.sub(r'"(?:[^"\\]|\\.)*"', '', text)
+    return sum(text.count(char) for char in '([{') - sum(text.count(char) for char in ')]}')
+
+
+def ProjectPath(path):
+    """Directory of project.godot above path, res:// paths are relative to it."""
+    directory = os.path.dirname(os.path.abspath(path))
+    while not os.path.exists(os.path.join(directory, 'project.godot')):
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            raise FileNotFoundError("No project.godot above {}".format(path))
+        directory = parent
+    return directory
+
+
+def _ResolvePath(project, path):
+    return os.path.join(project, path[len('res://'):]) if path.startswith('res://') else path
+
+
+def _Transform(properties):
+    """3x3 matrix of the position, rotation (radians) and scale of a Node2D."""
+    position = properties.get('position', Constructor('Vector2', [0.0, 0.0])).args
+    scale = properties.get('scale', Constructor('Vector2', [1.0, 1.0])).args
+    rotation = properties.get('rotation', 0.0)
+    cos_rot = math.cos(rotation)
+    sin_rot = math.sin(rotation)
+    return np.array([[cos_rot*scale[0], -sin_rot*scale[1], position[0]],
+                     [sin_rot*scale[0], cos_rot*scale[1], position[1]],
+                     [0.0, 0.0, 1.0]])
+
+
+def _ShapeTransform(transform):
+    """3x3 matrix of a Transform2D( x.x, x.y, y.x, y.y, origin.x, origin.y )."""
+    xx, xy, yx, yy, ox, oy = transform.args
+    return np.array([[xx, yx, ox], [xy, yy, oy], [0.0, 0.0, 1.0]])
+
+
+def ParseTileSet(path):
+    """Collision polygons of every tile: {tile id: [(V, 2) points in tile coordinates]}."""
+    sections = ParseResource(path)
+    shapes = {attributes['id']: properties.get('points') for kind, attributes, properties in sections if kind == 'sub_resource'}
+    tiles = {}
+    for kind, _, properties in sections:
+        if kind != 'resource':
+            continue
+        for key, value in properties.items():
+            tile, _, name = key.partition('/')
+            if name != 'shapes' or not tile.isdigit():
+                continue
+            polygons = []
+            for entry in value:
+                points = shapes.get(entry['shape'].args[0])
+                if points is None:
+                    continue # only convex and concave polygons are walls
+                points = np.array(points.args, dtype=np.float64).reshape(-1, 2)
+                matrix = _ShapeTransform(entry['shape_transform'])
+                polygons.append(points @ matrix[:2, :2].T + matrix[:2, 2])
+            tiles[int(tile)] = polygons
+    return tiles
+
+
+def _TileMapSegments(properties, tileset, transform):
+    cell_size = properties.get('cell_size', Constructor('Vector2', [64.0, 64.0])).args
+    data = properties.get('tile_data', Constructor('PoolIntArray', [])).args
+    segments = []
+    for idx in range(0, len(data), 3):
+        cell = data[idx] & 0xFFFFFFFF
+        cell_x = (cell & 0xFFFF) - ((cell & 0x8000) << 1)
+        cell_y = ((cell >> 16) & 0xFFFF) - (((cell >> 16) & 0x8000) << 1)
+        value = data[idx+1] & 0xFFFFFFFF
+        tile = value & (tile_flip_h - 1)
+        for polygon in tileset.get(tile, []):
+            points = polygon.copy()
+            if value & tile_transpose:
+                points = points[:, ::-1].copy()
+            if value & tile_flip_h:
+                points[:, 0] = cell_size[0] - points[:, 0]
+            if value & tile_flip_v:
+                points[:, 1] = cell_size[1] - points[:, 1]
+            points += (cell_x * cell_size[0], cell_y * cell_size[1])
+            points = points @ transform[:2, :2].T + transform[:2, 2]
+            for start, end in zip(points, np.roll(points, -1, axis=0)):
+                if (start != end).any():
+                    segments.append(np.concatenate((start, end)))
+    return segments
+
+
+def ExtractWallSegments(scene_path=default_scene_path, collision_mask=default_collision_mask, transform=None, sources=None):
+    """Wall segments (S, 4) of all TileMaps of the scene and its instanced scenes on a layer in collision_mask.
+
+    sources: list the paths of all parsed files are appended to.
+    """
+    project = ProjectPath(scene_path)
+    sections = ParseResource(scene_path)
+    if sources is not None:
+        sources.append(os.path.abspath(scene_path))
+    resources = {attributes['id']: attributes['path'] for kind, attributes, _ in sections if kind == 'ext_resource'}
+    transforms = {}
+    tilesets = {}
+    segments = []
+    for kind, attributes, properties in sections:
+        if kind != 'node':
+            continue
+        parent = attributes.get('parent')
+        if parent is None:
+            path = '.'
+            parent_transform = transform if transform is not None else np.eye(3)
+        else:
+            path = attributes['name'] if parent == '.' else parent + '/' + attributes['name']
+            parent_transform = transforms[parent]
+        node_transform = transforms[path] = parent_transform @ _Transform(properties)
+        if 'instance' in attributes:
+            instance_path = _ResolvePath(project, resources[attributes['instance'].args[0]])
+            segments.extend(ExtractWallSegments(instance_path, collision_mask, node_transform, sources))
+        elif attributes.get('type') == 'TileMap' and properties.get('collision_layer', 1) & collision_mask:
+            tileset = properties['tile_set'].args[0]
+            if tileset not in tilesets:
+                tileset_path = _ResolvePath(project, resources[tileset])
+                tilesets[tileset] = ParseTileSet(tileset_path)
+                if sources is not None:
+                    sources.append(os.path.abspath(tileset_path))
+            segments.extend(_TileMapSegments(properties, tilesets[tileset], node_transform))
+    return np.array(segments, dtype=np.float64).reshape(-1, 4)
+
+
+def _Stamp(paths):
+    return [[path, os.stat(path).st_mtime_ns, os.stat(path).st_size] for path in paths]
+
+
+def LoadWallSegments(scene_path=None, cache_dir=None, collision_mask=default_collision_mask):
+    """Wall segments of the scene, from the cache in cache_dir if none of the source files changed since."""
+    scene_path = os.path.abspath(scene_path or default_scene_path)
+    cache_dir = cache_dir or default_cache_dir
+    name = hashlib.sha1("{}:{:d}".format(scene_path, collision_mask).encode('utf-8')).hexdigest()[:16]
+    cache_path = os.path.join(cache_dir, "walls-{}.npz".format(name))
+    if os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as cache:
+                sources = json.loads(str(cache['sources']))
+                if _Stamp(path for path, _, _ in sources) == sources:
+                    return cache['segments']
+        except (OSError, ValueError, KeyError):
+            pass # parse again
+    sources = []
+    segments = ExtractWallSegments(scene_path, collision_mask, sources=sources)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_path + '.tmp', 'wb') as f:
+        np.savez(f, segments=segments, sources=json.dumps(_Stamp(sources)))
+    os.replace(cache_path + '.tmp', cache_path)
+    return segments
+
+
+def CheckRecording(track, directory, batch_size=65536):
+    """Deviations (N, 5) of the recorded sensor readings from the ones cast on track, observations that are all
+    zero (before the first reply after a reconnect) are left out."""
+    from gym_godot_car.recorder import TrajectoryReader
+    from gym_godot_car.sim.car import SensorReadings
+    reader = TrajectoryReader(directory)
+    deviations = []
+    for start in range(0, reader.steps, batch_size):
+        observations = reader.Get('observations', slice(start, min(start + batch_size, reader.steps))).astype(np.float64)
+        observations = observations[observations.any(axis=1)]
+        readings = SensorReadings(track, observations[:, 7:9], observations[:, 6])
+        deviations.append(np.abs(readings - observations[:, 0:5]))
+    return np.concatenate(deviations) if deviations else np.zeros((0, 5))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scene', default=default_scene_path)
+    parser.add_argument('--cache-dir', default=default_cache_dir)
+    parser.add_argument('--check', metavar='RECORDING', help="compare with the sensor readings of a recording of the Godot server")
+    parser.add_argument('--tolerance', type=float, default=0.05, help="maximum deviation of a sensor reading")
+    args = parser.parse_args()
+
+    from gym_godot_car.sim.track import Track
+    segments = LoadWallSegments(args.scene, args.cache_dir)
+    print("{:d} wall segments in {}".format(len(segments), args.scene))
+    if args.check:
+        deviations = CheckRecording(Track(segments), args.check)
+        print("{:d} observations, sensor deviation max {:.4g} mean {:.4g}".format(
+            len(deviations), deviations.max(initial=0.0), deviations.mean() if len(deviations) else 0.0))
+        if deviations.max(initial=0.0) > args.tolerance:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
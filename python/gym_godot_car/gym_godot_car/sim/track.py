@@ -0,0 +1,225 @@
+"""
+Wall geometry of the race track used by the Godot scene.
+
+The tile layout and the collision polygons are copied from
+SelfDrivingRLCarGodot/core/track/track.tscn (node "TileMap") and
+SelfDrivingRLCarGodot/core/track/race_tileset.tres. Every polygon edge is
+turned into a wall segment in world coordinates, which is all that is needed
+to reproduce the ray casts of Car.CalcSensors and the collisions of
+Car.UpdateNodes outside of Godot. Track.FromScene() reads the segments from
+the scene files instead (see gym_godot_car.sim.geometry).
+"""
+
+import numpy as np
+
+tile_scale = 0.4
+cell_size = 128.0
+
+# tile id -> convex collision polygons in tile coordinates (race_tileset.tres)
+tile_shapes = {
+    2: [[(0, 124), (8, 72), (32, 32), (72, 8), (108, 0), (128, 0), (128, 20), (100, 24), (72, 32), (48, 48), (32, 72), (24, 100), (20, 128), (0, 128)],
+        [(108, 128), (112, 116), (120, 108), (128, 108), (128, 128)]],
+    3: [[(0, 0), (32, 4), (64, 12), (96, 36), (116, 64), (124, 96), (128, 128), (108, 128), (104, 100), (96, 72), (80, 48), (56, 32), (28, 24), (0, 20)],
+        [(0, 108), (12, 112), (20, 120), (20, 128), (0, 128)]],
+    4: [[(128, 0), (128, 20), (120, 20), (112, 12), (108, 0)],
+        [(20, 0), (24, 28), (32, 56), (48, 80), (72, 96), (100, 104), (128, 108), (128, 128), (92, 124), (60, 116), (32, 96), (12, 68), (4, 32), (0, 0)]],
+    5: [[(0, 0), (20, 0), (20, 8), (12, 16), (0, 20)],
+        [(128, 0), (124, 32), (112, 68), (92, 96), (64, 116), (32, 124), (0, 128), (0, 108), (28, 104), (52, 96), (52, 96), (80, 80), (96, 56), (104, 28), (108, 0)]],
+    6: [[(128, 128), (108, 128), (108, 0), (128, 0)],
+        [(20, 128), (0, 128), (0, 0), (20, 0)]],
+    7: [[(128, 20), (0, 20), (0, 0), (128, 0)],
+        [(128, 128), (0, 128), (0, 108), (128, 108)]],
+}
+
+# (cell index, tile id, flags) triples of the "TileMap" node in track.tscn,
+# the cell index is encoded as y * 65536 + x
+tile_data = (
+    65537, 2, 0, 65538, 7, 0, 65539, 7, 0, 65540, 7, 0, 65541, 7, 0, 65542, 7, 0, 65543, 7, 0, 65544, 7, 0, 65545, 7, 0, 65546, 7, 0,
+    65547, 7, 0, 65548, 7, 0, 65549, 7, 0, 65550, 3, 0, 65552, 2, 0, 65553, 7, 0, 65554, 7, 0, 65555, 7, 0, 65556, 7, 0, 65557, 7, 0,
+    65558, 3, 0, 131073, 6, 0, 131074, 2, 0, 131075, 7, 0, 131076, 7, 0, 131077, 7, 0, 131078, 7, 0, 131079, 7, 0, 131080, 7, 0,
+    131081, 7, 0, 131082, 7, 0, 131083, 7, 0, 131084, 7, 0, 131085, 7, 0, 131086, 5, 0, 131088, 6, 0, 131094, 6, 0, 196609, 6, 0,
+    196610, 4, 0, 196611, 7, 0, 196612, 7, 0, 196613, 7, 0, 196614, 7, 0, 196615, 7, 0, 196616, 7, 0, 196617, 7, 0, 196618, 7, 0,
+    196619, 7, 0, 196620, 7, 0, 196621, 7, 0, 196622, 7, 0, 196623, 7, 0, 196624, 5, 0, 196630, 6, 0, 262145, 6, 0, 262147, 2, 0,
+    262148, 7, 0, 262149, 7, 0, 262150, 7, 0, 262151, 7, 0, 262152, 3, 0, 262159, 2, 0, 262160, 3, 0, 262166, 6, 0, 327681, 6, 0,
+    327683, 6, 0, 327684, 2, 0, 327685, 7, 0, 327686, 3, 0, 327688, 6, 0, 327691, 2, 0, 327692, 7, 0, 327693, 7, 0, 327694, 7, 0,
+    327695, 5, 0, 327696, 6, 0, 327697, 2, 0, 327698, 7, 0, 327699, 7, 0, 327700, 7, 0, 327701, 7, 0, 327702, 5, 0, 393217, 6, 0,
+    393219, 4, 0, 393220, 5, 0, 393222, 6, 0, 393224, 6, 0, 393226, 2, 0, 393227, 5, 0, 393232, 6, 0, 393233, 6, 0, 393238, 2, 0,
+    393239, 3, 0, 458753, 4, 0, 458754, 7, 0, 458755, 3, 0, 458758, 6, 0, 458760, 6, 0, 458762, 4, 0, 458763, 3, 0, 458768, 4, 0,
+    458769, 5, 0, 458772, 2, 0, 458773, 7, 0, 458774, 5, 0, 458775, 6, 0, 524290, 2, 0, 524291, 5, 0, 524294, 6, 0, 524296, 6, 0,
+    524299, 4, 0, 524300, 7, 0, 524301, 7, 0, 524302, 7, 0, 524303, 7, 0, 524304, 7, 0, 524305, 7, 0, 524306, 7, 0, 524307, 7, 0,
+    524308, 5, 0, 524309, 2, 0, 524310, 7, 0, 524311, 5, 0, 589826, 4, 0, 589827, 3, 0, 589830, 6, 0, 589832, 6, 0, 589843, 2, 0,
+    589844, 7, 0, 589845, 5, 0, 655363, 4, 0, 655364, 7, 0, 655365, 7, 0, 655366, 5, 0, 655368, 4, 0, 655369, 7, 0, 655370, 7, 0,
+    655371, 7, 0, 655372, 7, 0, 655373, 7, 0, 655374, 7, 0, 655375, 7, 0, 655376, 7, 0, 655377, 7, 0, 655378, 7, 0, 655379, 5, 0,
+)
+
+
+def BuildWallSegments(tiles=tile_data, shapes=tile_shapes, scale=tile_scale, size=cell_size):
+    """Return all polygon edges of the tile map as an array of shape (S, 4) = x0, y0, x1, y1 in world coordinates."""
+    segments = []
+    for idx in range(0, len(tiles), 3):
+        cell = tiles[idx]
+        cell_x = cell & 0xFFFF
+        cell_y = cell >> 16
+        for polygon in shapes.get(tiles[idx+1], []):
+            for (x0, y0), (x1, y1) in zip(polygon, polygon[1:] + polygon[:1]):
+                if (x0, y0) == (x1, y1):
+                    continue
+                segments.append(((cell_x*size + x0)*scale, (cell_y*size + y0)*scale,
+                                 (cell_x*size + x1)*scale, (cell_y*size + y1)*scale))
+    return np.array(segments, dtype=np.float64)
+
+
+class Track():
+    """Wall segments of the track with vectorized ray casts and collision checks.
+
+    Segments are binned into a uniform grid of tile sized cells, so a query only
+    tests the segments of the cells overlapped by the bounding box of its rays.
+    """
+    def __init__(self, segments=None, grid_size=cell_size*tile_scale):
+        if segments is None:
+            segments = BuildWallSegments()
+        self.segments = np.asarray(segments, dtype=np.float64)
+        self.grid_size = grid_size
+        self._cells = {}
+        bounds = np.stack((np.minimum(self.segments[:, 0:2], self.segments[:, 2:4]),
+                           np.maximum(self.segments[:, 0:2], self.segments[:, 2:4])), axis=1)
+        for idx, ((x_min, y_min), (x_max, y_max)) in enumerate(np.floor(bounds / grid_size).astype(int)):
+            for cell_x in range(x_min, x_max+1):
+                for cell_y in range(y_min, y_max+1):
+                    self._cells.setdefault((cell_x, cell_y), []).append(idx)
+        self._candidates = {}
+        self._tables = {}
+
+    @classmethod
+    def FromScene(cls, scene_path=None, cache_dir=None):
+        """Track with the walls of the Godot scene (main.tscn of the project by default)."""
+        from gym_godot_car.sim.geometry import LoadWallSegments
+        return cls(LoadWallSegments(scene_path, cache_dir))
+
+    def _Candidates(self, x_min, y_min, x_max, y_max):
+        key = (int(x_min // self.grid_size), int(y_min // self.grid_size), int(x_max // self.grid_size), int(y_max // self.grid_size))
+        candidates = self._candidates.get(key)
+        if candidates is None:
+            indices = set()
+            for cell_x in range(key[0], key[2]+1):
+                for cell_y in range(key[1], key[3]+1):
+                    indices.update(self._cells.get((cell_x, cell_y), ()))
+            segments = self.segments[sorted(indices)]
+            candidates = (segments[:, 0:2], segments[:, 2:4] - segments[:, 0:2])
+            self._candidates[key] = candidates
+        return candidates
+
+    def _NeighbourhoodTable(self, reach):
+        """Segment indices of all cells within reach of each grid cell, padded with the index of a degenerate segment."""
+        cell_reach = int(np.ceil(reach / self.grid_size))
+        table = self._tables.get(cell_reach)
+        if table is None:
+            size_x = max(key[0] for key in self._cells) + 1
+            size_y = max(key[1] for key in self._cells) + 1
+            neighbours = {}
+            for cell_x in range(size_x):
+                for cell_y in range(size_y):
+                    indices = set()
+                    for near_x in range(cell_x-cell_reach, cell_x+cell_reach+1):
+                        for near_y in range(cell_y-cell_reach, cell_y+cell_reach+1):
+                            indices.update(self._cells.get((near_x, near_y), ()))
+                    neighbours[(cell_x, cell_y)] = sorted(indices)
+            width = max(len(indices) for indices in neighbours.values())
+            index = np.full((size_x, size_y, width), len(self.segments), dtype=np.intp)
+            for (cell_x, cell_y), indices in neighbours.items():
+                index[cell_x, cell_y, :len(indices)] = indices
+            padded = np.concatenate((self.segments, np.zeros((1, 4))))
+            table = (index, padded[:, 0:2], padded[:, 2:4] - padded[:, 0:2])
+            self._tables[cell_reach] = table
+        return table
+
+    def CastRaysBatch(self, origins, targets, reach, centers=None):
+        """Cast R rays per car from origins (N, 2) or (N, R, 2) to targets (N, R, 2).
+
+        Returns the fraction (N, R) of each ray until the first wall hit (1.0 if nothing was hit).
+        Only the segments of the grid cells around each center (N, 2), which default to the
+        origins, are tested, so all rays of a car must stay within reach of its center.
+        """
+        origins = np.asarray(origins, dtype=np.float64)
+        if origins.ndim == 2:
+            centers = origins
+            origins = origins[:, None, :]
+        starts, edges, _ = self._Neighbours(centers, reach) # (N, K, 2)
+        start = starts[:, None, :, :] # (N, 1, K, 2)
+        edge_x = edges[:, None, :, 0] # (N, 1, K)
+        edge_y = edges[:, None, :, 1]
+        rays = np.asarray(targets, dtype=np.float64) - origins
+        ray_x = rays[:, :, None, 0] # (N, R, 1)
+        ray_y = rays[:, :, None, 1]
+        offset_x = start[..., 0] - origins[:, :, None, 0]
+        offset_y = start[..., 1] - origins[:, :, None, 1]
+        # solve origin + t * ray = start + u * edge for all ray/segment pairs, in place where possible
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inv_denom = 1.0 / (ray_x*edge_y - ray_y*edge_x)
+            t = (offset_x*edge_y - offset_y*edge_x) * inv_denom
+            u = offset_x*ray_y
+            u -= offset_y*ray_x
+            u *= inv_denom
+        miss = u < 0.0
+        miss |= u > 1.0
+        miss |= t < 0.0
+        np.putmask(t, miss, 1.0)
+        # fmin ignores the NaNs of parallel and degenerate segments, t > 1.0 is capped by the initial value
+        return np.fmin.reduce(t, axis=2, initial=1.0)
+
+    def CastRays(self, origins, targets):
+        """Cast rays from origins (R, 2) to targets (R, 2) and return the fraction (R,) of the ray until the first wall hit (1.0 if nothing was hit)."""
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+        targets = np.asarray(targets, dtype=np.float64).reshape(-1, 2)
+        lower = np.minimum(origins.min(axis=0), targets.min(axis=0))
+        upper = np.maximum(origins.max(axis=0), targets.max(axis=0))
+        start, edge = self._Candidates(lower[0], lower[1], upper[0], upper[1])
+        rays = targets - origins
+        # solve origin + t * ray = start + u * edge for all ray/segment pairs
+        denom = rays[:, 0, None]*edge[None, :, 1] - rays[:, 1, None]*edge[None, :, 0]
+        offset_x = start[None, :, 0] - origins[:, 0, None]
+        offset_y = start[None, :, 1] - origins[:, 1, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (offset_x*edge[None, :, 1] - offset_y*edge[None, :, 0]) / denom
+            u = (offset_x*rays[:, 1, None] - offset_y*rays[:, 0, None]) / denom
+        hit = (t >= 0.0) & (t <= 1.0) & (u >= 0.0) & (u <= 1.0)
+        return np.where(hit, t, 1.0).min(axis=1, initial=1.0)
+
+    def Intersects(self, starts, ends):
+        """Return True for every segment starts (N, 2) -> ends (N, 2) that touches any wall."""
+        return self.CastRays(starts, ends) < 1.0
+
+    def _Neighbours(self, centers, reach):
+        """Starts and edges (N, K, 2) of the segments around each center and a mask (N, K) of the padding."""
+        index, starts, edges = self._NeighbourhoodTable(reach)
+        cells = np.floor(np.asarray(centers, dtype=np.float64) / self.grid_size).astype(np.intp)
+        cells[:, 0].clip(0, index.shape[0]-1, out=cells[:, 0])
+        cells[:, 1].clip(0, index.shape[1]-1, out=cells[:, 1])
+        candidates = index[cells[:, 0], cells[:, 1]]
+        return starts[candidates], edges[candidates], candidates == len(self.segments)
+
+    def DistanceToWall(self, positions, reach):
+        """Distance (N,) of positions (N, 2) to the closest wall, reach if there is none within reach."""
+        positions = np.asarray(positions, dtype=np.float64)
+        starts, edges, padding = self._Neighbours(positions, reach)
+        offsets = positions[:, None, :] - starts
+        with np.errstate(divide='ignore', invalid='ignore'):
+            u = np.einsum('nkd,nkd->nk', offsets, edges) / np.einsum('nkd,nkd->nk', edges, edges)
+        u = np.nan_to_num(u).clip(0.0, 1.0)
+        distances = np.hypot(offsets[..., 0] - u*edges[..., 0], offsets[..., 1] - u*edges[..., 1])
+        distances[padding] = np.inf
+        return np.minimum(distances.min(axis=1, initial=np.inf), reach)
+
+    def PolygonsCollide(self, polygons):
+        """True for every convex polygon (N, V, 2) that overlaps a wall: an edge crosses a wall or a wall lies inside."""
+        polygons = np.asarray(polygons, dtype=np.float64)
+        centers = polygons.mean(axis=1)
+        reach = np.sqrt(((polygons - centers[:, None, :])**2).sum(axis=2).max(initial=0.0))
+        crossing = (self.CastRaysBatch(polygons, np.roll(polygons, -1, axis=1), reach, centers=centers) < 1.0).any(axis=1)
+        # a wall shorter than the polygon can lie inside without crossing an edge, then its start is inside
+        starts, _, padding = self._Neighbours(centers, reach)
+        edges = np.roll(polygons, -1, axis=1) - polygons # (N, V, 2)
+        offsets = starts[:, :, None, :] - polygons[:, None, :, :] # (N, K, V, 2)
+        cross = edges[:, None, :, 0]*offsets[..., 1] - edges[:, None, :, 1]*offsets[..., 0]
+        inside = ((cross >= 0.0).all(axis=2) | (cross <= 0.0).all(axis=2)) & ~padding
+        return crossing | inside.any(axis=1)
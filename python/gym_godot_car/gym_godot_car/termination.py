@@ -0,0 +1,254 @@
+"""
+Early termination of episodes that cannot lead anywhere.
+
+A TerminationPolicy is a list of rules that are checked after every step of
+GodotCarEnv, the first rule that fires ends the episode and is reported in
+info['termination'] (the env's own ends are reported as 'crash', 'min_score'
+and 'max_score'):
+
+    best = RunningBest()                # shared by all workers, reset every generation as reporter
+    population.add_reporter(best)
+    policy = TerminationPolicy([NoProgress(50, 20.0), Stalled(20, 1.0), StepBudget(3000),
+                                BestCutoff(best, 3000)])
+    env = GodotCarEnv(termination=policy)
+    ...
+    env.termination.Finish(fitness)     # in eval_genome, once the fitness of the genome is known
+
+NoProgress and Stalled are heuristics for cars that will not get anywhere anymore.
+Such a car would lose a point every step until the env ends the episode at the min
+score, so the episode is charged the rest of this step penalty at once, with the
+reward of the last step (reported in info['penalty']); ending early does not pay off.
+StepBudget and TimeBudget cap the length
+of an episode. BestCutoff only ends episodes that cannot reach the best fitness of
+the generation so far even when driving at top speed for the rest of the step
+budget, so it never changes which genome of a generation is best. The fitness of
+episodes it (or TimeBudget) cut short depends on more than the genome, the evaluators
+do not put it in their FitnessCache.
+"""
+
+import abc
+import collections
+import math
+import multiprocessing
+import multiprocessing.context
+import time
+
+from neat.reporting import BaseReporter
+
+from gym_godot_car.sim import car
+
+
+def TopSpeed():
+    """Longitudinal velocity at full throttle where the driving force is used up by drag and rolling resistance."""
+    force_engine = car.torque_engine_max * car.i_differential * car.i_gear / car.r_wheel
+    drag = 0.5 * car.c_w * car.rho * car.area
+    return (-car.rolling_resistance + math.sqrt(car.rolling_resistance**2 + 4*drag*force_engine)) / (2*drag)
+
+
+# score is distance - steps, so a step gains at most the distance covered at top speed minus 1
+max_step_reward = TopSpeed() * car.game_factor * (car.step_size + car.physics_delta) - 1.0
+
+
+class TerminationRule(abc.ABC):
+    """Base of the rules, Check returns True to end the episode.
+
+    deterministic: whether the rule only depends on the episode, episodes that the others (e.g. BestCutoff or
+    TimeBudget) cut short do not give a fitness that can be cached.
+    hopeless: the rule ends episodes of cars that will not get anywhere anymore, they are charged the step
+    penalty down to the min score of the TerminationPolicy.
+    """
+    name = 'rule'
+    deterministic = True
+    hopeless = False
+
+    def __repr__(self):
+        parameters = ", ".join("{}={!r}".format(key, value) for key, value in sorted(vars(self).items())
+                               if not key.startswith('_') and isinstance(value, (int, float, str)))
+        return "{}({})".format(type(self).__name__, parameters)
+
+    def Reset(self):
+        pass
+
+    @abc.abstractmethod
+    def Check(self, step, observation, total_reward):
+        pass
+
+    def Finish(self, fitness):
+        pass
+
+
+class NoProgress(TerminationRule):
+    """The car moved less than min_distance (straight line) within the last steps steps, e.g. circling."""
+    name = 'no_progress'
+    hopeless = True
+
+    def __init__(self, steps=50, min_distance=20.0):
+        self.steps = steps
+        self.min_distance = min_distance
+        self._positions = collections.deque(maxlen=steps)
+
+    def Reset(self):
+        self._positions.clear()
+
+    def Check(self, step, observation, total_reward):
+        positions = self._positions
+        position = (float(observation[7]), float(observation[8]))
+        full = len(positions) == self.steps
+        if full:
+            old = positions[0]
+        positions.append(position)
+        return full and math.hypot(position[0] - old[0], position[1] - old[1]) < self.min_distance
+
+
+class Stalled(TerminationRule):
+    """The speed stayed below min_speed for steps steps in a row."""
+    name = 'stalled'
+    hopeless = True
+
+    def __init__(self, steps=20, min_speed=1.0):
+        self.steps = steps
+        self.min_speed = min_speed
+        self._slow = 0
+
+    def Reset(self):
+        self._slow = 0
+
+    def Check(self, step, observation, total_reward):
+        self._slow = self._slow + 1 if observation[5] < self.min_speed else 0
+        return self._slow >= self.steps
+
+
+class StepBudget(TerminationRule):
+    name = 'step_budget'
+
+    def __init__(self, max_steps):
+        self.max_steps = max_steps
+
+    def Check(self, step, observation, total_reward):
+        return step >= self.max_steps
+
+
+class TimeBudget(TerminationRule):
+    """Wall clock budget of an episode in seconds, counted from the first step."""
+    name = 'time_budget'
+    deterministic = False
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self._deadline = None
+
+    def Reset(self):
+        self._deadline = None
+
+    def Check(self, step, observation, total_reward):
+        if self._deadline is None:
+            self._deadline = time.monotonic() + self.seconds
+            return False
+        return time.monotonic() > self._deadline
+
+
+class RunningBest(BaseReporter):
+    """Best fitness of the current generation, shared between the processes of ParallelEnvEvaluator.
+
+    Create it before the evaluator (the workers inherit it) and add it as reporter to the population,
+    it is reset at the start of every generation. Update it with every fitness of the generation.
+    context: multiprocessing context of the evaluator (see ParallelEnvEvaluator), by default the default one.
+    """
+    def __init__(self, context=None):
+        self._value = (context if context is not None else multiprocessing.get_context()).Value('d', -math.inf)
+
+    # spawned workers get the shared value itself, reporters also end up in neat checkpoints (through the
+    # species set), which keep the current value only
+    def __getstate__(self):
+        if multiprocessing.context.get_spawning_popen() is not None:
+            return {'shared': self._value}
+        return {'value': self.value}
+
+    def __setstate__(self, state):
+        self._value = state['shared'] if 'shared' in state else multiprocessing.Value('d', state['value'])
+
+    @property
+    def value(self):
+        return self._value.value
+
+    def Update(self, fitness):
+        with self._value.get_lock():
+            if fitness > self._value.value:
+                self._value.value = fitness
+
+    def Reset(self):
+        self._value.value = -math.inf
+
+    def start_generation(self, generation):
+        self.Reset()
+
+
+class BestCutoff(TerminationRule):
+    """Ends episodes that cannot beat best.value within max_steps steps of at most step_reward each.
+
+    max_steps: step budget of the episodes, e.g. of a StepBudget rule.
+    step_reward: reward of one env step at top speed, multiply max_step_reward by the frame_skip of the env.
+    """
+    name = 'best_cutoff'
+    deterministic = False
+
+    def __init__(self, best, max_steps, step_reward=max_step_reward):
+        self.best = best
+        self.max_steps = max_steps
+        self.step_reward = step_reward
+
+    def Finish(self, fitness):
+        self.best.Update(fitness)
+
+    def Check(self, step, observation, total_reward):
+        # one step more than remain, the fitness of eval_genome leaves out the (possibly negative) last reward
+        return total_reward + (max(0, self.max_steps - step) + 1) * self.step_reward < self.best.value
+
+
+class TerminationPolicy():
+    """Checks the rules after every step, counts in fired how often each rule (or end of the env) ended an episode.
+
+    cut counts the episodes ended by rules that are not deterministic. The repr lists the rules and their
+    parameters, e.g. for the salt of a FitnessCache.
+    min_score: the env ends episodes whose score drops below it. When a hopeless rule fires, penalty is what
+    the episode is charged on top of the reward of the step to end at min_score.
+    """
+    def __init__(self, rules, min_score=-25.0):
+        self.rules = list(rules)
+        self.min_score = min_score
+        self.fired = collections.Counter()
+        self.cut = 0
+        self.steps = 0
+        self.total_reward = 0.0
+        self.penalty = 0.0
+
+    def __repr__(self):
+        return "TerminationPolicy({!r}, min_score={!r})".format(self.rules, self.min_score)
+
+    def Reset(self):
+        self.steps = 0
+        self.total_reward = 0.0
+        self.penalty = 0.0
+        for rule in self.rules:
+            rule.Reset()
+
+    def Check(self, observation, reward):
+        """Name of the rule that ends the episode after this step or None."""
+        self.steps += 1
+        self.total_reward += reward
+        self.penalty = 0.0
+        for rule in self.rules:
+            if rule.Check(self.steps, observation, self.total_reward):
+                self.fired[rule.name] += 1
+                if not rule.deterministic:
+                    self.cut += 1
+                if rule.hopeless:
+                    self.penalty = min(0.0, self.min_score - self.total_reward)
+                    self.total_reward += self.penalty
+                return rule.name
+        return None
+
+    def Finish(self, fitness):
+        """Report the fitness of the genome evaluated since the last call."""
+        for rule in self.rules:
+            rule.Finish(fitness)
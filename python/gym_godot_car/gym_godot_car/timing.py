@@ -0,0 +1,106 @@
+"""
+Opt-in timers and counters for the phases of stepping through the server.
+
+    timer = PhaseTimer(dump_path='/tmp/godot-car-timing.jsonl', dump_interval=60.0)
+    env = GodotCarEnv(timer=timer) # or timer=True
+    ...
+    timer.GetStatistics()  # {'wait': {'count': ..., 'mean_us': ..., 'p50_us': ..., 'histogram': [...]}, ...}
+
+Phases of the helper client are encode, send, wait (for the reply), decode, reset and
+reconnect, GodotCarEnv adds step (the whole env.step) and policy (the time between two
+steps spent by the caller). Counters: steps, resets, reconnects, timeouts.
+"""
+
+import bisect
+import json
+import time
+
+import numpy as np
+
+# log spaced histogram bins from 1 us to 10 s, 10 per decade; bin 0 is below the first edge, the last bin above the last
+histogram_edges_us = np.logspace(0, 7, 71)
+_histogram_edges = (histogram_edges_us * 1e-6).tolist()
+
+
+class _Phase():
+    __slots__ = ['samples', 'position', 'counts', 'total']
+
+    def __init__(self):
+        self.samples = []
+        self.position = 0
+        self.counts = [0] * (len(_histogram_edges) + 1)
+        self.total = 0.0
+
+
+class PhaseTimer():
+    """Keeps the last window durations of each phase and counts events.
+
+    Add() stores into a ring buffer and updates the rolling histogram and sum of the phase, exact
+    percentiles are only computed when pulled with GetStatistics(). With dump_path set the statistics
+    are appended as one JSON line every dump_interval seconds.
+    """
+    def __init__(self, window=10000, dump_path=None, dump_interval=60.0):
+        self.window = window
+        self.dump_path = dump_path
+        self.dump_interval = dump_interval
+        self._phases = {}
+        self.counters = {}
+        self._next_dump = time.monotonic() + dump_interval
+
+    def Add(self, phase, duration):
+        state = self._phases.get(phase)
+        if state is None:
+            state = self._phases[phase] = _Phase()
+        samples = state.samples
+        if len(samples) < self.window:
+            samples.append(duration)
+        else:
+            evicted = samples[state.position]
+            state.counts[bisect.bisect_right(_histogram_edges, evicted)] -= 1
+            state.total -= evicted
+            samples[state.position] = duration
+            state.position = (state.position + 1) % self.window
+        state.counts[bisect.bisect_right(_histogram_edges, duration)] += 1
+        state.total += duration
+
+    def Count(self, counter, increment=1):
+        self.counters[counter] = self.counters.get(counter, 0) + increment
+
+    def GetLast(self):
+        """Most recent duration of every phase in seconds."""
+        return {phase: state.samples[state.position - 1] for phase, state in self._phases.items()}
+
+    def GetHistograms(self):
+        """Per phase count, mean in microseconds and the rolling histogram over histogram_edges_us, cheap to call."""
+        return {phase: {'count': len(state.samples),
+                        'mean_us': state.total * 1e6 / len(state.samples),
+                        'histogram': list(state.counts)}
+                for phase, state in self._phases.items()}
+
+    def GetStatistics(self):
+        """Like GetHistograms, with exact percentiles in microseconds of the last window durations."""
+        statistics = self.GetHistograms()
+        for phase, state in self._phases.items():
+            p50, p95, p99 = np.percentile(state.samples, [50, 95, 99]) * 1e6
+            statistics[phase].update({'p50_us': float(p50), 'p95_us': float(p95), 'p99_us': float(p99)})
+        return statistics
+
+    def Reset(self):
+        self._phases.clear()
+        self.counters.clear()
+
+    def MaybeDump(self):
+        """Dump if dump_path is set and dump_interval passed since the last dump."""
+        if self.dump_path:
+            now = time.monotonic()
+            if now >= self._next_dump:
+                self._next_dump = now + self.dump_interval
+                self.Dump()
+
+    def Dump(self, path=None):
+        """Append the current statistics and counters as one JSON line."""
+        with open(path or self.dump_path, 'a') as f:
+            f.write(json.dumps({'time': time.time(),
+                                'counters': self.counters,
+                                'phases': self.GetStatistics(),
+                                'histogram_edges_us': histogram_edges_us.tolist()}) + "\n")
@@ -5,6 +5,7 @@ This is based on the single-pole balancing example from neat-python package.
 
 from __future__ import print_function
 
+import argparse
 import os
 import sys
 import time
@@ -15,54 +16,36 @@ import gym
 from gym import wrappers, logger
 import gym_godot_car
 import neat
+from gym_godot_car.network import MatrixNetwork
+from gym_godot_car.recorder import TrajectoryRecorder, TrajectoryReader, ReplayPolicy
 
-runs_per_net = 1
+recording_dir = "/tmp/godot-car-winner-trajectory"
 
-def get_scaled_observation(observation):
-    """Get full observation, scaled into (approximately) [0, 1]."""
-    # observation = sensor_readings[0], sensor_readings[1], sensor_readings[2], sensor_readings[3], sensor_readings[4], velocity_longitudinal, psi, position.x, position.y
-    max_pos_x = 1280.0
-    max_pos_y = 600.0
-    max_sensor_range = 100.0
-    min_velocity =    0.0
-    max_velocity = +100.0
-    min_psi = -math.pi
-    max_psi = +math.pi
-    return [observation[0]/max_sensor_range,
-            observation[1]/max_sensor_range,
-            observation[2]/max_sensor_range,
-            observation[3]/max_sensor_range,
-            observation[4]/max_sensor_range,
-            (observation[5]-min_velocity)/(max_velocity-min_velocity),
-            (observation[6]-min_psi)/(max_psi-min_psi),
-            observation[7]/max_pos_x,
-            observation[8]/max_pos_y]
+runs_per_net = 1
 
-def get_scaled_action(action):
-    """Get full action, scaled from [0, 1] to the maximum values allowed by the environment/simulator/car."""
-    # action = throttle, brake, steering
-    min_steer = -1.0
-    max_steer = +1.0
-    return [action[0],
-            action[1],
-            (action[2]*(max_steer-min_steer))+min_steer]
+def load_winner(config_path):
+    """Compiled network of the winner, from winner-feedforward.npz or else compiled from the pickled genome."""
+    if os.path.exists('winner-feedforward.npz'):
+        return MatrixNetwork.load('winner-feedforward.npz')
 
-def run(config_path):
     # Load configuration.
     config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
                          neat.DefaultSpeciesSet, neat.DefaultStagnation,
                          config_path)
 
-    # Save the winner.
+    # Load the winner.
     with open('winner-feedforward', 'rb') as f:
     	winner = pickle.load(f)
 
     # Display the winning genome.
     print('\nBest genome:\n{!s}'.format(winner))
 
-    net = neat.nn.FeedForwardNetwork.create(winner, config)
+    return MatrixNetwork.create(winner, config)
+
+def run(config_path):
+    net = load_winner(config_path)
     env = gym.make('godot-car-v0')
-    env = wrappers.Monitor(env, directory="/tmp/random-godot-car-agent-results", force=True)
+    env = TrajectoryRecorder(env, directory=recording_dir, force=True)
     env.seed(0)
     observation = env.reset()
 
@@ -70,18 +53,35 @@ def run(config_path):
     fitness = 0.0
     done = False
     while True:
-        action = net.activate(get_scaled_observation(observation))
-        observation, reward, done, _ = env.step(get_scaled_action(action))
+        observation, reward, done, _ = env.step(net.activate(observation))
         fitness += reward
         if done:
             break
-    # Close the env
+    # Close the env and write the rest of the recording to disk
     env.close()
 
+def replay(config_path, directory):
+    """Run the winner on the observations of a recording (no simulator needed) and compare with the recorded actions."""
+    net = load_winner(config_path)
+    reader = TrajectoryReader(directory)
+    actions = ReplayPolicy(net.activate, reader)
+    recorded = reader.Get('actions', slice(None))
+    deviation = abs(actions - recorded).max(axis=1)
+    print("{} steps in {} episodes, returns: {}".format(len(reader), reader.num_episodes, reader.returns.tolist()))
+    for episode, (start, length) in enumerate(reader.episodes):
+        print("episode {}: max action deviation {:.6f}".format(episode, deviation[start:start+length].max()))
+
 if __name__ == '__main__':
     # Determine path to configuration file. This path manipulation is
     # here so that the script will run successfully regardless of the
     # current working directory.
     local_dir = os.path.dirname(__file__)
     config_path = os.path.join(local_dir, 'config-feedforward')
-    run(config_path)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--replay', metavar='DIR', nargs='?', const=recording_dir,
+                        help="replay a recording instead of running the simulation (default: the last run of this script)")
+    args = parser.parse_args()
+    if args.replay:
+        replay(config_path, args.replay)
+    else:
+        run(config_path)
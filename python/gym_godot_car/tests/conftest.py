@@ -0,0 +1,36 @@
+import pytest
+
+from gym_godot_car.server import GodotCarServer
+
+
+def StartServer(**kwargs):
+    server = GodotCarServer(port=0, **kwargs)
+    server.StartInBackground()
+    return server
+
+
+@pytest.fixture
+def server():
+    """Python stand-in server on a free port."""
+    server = StartServer()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def text_server():
+    """Stand-in server without the binary protocol and its extensions (like servers before it)."""
+    server = StartServer(binary=False)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def lockstep_server():
+    """Stand-in server that steps its cars together, like the Godot server."""
+    server = StartServer(lockstep=True)
+    yield server
+    server.shutdown()
+    server.server_close()
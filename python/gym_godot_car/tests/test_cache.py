@@ -0,0 +1,85 @@
+import os
+import pickle
+import random
+
+import neat
+
+from gym_godot_car.cache import FitnessCache, GenomeKey
+
+config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config-feedforward')
+
+
+def LoadConfig():
+    return neat.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet, neat.DefaultStagnation, config_path)
+
+
+def NewGenome(config, key=1):
+    random.seed(key)
+    genome = config.genome_type(key)
+    genome.configure_new(config.genome_config)
+    return genome
+
+
+def test_key_ignores_genes_that_do_not_change_the_network():
+    config = LoadConfig()
+    genome = NewGenome(config)
+    assert GenomeKey(NewGenome(config, 2), config) != GenomeKey(genome, config)
+    # the same connection disabled
+    input_key, output_key = config.genome_config.input_keys[0], config.genome_config.output_keys[0]
+    del genome.connections[input_key, output_key]
+    key = GenomeKey(genome, config)
+    genome.add_connection(config.genome_config, input_key, output_key, 1.5, False)
+    assert GenomeKey(genome, config) == key
+    genome.connections[input_key, output_key].enabled = True
+    assert GenomeKey(genome, config) != key
+    genome.connections[input_key, output_key].enabled = False
+    # a node that is fed by an input but does not feed an output
+    genome.nodes[100] = genome.create_node(config.genome_config, 100)
+    genome.add_connection(config.genome_config, input_key, 100, 0.5, True)
+    assert GenomeKey(genome, config) == key
+    # genes are compared by value, the key does not depend on the genome key
+    clone = pickle.loads(pickle.dumps(genome))
+    clone.key = 7
+    assert GenomeKey(clone, config) == key
+
+
+def test_key_changes_with_weight_bias_and_salt():
+    config = LoadConfig()
+    genome = NewGenome(config)
+    key = GenomeKey(genome, config)
+    assert GenomeKey(genome, config, salt='episodes=2') != key
+    connection = next(gene for gene in genome.connections.values() if gene.enabled)
+    connection.weight += 1e-12
+    weight_key = GenomeKey(genome, config)
+    assert weight_key != key
+    node = genome.nodes[config.genome_config.output_keys[0]]
+    node.bias += 1e-12
+    assert GenomeKey(genome, config) not in (key, weight_key)
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = FitnessCache(max_entries=2)
+    cache.Put('a', 1.0)
+    cache.Put('b', 2.0)
+    assert cache.Get('a') == 1.0
+    cache.Put('c', 3.0)
+    assert 'b' not in cache
+    assert cache.Get('b') is None
+    assert cache.Get('a') == 1.0 and cache.Get('c') == 3.0
+    assert cache.GetStatistics() == {'entries': 2, 'hits': 3, 'misses': 1, 'evictions': 1, 'hit_rate': 0.75}
+
+
+def test_saved_entries_are_loaded_for_the_same_salt_only(tmp_path):
+    path = str(tmp_path / 'fitness-cache')
+    cache = FitnessCache(path=path, salt='episodes=1')
+    for index in range(5):
+        cache.Put(str(index), float(index))
+    cache.Get('0')
+    cache.save()
+    assert len(FitnessCache(path=path, salt='episodes=2')) == 0
+    # the order of use is kept, a smaller cache keeps the most recently used entries
+    loaded = FitnessCache(max_entries=3, path=path, salt='episodes=1')
+    assert [key for key in '01234' if key in loaded] == ['0', '3', '4']
+    assert loaded.Get('4') == 4.0
+    # neat checkpoints pickle the reporters, the entries stay in the file
+    assert len(pickle.loads(pickle.dumps(loaded))) == 0
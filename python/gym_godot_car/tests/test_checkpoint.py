@@ -0,0 +1,78 @@
+import os
+import random
+
+import neat
+import pytest
+
+from gym_godot_car.checkpoint import IncrementalCheckpointer, ListGenerations, ListSegments, ReadRecords, RestoreCheckpoint
+
+config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config-feedforward')
+
+
+def LoadConfig():
+    return neat.Config(neat.DefaultGenome, neat.DefaultReproduction, neat.DefaultSpeciesSet, neat.DefaultStagnation, config_path)
+
+
+def EvaluateWeights(genomes, config):
+    # deterministic, so a restored run continues exactly like the original one
+    for _, genome in genomes:
+        genome.fitness = sum(gene.weight for gene in genome.connections.values() if gene.enabled) + \
+            sum(gene.bias for gene in genome.nodes.values())
+
+
+def Genes(population):
+    return {key: ({node: (gene.bias, gene.response, gene.activation, gene.aggregation) for node, gene in genome.nodes.items()},
+                  {connection: (gene.weight, gene.enabled) for connection, gene in genome.connections.items()})
+            for key, genome in population.population.items()}
+
+
+def Run(directory, generations, **kwargs):
+    random.seed(0)
+    population = neat.Population(LoadConfig())
+    checkpointer = IncrementalCheckpointer(directory, **kwargs)
+    population.add_reporter(checkpointer)
+    population.run(EvaluateWeights, generations)
+    checkpointer.close()
+    return population
+
+
+def test_restored_generation_continues_like_the_original_run(tmp_path):
+    directory = str(tmp_path)
+    original = Run(directory, 8, snapshot_interval=3)
+    assert [start for start, _ in ListSegments(directory)] == [1, 4, 7]
+    assert ListGenerations(directory) == list(range(1, 9))
+    checkpointer = IncrementalCheckpointer(directory, snapshot_interval=3)
+    restored = checkpointer.Restore(LoadConfig(), generation=5)
+    assert restored.generation == 5
+    restored.add_reporter(checkpointer)
+    restored.run(EvaluateWeights, 3)
+    checkpointer.close()
+    assert restored.generation == original.generation
+    assert Genes(restored) == Genes(original)
+    assert sorted(restored.species.species) == sorted(original.species.species)
+    for key, species in original.species.species.items():
+        assert sorted(restored.species.species[key].members) == sorted(species.members)
+    assert restored.best_genome.fitness == original.best_genome.fitness
+
+
+def test_record_cut_off_by_a_crash_ends_the_segment(tmp_path):
+    directory = str(tmp_path)
+    Run(directory, 3, snapshot_interval=50)
+    [(_, path)] = ListSegments(directory)
+    assert [generation for _, generation, _ in ReadRecords(path)] == [1, 2, 3]
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 10)
+    assert [generation for _, generation, _ in ReadRecords(path)] == [1, 2]
+    assert RestoreCheckpoint(LoadConfig(), directory).generation == 2
+    with pytest.raises(FileNotFoundError):
+        RestoreCheckpoint(LoadConfig(), directory, generation=3)
+
+
+def test_only_the_newest_segments_are_kept(tmp_path):
+    directory = str(tmp_path)
+    Run(directory, 8, snapshot_interval=2, keep_segments=2)
+    assert [start for start, _ in ListSegments(directory)] == [5, 7]
+    assert ListGenerations(directory) == [5, 6, 7, 8]
+    assert RestoreCheckpoint(LoadConfig(), directory).generation == 8
+    with pytest.raises(FileNotFoundError):
+        RestoreCheckpoint(LoadConfig(), directory, generation=3)
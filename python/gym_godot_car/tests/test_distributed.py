@@ -0,0 +1,138 @@
+import multiprocessing
+import threading
+import time
+
+import gym
+import numpy as np
+import pytest
+
+from gym_godot_car.distributed import DistributedEvaluator, WorkerMain, _RemoteWorker
+
+authkey = b'test'
+context = multiprocessing.get_context('spawn')
+
+
+class FakeGenome():
+    def __init__(self, key, seconds=0.0):
+        self.key = key
+        self.seconds = seconds
+        self.fitness = None
+
+
+class NullEnv(gym.Env):
+    observation_space = gym.spaces.Box(-1.0, 1.0, (1,), dtype=np.float32)
+    action_space = gym.spaces.Box(-1.0, 1.0, (1,), dtype=np.float32)
+
+    def __init__(self, worker_index):
+        self.worker_index = worker_index
+
+    def step(self, action):
+        return np.zeros(1, dtype=np.float32), 0.0, True, {}
+
+    def reset(self):
+        return np.zeros(1, dtype=np.float32)
+
+
+def EvaluateFake(genome, config, env):
+    # the worker with index 0 is a straggler
+    time.sleep(60.0 if env.worker_index == 0 and config == 'straggler' else genome.seconds)
+    return float(genome.key)
+
+
+class BrokenConnection():
+    def send(self, message):
+        raise BrokenPipeError()
+
+    def close(self):
+        pass
+
+
+class Cluster():
+    """Coordinator on a free localhost port and its worker processes."""
+    def __init__(self):
+        self.evaluator = DistributedEvaluator(('127.0.0.1', 0), authkey=authkey, chunk_size=1)
+        self.processes = []
+
+    def StartWorker(self, index):
+        process = context.Process(target=WorkerMain, args=(self.evaluator.address, authkey, EvaluateFake, NullEnv, index),
+                                  kwargs={'retry_interval': 0.1}, daemon=True)
+        process.start()
+        self.processes.append(process)
+        return process
+
+    def close(self):
+        self.evaluator.close()
+        for process in self.processes:
+            process.join(5.0)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+
+@pytest.fixture
+def cluster():
+    cluster = Cluster()
+    yield cluster
+    cluster.close()
+
+
+def StartEvaluate(evaluator, genomes, config):
+    thread = threading.Thread(target=evaluator.evaluate, args=(genomes, config), daemon=True)
+    thread.start()
+    return thread
+
+
+def WaitFor(condition, timeout=30.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end
+        time.sleep(0.05)
+
+
+def AssertEvaluated(genomes):
+    assert [genome.fitness for _, genome in genomes] == [float(genome_id) for genome_id, _ in genomes]
+
+
+def test_workers_join_and_leave_during_a_generation(cluster):
+    evaluator = cluster.evaluator
+    genomes = [(genome_id, FakeGenome(genome_id, 0.1)) for genome_id in range(30)]
+    first = cluster.StartWorker(1)
+    thread = StartEvaluate(evaluator, genomes, 'join')
+    WaitFor(lambda: sum(genome.fitness is not None for _, genome in genomes) >= 3)
+    # the first worker leaves while running a genome, the others take over its genomes
+    cluster.StartWorker(2)
+    cluster.StartWorker(3)
+    first.terminate()
+    thread.join(60.0)
+    assert not thread.is_alive()
+    AssertEvaluated(genomes)
+    assert evaluator.left == 1
+    assert evaluator.failures == 0
+
+
+def test_stragglers_genomes_are_redispatched(cluster):
+    evaluator = cluster.evaluator
+    genomes = [(genome_id, FakeGenome(genome_id, 0.05)) for genome_id in range(6)]
+    cluster.StartWorker(0)
+    thread = StartEvaluate(evaluator, genomes, 'straggler')
+    WaitFor(lambda: evaluator.workers and evaluator.workers[0].outstanding)
+    cluster.StartWorker(1)
+    start = time.monotonic()
+    thread.join(30.0)
+    assert not thread.is_alive()
+    assert time.monotonic() - start < 30.0
+    AssertEvaluated(genomes)
+    assert evaluator.redispatched >= 1
+
+
+def test_worker_that_fails_to_receive_a_chunk_is_dropped(cluster):
+    evaluator = cluster.evaluator
+    genomes = [(genome_id, FakeGenome(genome_id)) for genome_id in range(4)]
+    # joins before the others, so it gets the first chunk
+    evaluator.workers.append(_RemoteWorker(BrokenConnection(), 'broken'))
+    cluster.StartWorker(1)
+    thread = StartEvaluate(evaluator, genomes, 'broken')
+    thread.join(30.0)
+    assert not thread.is_alive()
+    AssertEvaluated(genomes)
+    assert all(worker.name != 'broken' for worker in evaluator.workers)
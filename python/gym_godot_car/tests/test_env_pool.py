@@ -0,0 +1,109 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from gym_godot_car.env_pool import EnvPool
+from gym_godot_car.envs.godot_car_env import GodotCarEnv
+from gym_godot_car.server import GodotCarServer
+
+
+class FakeEnv():
+    """Counts resets and closes, reset fails once broken is set."""
+    def __init__(self):
+        self.resets = 0
+        self.closed = False
+        self.broken = False
+
+    def reset(self):
+        if self.broken:
+            raise ConnectionResetError("Connection closed by server")
+        self.resets += 1
+
+    def close(self):
+        self.closed = True
+
+
+def WaitFor(condition, timeout=10.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end
+        time.sleep(0.01)
+
+
+def test_broken_envs_are_replaced():
+    with EnvPool(1, FakeEnv, retry_interval=0.01) as pool:
+        lease = pool.Acquire(timeout=10.0)
+        first = lease.env
+        lease.Release(broken=True)
+        with pool.Acquire(timeout=10.0) as lease:
+            second = lease.env
+        assert first.closed and not second.closed
+        assert second is not first
+        # a returned env is checked with a reset, one that fails it is replaced too
+        WaitFor(lambda: pool.ready == 1)
+        assert second.resets == 2
+        lease = pool.Acquire(timeout=10.0)
+        lease.env.broken = True
+        lease.Release()
+        third = pool.Acquire(timeout=10.0).env
+        assert second.closed and third is not second
+        assert (pool.created, pool.recycled) == (3, 2)
+
+
+def test_acquire_waits_for_a_returned_env():
+    with EnvPool(1, FakeEnv) as pool:
+        lease = pool.Acquire(timeout=10.0)
+        start = time.monotonic()
+        with pytest.raises(TimeoutError):
+            pool.Acquire(timeout=0.2)
+        assert time.monotonic() - start >= 0.2
+        threading.Timer(0.2, lease.Release).start()
+        assert pool.Acquire(timeout=10.0).env is lease.env
+
+
+def test_envs_leased_when_the_pool_is_closed_are_closed_on_release():
+    pool = EnvPool(2, FakeEnv)
+    lease = pool.Acquire(timeout=10.0)
+    WaitFor(lambda: pool.ready == 1)
+    warm = pool.Acquire(timeout=10.0)
+    warm.Release()
+    pool.close()
+    assert warm.env.closed
+    assert not lease.env.closed
+    lease.Release()
+    assert lease.env.closed
+    with pytest.raises(RuntimeError):
+        pool.Acquire(timeout=1.0)
+
+
+def FreePort():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def test_env_connects_once_the_server_is_up():
+    port = FreePort()
+    env = GodotCarEnv(port=port, connect_timeout=10.0) # does not connect yet
+    servers = []
+    def StartServer():
+        servers.append(GodotCarServer(port=port))
+        servers[0].StartInBackground()
+    threading.Timer(0.5, StartServer).start()
+    start = time.monotonic()
+    env.reset()
+    assert time.monotonic() - start >= 0.5
+    assert not env.step((0.5, 0.0, 0.0))[2]
+    env.close()
+    servers[0].shutdown()
+    servers[0].server_close()
+
+
+def test_connect_gives_up_after_connect_timeout():
+    env = GodotCarEnv(port=FreePort(), connect_timeout=0.5)
+    start = time.monotonic()
+    with pytest.raises(ConnectionError):
+        env.reset()
+    assert time.monotonic() - start < 2.0
@@ -0,0 +1,43 @@
+import functools
+import os
+import time
+
+from gym_godot_car.envs import GodotCarEnv
+from gym_godot_car.evaluation import ParallelEnvEvaluator
+
+
+class FakeGenome():
+    def __init__(self, key, hang_marker=None):
+        self.key = key
+        self.hang_marker = hang_marker
+        self.fitness = None
+
+
+def ConnectEnv(port, worker_index):
+    return GodotCarEnv(port=port, connect_timeout=2.0)
+
+
+def DriveTenSteps(genome, config, env):
+    env.reset()
+    fitness = 0.0
+    for step in range(10):
+        if step == 5 and genome.hang_marker and not os.path.exists(genome.hang_marker):
+            # hang in the middle of the first attempt, until the evaluator kills the worker
+            open(genome.hang_marker, 'w').close()
+            time.sleep(60.0)
+        _, reward, _, _ = env.step([1.0, 0.0, 0.0])
+        fitness += reward
+    return fitness
+
+
+def test_worker_killed_mid_genome_is_replaced_at_a_lockstep_server(lockstep_server, tmp_path):
+    genomes = [(0, FakeGenome(0)), (1, FakeGenome(1, str(tmp_path / 'hung'))), (2, FakeGenome(2))]
+    env_factory = functools.partial(ConnectEnv, lockstep_server.server_address[1])
+    with ParallelEnvEvaluator(1, DriveTenSteps, env_factory, timeout=2.0, chunk_size=1) as evaluator:
+        evaluator.evaluate(genomes, None)
+        # the killed worker never sent CLOSE, the car of its replacement is stepped anyway
+        assert evaluator.restarts == 1
+        assert evaluator.failures == 0
+    assert os.path.exists(str(tmp_path / 'hung'))
+    assert genomes[0][1].fitness > 0.0
+    assert [genome.fitness for _, genome in genomes] == [genomes[0][1].fitness] * 3
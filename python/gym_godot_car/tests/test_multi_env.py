@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from gym_godot_car.envs.godot_car_multi_env import MultiCarGodotEnv
+from gym_godot_car.sim import Car
+
+
+def test_two_cars_get_their_own_rewards(server):
+    env = MultiCarGodotEnv(2, port=server.server_address[1], timeout=2.0)
+    env.reset()
+    actions = np.array([[1.0, 0.0, 0.0], [0.3, 0.0, 0.1]])
+    cars = [Car(), Car()]
+    for step in range(10):
+        if step == 5:
+            # resetting the first car does not touch the score of the second
+            env._Run(env.clients[0].Reset())
+            cars[0] = Car()
+        _, rewards, dones, _ = env.step(actions)
+        assert not dones.any()
+        for index, car in enumerate(cars):
+            score = car.GetScore()
+            car.Control(*actions[index])
+            car.Step()
+            assert rewards[index] == pytest.approx(car.GetScore() - score, abs=1e-4)
+        assert rewards[0] != pytest.approx(rewards[1], abs=1e-3)
+    env.close()
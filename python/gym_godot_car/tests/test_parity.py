@@ -0,0 +1,56 @@
+import socket
+import sys
+
+import pytest
+
+from gym_godot_car.envs.godot_car_env import GodotCarEnv
+from gym_godot_car.parity import CompareRollouts, RandomActions, RecordedRollout, Rollout, ServerRollout, main
+
+
+def WithoutRegistration(rollout):
+    # the first reset of a server registers the car, its reply has no observation yet
+    return {column: values[1:] for column, values in rollout.items()}
+
+
+def test_stand_in_server_matches_python_backend(server):
+    actions = RandomActions(300)
+    rollout = ServerRollout('127.0.0.1', server.server_address[1], actions)
+    reference = Rollout(GodotCarEnv(backend='python'), actions)
+    assert not rollout['observations'][0].any()
+    result = CompareRollouts(WithoutRegistration(rollout), WithoutRegistration(reference), 1e-3)
+    assert result['steps'] == 299
+    assert result['first_mismatch'] is None
+    assert rollout['dones'].any() # the random actions crash, resets are compared too
+
+
+def test_recording_is_replayed_as_reference(server, tmp_path):
+    port = server.server_address[1]
+    ServerRollout('127.0.0.1', port, RandomActions(200, seed=1), record=str(tmp_path))
+    actions, reference = RecordedRollout(str(tmp_path), 150)
+    assert len(actions) == 150
+    result = CompareRollouts(ServerRollout('127.0.0.1', port, actions), reference, 1e-3)
+    assert result['first_mismatch'] is None
+    assert result['max_reward_deviation'] < 1e-3
+
+
+def test_first_mismatch_is_reported(server):
+    actions = RandomActions(100)
+    reference = Rollout(GodotCarEnv(backend='python'), actions)
+    reference['observations'][40, 5] += 0.01
+    rollout = ServerRollout('127.0.0.1', server.server_address[1], actions)
+    result = CompareRollouts(WithoutRegistration(rollout), WithoutRegistration(reference), 1e-3)
+    assert result['first_mismatch'] == 39
+    assert result['max_observation_deviation'][5] == pytest.approx(0.01, abs=1e-4)
+
+
+def FreePort():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def test_main_checks_a_server_against_the_stand_in_server(server, monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'argv', ['parity', '--port', str(server.server_address[1]),
+                                      '--reference-port', str(FreePort()), '--steps', '200'])
+    main()
+    assert "parity within tolerance" in capsys.readouterr().out
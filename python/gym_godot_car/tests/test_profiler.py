@@ -0,0 +1,12 @@
+import os
+import pickle
+
+from gym_godot_car.profiler import TrainingProfiler
+
+
+def test_restored_profiler_profiles_its_generations(tmp_path):
+    path = str(tmp_path / 'neat-profile')
+    profiler = pickle.loads(pickle.dumps(TrainingProfiler(path=path, profile_generations=[3], verbose=False)))
+    profiler.start_generation(3)
+    profiler._profile.__exit__(None, None, None)
+    assert os.path.exists(path + '-gen3.prof')
@@ -0,0 +1,94 @@
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+from gym_godot_car import protocol
+
+observation = np.arange(9, dtype=np.float32) * 1.5
+replies = [protocol.EncodeTextSense(1.25, False, observation),
+           protocol.EncodeBinarySense(-3.0, True, observation),
+           protocol.EncodeTextSense(4.5, True, observation + 1)]
+stream = b''.join(replies)
+
+
+@pytest.fixture
+def pair():
+    server, client = socket.socketpair()
+    client.settimeout(2.0)
+    yield server, client
+    server.close()
+    client.close()
+
+
+def SendLater(connection, data, delay=0.005):
+    timer = threading.Timer(delay, connection.sendall, (data,))
+    timer.start()
+    return timer
+
+
+def test_replies_split_at_every_byte(pair):
+    server, client = pair
+    for split in range(1, len(stream)):
+        reader = protocol.ReplyReader(client)
+        server.sendall(stream[:split])
+        timer = SendLater(server, stream[split:])
+        assert [bytes(reader.Read()) for _ in replies] == replies
+        timer.join()
+
+
+def test_replies_split_into_single_bytes(pair):
+    server, client = pair
+    reader = protocol.ReplyReader(client, buffer_size=64)
+    thread = threading.Thread(target=lambda: [server.sendall(stream[idx:idx+1]) for idx in range(len(stream))])
+    thread.start()
+    assert [bytes(reader.Read()) for _ in replies] == replies
+    thread.join()
+
+
+def test_coalesced_replies_are_read_one_by_one(pair):
+    server, client = pair
+    reader = protocol.ReplyReader(client)
+    server.sendall(stream * 2)
+    assert [bytes(reader.Read()) for _ in range(6)] == replies * 2
+    score, crash, decoded = protocol.DecodeSense(replies[1])
+    assert (score, crash) == (-3.0, True)
+    np.testing.assert_array_equal(decoded, observation)
+
+
+def test_latest_skips_older_complete_replies(pair):
+    server, client = pair
+    reader = protocol.ReplyReader(client)
+    # the last reply is still incomplete, latest returns the newest complete one and keeps the rest
+    server.sendall(stream + replies[0][:5])
+    assert bytes(reader.Read(latest=True)) == replies[2]
+    server.sendall(replies[0][5:])
+    assert bytes(reader.Read(latest=True)) == replies[0]
+
+
+def test_register_response_with_features_is_framed(pair):
+    server, client = pair
+    reader = protocol.ReplyReader(client)
+    register = protocol.EncodeRegisterResponse('car-1', {'BINARY': 1, 'RESET': 1})
+    for split in range(1, len(register)):
+        server.sendall(register[:split])
+        timer = SendLater(server, register[split:] + replies[0])
+        car_id, features = protocol.DecodeRegisterResponse(reader.ReadRegisterResponse())
+        assert (car_id, features) == ('car-1', {'BINARY': 1, 'RESET': 1})
+        assert reader.framed
+        assert bytes(reader.Read()) == replies[0]
+        timer.join()
+
+
+def test_legacy_replies_without_terminator(pair):
+    server, client = pair
+    reader = protocol.ReplyReader(client)
+    server.sendall(b'legacy-id')
+    assert bytes(reader.ReadRegisterResponse()) == b'legacy-id'
+    assert not reader.framed
+    # every recv is one reply
+    legacy = protocol.EncodeTextSense(2.0, False, observation, terminated=False)
+    assert not legacy.endswith(b'\n')
+    server.sendall(legacy)
+    assert bytes(reader.Read()) == legacy
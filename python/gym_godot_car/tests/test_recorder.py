@@ -0,0 +1,56 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from gym_godot_car.envs.godot_car_env import GodotCarEnv
+from gym_godot_car.recorder import ReplayEnv, TrajectoryReader, TrajectoryRecorder, episodes_name, index_name
+
+
+def Record(directory, episodes, chunk_steps):
+    env = TrajectoryRecorder(GodotCarEnv(backend='python'), directory, chunk_steps=chunk_steps)
+    returns = []
+    for _ in range(episodes):
+        env.reset()
+        total = 0.0
+        done = False
+        while not done:
+            _, reward, done, _ = env.step((1.0, 0.0, 0.0))
+            total += reward
+        returns.append(total)
+    return env, returns
+
+
+def test_episodes_are_appended_and_read_back(tmp_path):
+    directory = str(tmp_path)
+    env, returns = Record(directory, 6, chunk_steps=16)
+    env.close()
+    with open(os.path.join(directory, index_name)) as f:
+        assert 'episodes' not in json.load(f)
+    with open(os.path.join(directory, episodes_name)) as f:
+        assert len(f.readlines()) == 6
+    reader = TrajectoryReader(directory)
+    assert reader.num_episodes == 6
+    np.testing.assert_allclose(reader.returns, returns, atol=1e-3)
+    assert reader.episodes[:, 1].sum() == len(reader)
+    replay = ReplayEnv(reader)
+    for episode in range(6):
+        replay.reset()
+        total = 0.0
+        done = False
+        while not done:
+            _, reward, done, _ = replay.step(None)
+            total += reward
+        assert total == pytest.approx(reader.returns[episode], abs=1e-3)
+
+
+def test_episodes_past_the_flushed_chunks_are_ignored(tmp_path):
+    # like after a crash between appending the episodes and replacing the index
+    directory = str(tmp_path)
+    env, _ = Record(directory, 3, chunk_steps=16)
+    env.close()
+    with open(os.path.join(directory, episodes_name), 'a') as f:
+        f.write(json.dumps([len(TrajectoryReader(directory)), 10, 1.0, [0.0] * 9]) + "\n")
+        f.write('[0, 1')
+    assert TrajectoryReader(directory).num_episodes == 3
@@ -0,0 +1,187 @@
+import socket
+
+import numpy as np
+import pytest
+
+from gym_godot_car import protocol
+from gym_godot_car.envs import GodotCarEnv
+from gym_godot_car.sim import Car
+
+actions = [(0.8, 0.0, 0.05)] * 6 + [(0.5, 0.0, -0.05)] * 6
+
+
+def MakeEnv(server, **kwargs):
+    return GodotCarEnv(port=server.server_address[1], connect_timeout=2.0, **kwargs)
+
+
+def test_in_band_reset_keeps_connection_and_car(server):
+    env = MakeEnv(server)
+    env.reset()
+    car_id, connection = env.client._id, env.client._socket
+    for action in actions:
+        env.step(action)
+    observation = env.reset()
+    assert env.client._id == car_id
+    assert env.client._socket is connection
+    np.testing.assert_allclose(observation, Car().GetObservation(), rtol=1e-6)
+    assert env.client._total_reward == 0.0
+    env.close()
+
+
+def test_reset_is_answered_with_the_start_observation(server):
+    connection = socket.create_connection(server.server_address, timeout=2.0)
+    reader = protocol.ReplyReader(connection)
+    connection.sendall(protocol.EncodeText("(REGISTER)"))
+    _, features = protocol.DecodeRegisterResponse(reader.ReadRegisterResponse())
+    assert features['RESET'] == protocol.reset_version
+    connection.sendall(protocol.EncodeTextControl(1.0, 0.0, 0.3))
+    reader.Read()
+    connection.sendall(protocol.EncodeText("(RESET)"))
+    score, crash, observation = protocol.DecodeSense(reader.Read())
+    car = Car()
+    assert score == 0.0 and not crash
+    np.testing.assert_allclose(observation, car.GetObservation(), rtol=1e-6)
+    connection.close()
+
+
+def test_reconnect_mode_registers_a_new_car(server):
+    env = MakeEnv(server, reset_mode='reconnect')
+    env.reset()
+    car_id = env.client._id
+    env.reset()
+    assert env.client._id != car_id
+    env.close()
+
+
+def test_text_only_server_falls_back_to_reconnect(text_server):
+    env = MakeEnv(text_server)
+    env.reset()
+    car_id = env.client._id
+    env.step(actions[0])
+    env.reset()
+    assert not env.client._in_band_reset
+    assert env.client._id != car_id
+    env.close()
+
+
+def test_score_is_kept_per_car(server):
+    # like Car.gd each car reports its own score, resetting one car does not touch the others
+    first, second = MakeEnv(server), MakeEnv(server)
+    first.reset()
+    second.reset()
+    car = Car()
+    total = 0.0
+    for index, action in enumerate(actions):
+        first.step((1.0, 0.0, 0.0))
+        if index == len(actions) // 2:
+            first.reset()
+        _, reward, _, _ = second.step(action)
+        car.Control(*action)
+        car.Step()
+        total += reward
+        assert total == pytest.approx(car.GetScore(), abs=1e-4)
+    first.close()
+    second.close()
+
+
+def RegisterRaw(server):
+    connection = socket.create_connection(server.server_address, timeout=2.0)
+    reader = protocol.ReplyReader(connection)
+    connection.sendall(protocol.EncodeText("(REGISTER)"))
+    reader.ReadRegisterResponse()
+    return connection, reader
+
+
+def test_lockstep_goes_on_when_a_connection_is_closed_without_close(lockstep_server):
+    first, first_reader = RegisterRaw(lockstep_server)
+    second, _ = RegisterRaw(lockstep_server)
+    first.sendall(protocol.EncodeTextControl(1.0, 0.0, 0.0))
+    # the cars are stepped together, so the first car waits for the second one
+    first.settimeout(0.3)
+    with pytest.raises(socket.timeout):
+        first_reader.Read()
+    second.close()
+    first.settimeout(2.0)
+    _, _, observation = protocol.DecodeSense(first_reader.Read())
+    car = Car()
+    car.Control(1.0, 0.0, 0.0)
+    car.Step()
+    np.testing.assert_allclose(observation, car.GetObservation(), rtol=1e-5)
+    first.close()
+
+
+def DriveRepeated(env, action, steps):
+    env.reset()
+    observations, rewards = [], []
+    for _ in range(steps):
+        observation, reward, done, _ = env.step(action)
+        observations.append(np.array(observation))
+        rewards.append(reward)
+        if done:
+            break
+    return np.array(observations), np.array(rewards)
+
+
+def DriveSingleSteps(env, action, frame_skip, steps):
+    # frame_skip single steps per step of DriveRepeated
+    observations, rewards = DriveRepeated(env, action, steps * frame_skip)
+    rewards = np.add.reduceat(rewards, np.arange(0, len(rewards), frame_skip))
+    return observations[frame_skip - 1::frame_skip], rewards
+
+
+@pytest.mark.parametrize('protocol_name', ['binary', 'text'])
+def test_repeated_control_equals_single_steps(server, protocol_name):
+    repeated, single = MakeEnv(server, protocol=protocol_name, frame_skip=4), MakeEnv(server, protocol=protocol_name)
+    observations, rewards = DriveRepeated(repeated, (0.6, 0.0, 0.02), 5)
+    assert repeated.client._repeat
+    expected_observations, expected_rewards = DriveSingleSteps(single, (0.6, 0.0, 0.02), 4, 5)
+    np.testing.assert_allclose(observations, expected_observations, rtol=1e-6)
+    # the reward of a step is that of all its repeats
+    np.testing.assert_allclose(rewards, expected_rewards, atol=1e-4)
+    repeated.close()
+    single.close()
+
+
+def test_repeats_stop_at_the_crash(server):
+    repeated, single = MakeEnv(server, frame_skip=8), MakeEnv(server)
+    _, rewards = DriveRepeated(repeated, (1.0, 0.0, 0.0), 100)
+    _, expected_rewards = DriveRepeated(single, (1.0, 0.0, 0.0), 800)
+    assert repeated.client.GetEpisodeStatus() and single.client.GetEpisodeStatus()
+    assert len(expected_rewards) % 8 != 0
+    assert len(rewards) == -(-len(expected_rewards) // 8)
+    assert repeated.get_state().step_counter == single.get_state().step_counter == len(expected_rewards)
+    assert rewards.sum() == pytest.approx(expected_rewards.sum(), abs=1e-3)
+    repeated.close()
+    single.close()
+
+
+def test_text_only_server_repeats_with_single_steps(text_server):
+    repeated, single = MakeEnv(text_server, frame_skip=3), MakeEnv(text_server)
+    observations, rewards = DriveRepeated(repeated, (0.6, 0.0, 0.02), 5)
+    assert not repeated.client._repeat
+    expected_observations, expected_rewards = DriveSingleSteps(single, (0.6, 0.0, 0.02), 3, 5)
+    np.testing.assert_allclose(observations, expected_observations, rtol=1e-6)
+    np.testing.assert_allclose(rewards, expected_rewards, atol=1e-4)
+    repeated.close()
+    single.close()
+
+
+@pytest.mark.parametrize('binary', [True, False])
+def test_control_with_repeat_count_on_the_wire(server, binary):
+    connection, reader = RegisterRaw(server)
+    if binary:
+        message = protocol.EncodeBinaryControl(0.7, 0.0, -0.1, 5)
+        assert protocol.frame_header.unpack(message[:protocol.frame_header.size])[1:] == \
+            (protocol.command_control_repeat, protocol.control_repeat_payload.size)
+    else:
+        message = protocol.EncodeTextControl(0.7, 0.0, -0.1, 5)
+        assert message.endswith(b";5)")
+    connection.sendall(message)
+    score, crash, observation = protocol.DecodeSense(reader.Read())
+    car = Car()
+    car.Control(0.7, 0.0, -0.1)
+    car.Step(5)
+    assert not crash
+    assert score == pytest.approx(car.GetScore(), abs=1e-4)
+    np.testing.assert_allclose(observation, car.GetObservation(), rtol=1e-5)
+    connection.close()
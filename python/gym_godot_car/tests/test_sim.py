@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from gym_godot_car.sim import Car
+from gym_godot_car.sim.car import CarBatch
+
+
+def test_crashed_cars_of_a_batch_keep_their_state():
+    actions = np.array([[1.0, 0.0, 0.8], [0.2, 0.0, 0.0]])
+    batch = CarBatch(2)
+    cars = [Car(), Car()]
+    while not batch.crash[0]:
+        batch.Control(actions)
+        batch.Step()
+        for car, action in zip(cars, actions):
+            car.Control(*action)
+            car.Step()
+    assert cars[0].crash and not batch.crash[1]
+    # new inputs change neither the inputs nor the driving force of the crashed car
+    actions = np.array([[0.0, 1.0, -0.8], [0.0, 1.0, -0.8]])
+    batch.Control(actions)
+    batch.Step()
+    for index, (car, action) in enumerate(zip(cars, actions)):
+        car.Control(*action)
+        car.Step()
+        assert batch.GetState(index) == pytest.approx(car.GetState(), abs=1e-6)
@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+from gym_godot_car import protocol
+from gym_godot_car.envs.godot_car_env import GodotCarEnv
+from gym_godot_car.envs.godot_car_vec_env import GodotCarVecEnv
+from gym_godot_car.sim import CarState
+from gym_godot_car.sim.car import StateScore
+from gym_godot_car.termination import StepBudget, TerminationPolicy
+
+
+def Actions(steps, seed=0):
+    # slow enough that the car does not crash within the steps of the tests
+    random = np.random.RandomState(seed)
+    return np.column_stack([random.uniform(0.1, 0.3, steps), np.zeros(steps), random.uniform(-0.02, 0.02, steps)])
+
+
+def Drive(env, actions):
+    observations, rewards = [], []
+    for action in actions:
+        observation, reward, done, _ = env.step(action)
+        assert not done
+        observations.append(np.array(observation))
+        rewards.append(reward)
+    return np.array(observations), np.array(rewards)
+
+
+def SnapshotAndBranches(env):
+    """Drive to a snapshot, drive on and drive on again from the snapshot."""
+    env.reset()
+    Drive(env, Actions(20))
+    state = env.get_state()
+    observation = np.array(env.client.GetObservation())
+    branch = Drive(env, Actions(20, seed=1))
+    Drive(env, Actions(5, seed=2))
+    assert np.array_equal(env.set_state(state), observation)
+    return state, branch, Drive(env, Actions(20, seed=1))
+
+
+def test_python_backend_continues_bit_identical_from_a_state():
+    state, branch, again = SnapshotAndBranches(GodotCarEnv(backend='python'))
+    assert isinstance(state, CarState)
+    assert state.step_counter == 20
+    assert np.array_equal(again[0], branch[0])
+    assert np.array_equal(again[1], branch[1])
+
+
+def test_server_continues_from_a_state_within_float_precision(server):
+    env = GodotCarEnv(port=server.server_address[1])
+    _, branch, again = SnapshotAndBranches(env)
+    # the observations cross the connection as float32
+    assert again[0] == pytest.approx(branch[0], abs=1e-6)
+    assert again[1] == pytest.approx(branch[1], abs=1e-6)
+    env.close()
+
+
+def test_state_of_the_python_backend_continues_on_a_server(server):
+    reference = GodotCarEnv(backend='python')
+    reference.reset()
+    Drive(reference, Actions(20))
+    state = reference.get_state()
+    env = GodotCarEnv(port=server.server_address[1])
+    env.reset()
+    assert env.set_state(state) == pytest.approx(reference.client.GetObservation(), abs=1e-6)
+    assert env.get_state() == state
+    observations, rewards = Drive(env, Actions(20, seed=1))
+    expected_observations, expected_rewards = Drive(reference, Actions(20, seed=1))
+    # float32 on the connection, about 6e-8 relative
+    assert observations == pytest.approx(expected_observations, rel=1e-6, abs=1e-6)
+    # differences of the float32 scores
+    assert rewards == pytest.approx(expected_rewards, abs=1e-4)
+    env.close()
+
+
+def test_one_state_is_cloned_into_the_given_cars():
+    reference = GodotCarEnv(backend='python')
+    reference.reset()
+    Drive(reference, Actions(20))
+    state = reference.get_state()
+    env = GodotCarVecEnv(4)
+    start = env.reset()
+    observations = env.set_state(state, [1, 3])
+    assert np.array_equal(observations[[0, 2]], start[[0, 2]])
+    for index in (1, 3):
+        assert observations[index] == pytest.approx(reference.client.GetObservation(), abs=1e-5)
+        assert env.get_state(index) == pytest.approx(state, abs=1e-6)
+    action = Actions(1, seed=1)[0]
+    _, expected_reward, _, _ = reference.step(action)
+    _, rewards, dones, _ = env.step(np.tile(action, (4, 1)))
+    assert not dones.any()
+    # the cloned cars count on from the score of the state, the others from the start
+    assert rewards[[1, 3]] == pytest.approx([expected_reward] * 2, abs=1e-5)
+    assert rewards[0] == rewards[2]
+    assert rewards[0] != pytest.approx(expected_reward, abs=1e-5)
+
+
+def test_termination_counts_on_from_the_state():
+    env = GodotCarEnv(backend='python', frame_skip=2, termination=TerminationPolicy([StepBudget(20)]))
+    env.reset()
+    Drive(env, Actions(10))
+    state = env.get_state()
+    assert state.step_counter == 20
+    branch = GodotCarEnv(backend='python', frame_skip=2, termination=TerminationPolicy([StepBudget(20)]))
+    branch.reset()
+    branch.set_state(state)
+    assert branch.termination.steps == 10
+    assert branch.termination.total_reward == StateScore(state)
+    assert branch.termination.total_reward == pytest.approx(env.termination.total_reward, abs=1e-6)
+    Drive(branch, Actions(9, seed=1))
+    _, _, done, info = branch.step(Actions(1, seed=2)[0])
+    assert done
+    assert info['termination'] == 'step_budget'
+
+
+def test_text_state_round_trip():
+    state = CarState(*(np.arange(18) / 7.0 + 1e-9), True)
+    assert protocol.DecodeState(protocol.EncodeTextState(state)) == list(state)
+    assert protocol.DecodeState(protocol.EncodeTextState(state._replace(crash=False)))[-1] is False
+    request = protocol.EncodeTextSetState(state).decode('ascii')
+    body = request[request.index(')') + 1:]
+    assert body.startswith("(SETSTATE:") and body.endswith(")")
+    assert protocol.DecodeStateFields(body[len("(SETSTATE:"):-1].split(';')) == list(state)
@@ -0,0 +1,76 @@
+import subprocess
+import sys
+import time
+
+import gym
+import numpy as np
+import pytest
+
+from gym_godot_car.envs.godot_car_env import GodotCarEnv
+from gym_godot_car.envs.godot_car_subproc_env import SubprocGodotCarVecEnv
+from gym_godot_car.termination import StepBudget, TerminationPolicy
+
+
+def test_envs_import_without_shared_memory():
+    # Python 3.7 has no multiprocessing.shared_memory, only SubprocGodotCarVecEnv needs it
+    code = ("import sys; sys.modules['multiprocessing.shared_memory'] = None; "
+            "import gym, gym_godot_car.envs; gym.make('godot-car-v0', backend='python').reset()")
+    subprocess.run([sys.executable, '-c', code], check=True)
+
+
+class SlowEnv(gym.Env):
+    observation_space = gym.spaces.Box(-1.0, 1.0, (9,), dtype=np.float32)
+    action_space = gym.spaces.Box(-1.0, 1.0, (3,), dtype=np.float32)
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def step(self, action):
+        time.sleep(self.seconds)
+        return np.zeros(9, dtype=np.float32), 0.0, False, {}
+
+    def reset(self):
+        return np.zeros(9, dtype=np.float32)
+
+
+def SlowEnvFactory(worker_index):
+    # each worker answers well within the timeout after the one before
+    return SlowEnv(0.8 * (worker_index + 1))
+
+
+def StepBudgetEnvFactory(worker_index):
+    return GodotCarEnv(backend='python', termination=TerminationPolicy([StepBudget(3 + worker_index)]))
+
+
+def test_infos_of_the_workers_are_returned():
+    env = SubprocGodotCarVecEnv(2, StepBudgetEnvFactory)
+    env.reset()
+    action = np.tile([0.3, 0.0, 0.0], (2, 1))
+    for _ in range(3):
+        observations, _, dones, infos = env.step(action)
+        assert infos[1] == {}
+    assert dones.tolist() == [True, False]
+    assert infos[0]['termination'] == 'step_budget'
+    assert 'penalty' in infos[0]
+    assert 'terminal_observation' in infos[0]
+    assert not np.array_equal(infos[0]['terminal_observation'], observations[0])
+    _, _, dones, infos = env.step(action)
+    assert dones.tolist() == [False, True]
+    assert infos[0] == {}
+    assert infos[1]['termination'] == 'step_budget'
+    env.close()
+
+
+def test_timeout_covers_all_workers_and_breaks_the_env():
+    env = SubprocGodotCarVecEnv(3, SlowEnvFactory, timeout=1.0)
+    env.reset()
+    env.step_async(np.zeros((3, 3)))
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        env.step_wait()
+    assert time.monotonic() - start < 1.5
+    # the late answers of the workers must not count for another step
+    time.sleep(2.0)
+    with pytest.raises(RuntimeError):
+        env.step_async(np.zeros((3, 3)))
+    env.close()
@@ -0,0 +1,71 @@
+import multiprocessing
+import pickle
+
+import pytest
+
+from gym_godot_car.envs.godot_car_env import GodotCarEnv
+from gym_godot_car.evaluation import EvaluateGenome
+from gym_godot_car.termination import BestCutoff, RunningBest, Stalled, StepBudget, TerminationPolicy, TerminationRule
+
+
+def UpdateBest(best, fitness):
+    best.Update(fitness)
+
+
+def test_running_best_is_shared_with_spawned_workers():
+    context = multiprocessing.get_context('spawn')
+    best = RunningBest(context)
+    process = context.Process(target=UpdateBest, args=(best, 12.5))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert best.value == 12.5
+
+
+def test_checkpoint_of_running_best_keeps_the_value():
+    best = RunningBest()
+    best.Update(3.0)
+    restored = pickle.loads(pickle.dumps(best))
+    assert restored.value == 3.0
+    restored.Update(4.0)
+    assert best.value == 3.0
+
+
+def DriveEpisode(genome, config, env, action=(1.0, 0.0, 0.0)):
+    # like eval_genome of the training script
+    env.reset()
+    fitness = 0.0
+    while True:
+        _, reward, done, info = env.step(action)
+        if done:
+            return fitness + info.get('penalty', 0.0)
+        fitness += reward
+
+
+def test_episodes_cut_by_best_cutoff_are_not_cacheable():
+    best = RunningBest()
+    env = GodotCarEnv(backend='python', termination=TerminationPolicy([StepBudget(5), BestCutoff(best, 5)]))
+    _, result = EvaluateGenome(0, None, None, env, 0, None, DriveEpisode)
+    assert result[5]
+    best.Update(1e6)
+    _, result = EvaluateGenome(1, None, None, env, 0, None, DriveEpisode)
+    assert not result[5]
+    assert env.termination.fired == {'step_budget': 1, 'best_cutoff': 1}
+
+
+def test_stalled_car_is_charged_the_remaining_step_penalty():
+    standing = (0.0, 1.0, 0.0)
+    env = GodotCarEnv(backend='python', termination=TerminationPolicy([]))
+    fitness = DriveEpisode(None, None, env, standing)
+    assert env.termination.fired == {'min_score': 1}
+    env = GodotCarEnv(backend='python', termination=TerminationPolicy([Stalled(steps=5)]))
+    assert DriveEpisode(None, None, env, standing) == pytest.approx(fitness, abs=1.0)
+    assert env.termination.fired == {'stalled': 1}
+    assert env.termination.total_reward == pytest.approx(env.termination.min_score)
+
+
+def test_termination_rules_implement_check():
+    class Incomplete(TerminationRule):
+        pass
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -10,106 +10,132 @@ import sys
 import time
 import pickle
 import math
+import multiprocessing
+import functools
 
 import gym
 from gym import wrappers, logger
 import gym_godot_car
 import neat
+from gym_godot_car.network import MatrixNetwork
+from gym_godot_car.evaluation import ParallelEnvEvaluator
+from gym_godot_car.distributed import DistributedEvaluator
+from gym_godot_car.recorder import TrajectoryRecorder
+from gym_godot_car.pool import SimulatorPool
+from gym_godot_car.cache import FitnessCache
+from gym_godot_car.checkpoint import IncrementalCheckpointer
+from gym_godot_car.profiler import TrainingProfiler
+from gym_godot_car.termination import TerminationPolicy, NoProgress, Stalled, StepBudget, BestCutoff, RunningBest
 
 runs_per_net = 1
-
-def get_scaled_observation(observation):
-    """Get full observation, scaled into (approximately) [0, 1]."""
-    # observation = sensor_readings[0], sensor_readings[1], sensor_readings[2], sensor_readings[3], sensor_readings[4], velocity_longitudinal, psi, position.x, position.y
-    max_pos_x = 1280.0
-    max_pos_y = 600.0
-    max_sensor_range = 100.0
-    min_velocity =    0.0
-    max_velocity = +100.0
-    min_psi = -math.pi
-    max_psi = +math.pi
-    return [observation[0]/max_sensor_range,
-            observation[1]/max_sensor_range,
-            observation[2]/max_sensor_range,
-            observation[3]/max_sensor_range,
-            observation[4]/max_sensor_range,
-            (observation[5]-min_velocity)/(max_velocity-min_velocity),
-            (observation[6]-min_psi)/(max_psi-min_psi),
-            observation[7]/max_pos_x,
-            observation[8]/max_pos_y]
-
-def get_scaled_action(action):
-    """Get full action, scaled from [0, 1] to the maximum values allowed by the environment/simulator/car."""
-    # action = throttle, brake, steering
-    min_steer = -1.0
-    max_steer = +1.0
-    return [action[0],
-            action[1],
-            (action[2]*(max_steer-min_steer))+min_steer]
+genome_timeout = 120.0 # seconds, a genome taking longer is retried once and then gets the minimum fitness
+simulator_backend = 'godot' # 'godot' or 'python' starts one server per worker, None uses servers started by hand
+# the server steps its cars in lockstep, so every worker drives the only car of its own server:
+# with simulator_backend = None worker i connects to 127.0.0.1:42424+i, start that many servers (godot --port=N)
+num_workers = multiprocessing.cpu_count() if simulator_backend else 1
+max_episode_steps = 10000
+resume_from_checkpoint = False # continue the run saved in neat-checkpoint/ from its latest generation
+record_trajectories = False # record every episode of every worker to /tmp/godot-car-trajectories (disk use grows with the run)
+coordinator_address = None # e.g. ('0.0.0.0', 42500): evaluate on the workers of other hosts (python -m gym_godot_car.distributed)
+
+def make_termination(best=None):
+    """End episodes of cars that circle or stand still, and (given the RunningBest) those that cannot beat the best of the generation anymore."""
+    rules = [NoProgress(steps=50, min_distance=20.0),
+             Stalled(steps=20, min_speed=1.0),
+             StepBudget(max_episode_steps)]
+    if best is not None:
+        rules.append(BestCutoff(best, max_episode_steps))
+    return TerminationPolicy(rules)
+
+def make_env(worker_index, addresses=None, best=None):
+    """Environment of one evaluation worker, it is kept for all genomes the worker evaluates (one server per worker)."""
+    ip, port = addresses[worker_index % len(addresses)] if addresses else ('127.0.0.1', 42424 + worker_index)
+    env = gym.make('godot-car-v0', ip=ip, port=port, termination=make_termination(best))
+    if record_trajectories:
+        # Record observations, actions and rewards of all episodes, see gym_godot_car.recorder for replaying them.
+        outdir = "/tmp/godot-car-trajectories/worker-{:d}".format(worker_index)
+        env = TrajectoryRecorder(env, directory=outdir, force=True)
+    env.seed(0)
+    return env
 
 # Use the NN network phenotype and the agent act function.
-def eval_genome(genome, config):
-    net = neat.nn.FeedForwardNetwork.create(genome, config)
+def eval_genome(genome, config, env):
+    # the compiled network takes the raw observation and returns the action, scaling included
+    net = MatrixNetwork.create(genome, config)
 
     fitnesses = []
 
-    env = gym.make('godot-car-v0')
     for runs in range(runs_per_net):
         print(".", end='', flush=True)
-
-        # You provide the directory to write to (can be an existing
-        # directory, including one with existing data -- all monitor files
-        # will be namespaced). You can also dump to a tempdir if you'd
-        # like: tempfile.mkdtemp().
-        outdir = "/tmp/random-godot-car-agent-results"
-        env = wrappers.Monitor(env, directory=outdir, force=True)
-        env.seed(0)
         observation = env.reset()
 
         # Run the simulation
         fitness = 0.0
         done = False
         while True:
-            action = net.activate(get_scaled_observation(observation))
-            observation, reward, done, _ = env.step(get_scaled_action(action))
+            observation, reward, done, info = env.step(net.activate(observation))
             if done:
+                # the last reward is left out, but not the step penalty of an episode ended as hopeless
+                fitness += info.get('penalty', 0.0)
                 break
 
             fitness += reward
         fitnesses.append(fitness)
-    # Close the env and write monitor result info to disk
-    env.close()
     # The genome's fitness is its worst performance across all runs.
+    env.termination.Finish(min(fitnesses))
     return min(fitnesses)
 
 
-def eval_genomes(genomes, config):
-    for genome_id, genome in genomes:
-        genome.fitness = eval_genome(genome, config)
-    print("", flush=True)
-
-
 def run(config_path):
     # Load configuration.
     config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
                          neat.DefaultSpeciesSet, neat.DefaultStagnation,
                          config_path)
 
+    # every generation is saved in the background, see gym_godot_car.checkpoint
+    checkpointer = IncrementalCheckpointer('neat-checkpoint', snapshot_interval=50)
+
     # Create the population, which is the top-level object for a NEAT run.
-    p = neat.Population(config)
+    p = checkpointer.Restore(config) if resume_from_checkpoint else neat.Population(config)
     
     # Add a stdout reporter to show progress in the terminal.
     p.add_reporter(neat.StdOutReporter(True))
     stats = neat.StatisticsReporter()
     p.add_reporter(stats)
-    p.add_reporter(neat.Checkpointer(5))
-
-    # Run until solution was found or until extinction
-    winner = p.run(eval_genomes)
+    p.add_reporter(checkpointer)
+    # best fitness of the running generation, shared with the workers for BestCutoff
+    best = RunningBest()
+    p.add_reporter(best)
+    # the env is seeded, so unchanged networks (e.g. elites) keep their fitness instead of being simulated again
+    salt = "runs_per_net={:d};max_episode_steps={:d};termination={!r}".format(runs_per_net, max_episode_steps, make_termination(best))
+    cache = FitnessCache(path='neat-fitness-cache', salt=salt)
+    p.add_reporter(cache)
+    # phase times of each generation and evaluation time of each genome, in neat-profile-*.csv
+    profiler = TrainingProfiler(path='neat-profile')
+    profiler.Attach(p)
+
+    # Run until solution was found or until extinction, the workers and their envs live for the whole run
+    pool = SimulatorPool(num_workers, simulator_backend) if simulator_backend and not coordinator_address else None
+    try:
+        if coordinator_address:
+            # remote workers cannot share the RunningBest, their episodes are not cut by BestCutoff
+            evaluator = DistributedEvaluator(coordinator_address, timeout=genome_timeout, cache=cache, profiler=profiler)
+        else:
+            # every worker keeps the lease of its server, crashed servers are restarted on the same port
+            addresses = [pool.Acquire().address for _ in range(num_workers)] if pool else None
+            evaluator = ParallelEnvEvaluator(num_workers, eval_genome, functools.partial(make_env, addresses=addresses, best=best),
+                                             timeout=genome_timeout, cache=cache, profiler=profiler)
+        with evaluator:
+            winner = p.run(profiler.Timed(evaluator.evaluate, 'evaluation'))
+    finally:
+        checkpointer.close()
+        if pool:
+            pool.close()
 
     # Save the winner.
     with open('winner-feedforward', 'wb') as f:
         pickle.dump(winner, f)
+    MatrixNetwork.create(winner, config).save('winner-feedforward.npz')
 
     # Display the winning genome.
     print('\nBest genome:\n{!s}'.format(winner))
@@ -4,6 +4,7 @@ import time
 import gym
 from gym import wrappers, logger
 import gym_godot_car
+from gym_godot_car.recorder import TrajectoryRecorder
 
 
 class RandomAgent(object):
@@ -21,12 +22,9 @@ if __name__ == "__main__":
 
     env = gym.make('godot-car-v0')
 
-    # You provide the directory to write to (can be an existing
-    # directory, including one with existing data -- all monitor files
-    # will be namespaced). You can also dump to a tempdir if you'd
-    # like: tempfile.mkdtemp().
+    # Record observations, actions and rewards of all episodes, see gym_godot_car.recorder for replaying them.
     outdir = "/tmp/random-godot-car-agent-results"
-    env = wrappers.Monitor(env, directory=outdir, force=True)
+    env = TrajectoryRecorder(env, directory=outdir, force=True)
     env.seed(0)
     agent = RandomAgent(env.action_space)
 
@@ -43,9 +41,6 @@ if __name__ == "__main__":
             if done:
                 print("Episode done")
                 break
-            # Note there's no env.render() here. But the environment still can open window and
-            # render if asked by env.monitor: it calls env.render('rgb_array') to record video.
-            # Video is not recorded every episode, see capped_cubic_video_schedule for details.
         time.sleep(2)
-    # Close the env and write monitor result info to disk
+    # Close the env and write the rest of the recording to disk
     env.close()
\ No newline at end of file